@@ -0,0 +1,102 @@
+"""
+Carga no ciclo de vida completo: cada worker cria, lista, consulta e para simulações.
+
+Uso (com a API a correr em localhost:8000, de preferência com ORCHESTRATOR=fake
+para medir só a API e a BD):
+
+    python api_load.py --url http://localhost:8000 --concurrency 20 --duration 30
+
+Mostra por endpoint o número de pedidos, erros, pedidos/s e p50/p95/p99.
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from list_latency import CONFIG, percentile
+
+ENDPOINTS = ["POST /simulations", "GET /simulations", "GET /simulations/{id}", "DELETE /simulations/{id}"]
+
+class Results:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors: dict[str, int] = dict.fromkeys(ENDPOINTS, 0)
+        self.lock = threading.Lock()
+
+    def add(self, endpoint: str, latency: float, ok: bool):
+        with self.lock:
+            self.latencies[endpoint].append(latency)
+            if not ok:
+                self.errors[endpoint] += 1
+
+def request(url: str, method: str = "GET", body: dict | None = None, tenant: str | None = None) -> tuple[float, int, dict | list | None]:
+    data = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"}
+    if tenant:
+        headers["X-Tenant-ID"] = tenant
+    req = urllib.request.Request(url, data=data, method=method, headers=headers)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as response:
+            status, raw = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, raw = e.code, e.read()
+    except OSError:
+        return time.perf_counter() - start, 0, None
+    latency = time.perf_counter() - start
+    try:
+        return latency, status, json.loads(raw)
+    except ValueError:
+        return latency, status, None
+
+def worker(base_url: str, worker_id: int, gets_per_cycle: int, deadline: float, results: Results):
+    # Um tenant por worker: os limites por tenant não se tornam o gargalo do teste
+    tenant = f"loadtest-{worker_id}"
+    while time.perf_counter() < deadline:
+        latency, status, body = request(f"{base_url}/simulations", "POST", CONFIG, tenant)
+        results.add("POST /simulations", latency, status in (201, 202))
+        sim_id = body.get("simulation_id") if isinstance(body, dict) else None
+
+        latency, status, _ = request(f"{base_url}/simulations?limit=20")
+        results.add("GET /simulations", latency, status == 200)
+
+        if not sim_id:
+            continue
+        for _ in range(gets_per_cycle):
+            latency, status, _ = request(f"{base_url}/simulations/{sim_id}")
+            results.add("GET /simulations/{id}", latency, status == 200)
+
+        latency, status, _ = request(f"{base_url}/simulations/{sim_id}", "DELETE")
+        results.add("DELETE /simulations/{id}", latency, status == 200)
+
+def report(results: Results, elapsed: float):
+    print(f"{'endpoint':<26} {'n':>6} {'errors':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for endpoint in ENDPOINTS:
+        samples = results.latencies[endpoint]
+        print(f"{endpoint:<26} {len(samples):>6} {results.errors[endpoint]:>6} {len(samples) / elapsed:>8.1f} "
+              + " ".join(f"{percentile(samples, p) * 1000:7.1f}ms" for p in (50, 95, 99)))
+    total = sum(len(samples) for samples in results.latencies.values())
+    print(f"{'total':<26} {total:>6} {sum(results.errors.values()):>6} {total / elapsed:>8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="segundos")
+    parser.add_argument("--gets-per-cycle", type=int, default=3, help="GET /simulations/{id} por simulação criada")
+    args = parser.parse_args()
+
+    results = Results()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for worker_id in range(args.concurrency):
+            pool.submit(worker, args.url, worker_id, args.gets_per_cycle, deadline, results)
+    report(results, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
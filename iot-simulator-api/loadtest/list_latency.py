@@ -0,0 +1,90 @@
+"""
+Mede a latência de GET /simulations enquanto N criações estão em curso.
+
+Uso (com a API a correr em localhost:8000):
+
+    python list_latency.py --url http://localhost:8000 --creates 50
+
+Mostra p50/p99 de GET /simulations sem carga e durante as criações; com as
+chamadas Docker fora do event loop as duas linhas devem ficar semelhantes.
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+CONFIG = {
+    "BROKER_URL": "test.mosquitto.org",
+    "BROKER_PORT": 1883,
+    "TIME_INTERVAL": 10,
+    "TOPICS": [{
+        "TYPE": "single",
+        "PREFIX": "loadtest/sensor",
+        "DATA": [{"NAME": "temperatura", "TYPE": "float", "MIN_VALUE": 20, "MAX_VALUE": 35, "MAX_STEP": 1}]
+    }],
+    "duration_minutes": 1
+}
+
+def request(url: str, method: str = "GET", body: dict | None = None) -> float:
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as response:
+            response.read()
+    except urllib.error.HTTPError as e:
+        e.read()
+    return time.perf_counter() - start
+
+def percentile(samples: list[float], p: float) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[int(p) - 1]
+
+def sample_list_latency(base_url: str, stop: threading.Event, samples: list[float]):
+    while not stop.is_set():
+        samples.append(request(f"{base_url}/simulations"))
+        time.sleep(0.01)
+
+def report(label: str, samples: list[float]):
+    print(f"{label:<22} n={len(samples):<5} p50={percentile(samples, 50) * 1000:8.1f}ms "
+          f"p99={percentile(samples, 99) * 1000:8.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--creates", type=int, default=50)
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    # Baseline: só listagens
+    baseline: list[float] = []
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_list_latency, args=(args.url, stop, baseline))
+    sampler.start()
+    time.sleep(args.baseline_seconds)
+    stop.set()
+    sampler.join()
+
+    # Listagens com N criações em simultâneo
+    under_load: list[float] = []
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_list_latency, args=(args.url, stop, under_load))
+    sampler.start()
+    with ThreadPoolExecutor(max_workers=args.creates) as pool:
+        create_latencies = list(pool.map(
+            lambda _: request(f"{args.url}/simulations", "POST", CONFIG), range(args.creates)
+        ))
+    stop.set()
+    sampler.join()
+
+    report("GET /simulations idle", baseline)
+    report(f"GET /simulations +{args.creates}", under_load)
+    report("POST /simulations", create_latencies)
+
+if __name__ == "__main__":
+    main()
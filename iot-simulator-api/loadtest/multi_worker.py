@@ -0,0 +1,181 @@
+"""
+Verifica a API com vários workers sobre a mesma base de dados SQLite.
+
+Arranca N processos uvicorn (ORCHESTRATOR=fake, portas seguidas a partir de
+--base-port) numa pasta temporária e, sem mais nada a correr:
+
+    python multi_worker.py --workers 2 --max-running 3 --creates 8
+
+1. cria --creates simulações em paralelo, espalhadas pelos workers: só
+   --max-running arrancam, as outras ficam em fila, e todos os workers mostram
+   a mesma admissão em /stats;
+2. para as que correm através de outro worker que não o que as criou: a fila
+   anda, cada simulação da fila é lançada por um único worker e nenhum fica
+   com telemetria de simulações que já terminaram;
+3. reinicia todos os workers com mais capacidade: a fila que sobrou arranca
+   uma só vez, apesar de todos a lançarem no arranque.
+
+Termina com código 1 se alguma verificação falhar.
+"""
+
+import argparse
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api_load import request
+from list_latency import CONFIG
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+STARTED_QUEUED = re.compile(r"\[ADMISSION\] Started queued simulation (\w+)")
+
+class Workers:
+    def __init__(self, count: int, base_port: int, directory: str):
+        self.urls = [f"http://127.0.0.1:{base_port + i}" for i in range(count)]
+        self.directory = directory
+        self.processes: list[subprocess.Popen] = []
+        self.log_paths: list[str] = []
+        self.generation = 0
+
+    def start(self, max_running: int):
+        env = dict(
+            os.environ,
+            ORCHESTRATOR="fake",
+            DATABASE_URL=f"sqlite:///{self.directory}/simulations.db",
+            SIMULATOR_CONFIG_DIR=f"{self.directory}/configs",
+            MAX_RUNNING_SIMULATIONS=str(max_running),
+            # Todas as simulações são do tenant default: o limite dele não pode ser o mais baixo
+            TENANT_MAX_RUNNING_SIMULATIONS=str(max_running),
+            WORKER_SYNC_SECONDS="1",
+            LEASE_HEARTBEAT_SECONDS="1",
+            PYTHONUNBUFFERED="1"
+        )
+        self.generation += 1
+        for url in self.urls:
+            port = url.rsplit(":", 1)[1]
+            log_path = os.path.join(self.directory, f"worker-{port}-{self.generation}.log")
+            self.log_paths.append(log_path)
+            self.processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", port],
+                cwd=SRC_DIR, env=env, stdout=open(log_path, "w"), stderr=subprocess.STDOUT
+            ))
+        for url in self.urls:
+            wait_for(lambda: request(f"{url}/health")[1] == 200, 30, f"{url} did not start")
+
+    def stop(self):
+        for process in self.processes:
+            process.send_signal(signal.SIGINT)
+        for process in self.processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes.clear()
+
+    def started_queued(self) -> list[str]:
+        """simulation_id de cada lançamento de uma simulação da fila, em todos os logs."""
+        started = []
+        for log_path in self.log_paths:
+            with open(log_path) as log:
+                started += STARTED_QUEUED.findall(log.read())
+        return started
+
+def wait_for(condition, timeout: float, message: str):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError(message)
+        time.sleep(0.2)
+
+failures = 0
+
+def check(label: str, ok: bool, detail: str = ""):
+    global failures
+    print(f"{'ok' if ok else 'FAIL':<5} {label}" + (f" ({detail})" if detail else ""))
+    failures += not ok
+
+def admission_stats(url: str) -> dict:
+    return request(f"{url}/stats")[2]["admission"]
+
+def create(url: str) -> tuple[int, str]:
+    _, status, body = request(f"{url}/simulations", "POST", CONFIG)
+    return status, body["simulation_id"]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--base-port", type=int, default=8101)
+    parser.add_argument("--max-running", type=int, default=3)
+    parser.add_argument("--creates", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        workers = Workers(args.workers, args.base_port, directory)
+        try:
+            workers.start(args.max_running)
+            run_checks(workers, args)
+        finally:
+            workers.stop()
+    sys.exit(1 if failures else 0)
+
+def run_checks(workers: Workers, args: argparse.Namespace):
+    urls = workers.urls
+    queued_count = args.creates - args.max_running
+
+    # 1. Criações em paralelo em todos os workers: a admissão é uma só
+    with ThreadPoolExecutor(max_workers=args.creates) as pool:
+        created = list(pool.map(lambda i: (i % len(urls), *create(urls[i % len(urls)])), range(args.creates)))
+    running = [(worker, sim_id) for worker, status, sim_id in created if status == 201]
+    queued = [sim_id for _, status, sim_id in created if status == 202]
+    check("creates across workers respect MAX_RUNNING_SIMULATIONS",
+          len(running) == args.max_running and len(queued) == queued_count,
+          f"{len(running)} running, {len(queued)} queued")
+    stats = [admission_stats(url) for url in urls]
+    check("every worker reports the same admission state",
+          all((s["running"], s["queued"]) == (args.max_running, queued_count) for s in stats),
+          ", ".join(f"{s['running']}/{s['queued']}" for s in stats))
+
+    # 2. Parar pelo outro worker: a capacidade volta e a fila anda
+    for worker, sim_id in running:
+        request(f"{urls[(worker + 1) % len(urls)]}/simulations/{sim_id}", "DELETE")
+    remaining = max(queued_count - args.max_running, 0)
+    try:
+        wait_for(lambda: all(admission_stats(url)["queued"] == remaining for url in urls), 15, "queue did not move")
+        wait_for(lambda: len(workers.started_queued()) == queued_count - remaining, 15, "queued launches missing")
+    except TimeoutError as e:
+        print(e)
+    started = workers.started_queued()
+    check("stops on another worker dispatch the queue",
+          len(started) == queued_count - remaining, f"{len(started)} of {queued_count - remaining} started")
+    check("each queued simulation is launched by one worker", len(started) == len(set(started)))
+    running_now = min(queued_count, args.max_running)
+    try:
+        wait_for(lambda: all(request(f"{url}/stats")[2]["telemetry"]["simulations"] == running_now for url in urls),
+                 10, "telemetry not in sync")
+    except TimeoutError as e:
+        print(e)
+    telemetry = [request(f"{url}/stats")[2]["telemetry"]["simulations"] for url in urls]
+    check("every worker taps only the running simulations", all(n == running_now for n in telemetry),
+          f"{telemetry} for {running_now} running")
+
+    # 3. Reiniciar todos com mais capacidade: a fila restante arranca uma vez
+    if not remaining:
+        return
+    workers.stop()
+    workers.start(args.max_running + remaining)
+    try:
+        wait_for(lambda: len(workers.started_queued()) >= queued_count, 15, "queue not dispatched after restart")
+    except TimeoutError as e:
+        print(e)
+    started = workers.started_queued()
+    check("restarted workers dispatch the queue once",
+          len(started) == queued_count and len(set(started)) == queued_count,
+          f"{len(started)} launches of {len(set(started))} simulations")
+
+if __name__ == "__main__":
+    main()
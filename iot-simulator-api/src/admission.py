@@ -0,0 +1,148 @@
+from typing import NamedTuple
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import Simulation, lock_admission, set_simulation_status
+
+def count_topic_instances(topic: dict) -> int:
+    """Número de tópicos MQTT gerados por uma entrada de TOPICS."""
+    if topic["TYPE"] == "multiple":
+        return max((topic["RANGE_END"] or 0) - (topic["RANGE_START"] or 0) + 1, 0)
+    if topic["TYPE"] == "list":
+        return len(topic["LIST"] or [])
+    return 1
+
+def estimate_message_rate(config: dict) -> float:
+    """Mensagens por segundo que a config vai publicar: uma mensagem por tópico a cada TIME_INTERVAL."""
+    default_interval = config.get("TIME_INTERVAL") or 10
+    rate = 0.0
+    for topic in config["TOPICS"]:
+        interval = topic.get("TIME_INTERVAL") or default_interval
+        rate += count_topic_instances(topic) / max(interval, 0.1)
+    return rate
+
+class AdmissionLimits(NamedTuple):
+    max_running: int = 50
+    max_message_rate: float = 2000.0
+    tenant_max_running: int = 10
+    tenant_max_message_rate: float = 500.0
+    max_queued: int = 200
+
+class Reservation(NamedTuple):
+    tenant_id: str
+    message_rate: float
+
+class AdmissionRejected(Exception):
+    """A simulação nunca cabe nos limites."""
+
+class QueueFull(AdmissionRejected):
+    """Não há capacidade e a fila de espera está cheia."""
+
+# Status que ocupam capacidade: um lançamento a meio já conta
+ACTIVE_STATUSES = ["starting", "running"]
+
+class AdmissionState:
+    """Ocupação lida da BD: simulações ativas (total e por tenant), taxa estimada de mensagens e tamanho da fila."""
+
+    def __init__(self, limits: AdmissionLimits, tenants: list[tuple[str, int, float]], queued: int):
+        self.limits = limits
+        self.running_count = 0
+        self.message_rate = 0.0
+        self.tenant_running: dict[str, int] = {}
+        self.tenant_message_rate: dict[str, float] = {}
+        for tenant_id, running, message_rate in tenants:
+            self.running_count += running
+            self.message_rate += message_rate
+            self.tenant_running[tenant_id] = running
+            self.tenant_message_rate[tenant_id] = message_rate
+        self.queued = queued
+
+    def fits(self, reservation: Reservation) -> bool:
+        tenant = reservation.tenant_id
+        return (
+            self.running_count + 1 <= self.limits.max_running
+            and self.message_rate + reservation.message_rate <= self.limits.max_message_rate
+            and self.tenant_running.get(tenant, 0) + 1 <= self.limits.tenant_max_running
+            and self.tenant_message_rate.get(tenant, 0.0) + reservation.message_rate <= self.limits.tenant_max_message_rate
+        )
+
+    def activate(self, reservation: Reservation):
+        tenant = reservation.tenant_id
+        self.running_count += 1
+        self.message_rate += reservation.message_rate
+        self.tenant_running[tenant] = self.tenant_running.get(tenant, 0) + 1
+        self.tenant_message_rate[tenant] = self.tenant_message_rate.get(tenant, 0.0) + reservation.message_rate
+
+    def reserve(self, tenant_id: str, message_rate: float) -> int:
+        """Reserva capacidade. Devolve 0 se pode arrancar já, ou a posição (1..n) na fila.
+
+        Quem chama insere a simulação como starting ou queued na transação em que o estado foi lido.
+        """
+        if message_rate > min(self.limits.max_message_rate, self.limits.tenant_max_message_rate):
+            raise AdmissionRejected(f"Estimated message rate {message_rate:.1f} msg/s exceeds the limit")
+        reservation = Reservation(tenant_id, message_rate)
+        if self.fits(reservation):
+            self.activate(reservation)
+            return 0
+        if self.queued >= self.limits.max_queued:
+            raise QueueFull("Simulation queue is full")
+        self.queued += 1
+        return self.queued
+
+class AdmissionController:
+    """Limites globais e por tenant de simulações ativas e taxa estimada de mensagens, com fila FIFO.
+
+    O estado é o da BD, partilhado por todos os workers: as simulações starting/running ocupam capacidade e as
+    queued são a fila. Cada decisão lê-o depois de lock_admission, por isso dois workers nunca dão o mesmo lugar.
+    """
+
+    def __init__(self, limits: AdmissionLimits = AdmissionLimits()):
+        self.limits = limits
+
+    async def _state(self, db: AsyncSession) -> AdmissionState:
+        tenants = await db.execute(
+            select(Simulation.tenant_id, func.count(Simulation.id), func.coalesce(func.sum(Simulation.estimated_rate), 0.0))
+            .where(Simulation.status.in_(ACTIVE_STATUSES))
+            .group_by(Simulation.tenant_id)
+        )
+        queued = await db.scalar(select(func.count(Simulation.id)).where(Simulation.status == "queued"))
+        return AdmissionState(self.limits, tenants.all(), queued)
+
+    async def lock(self, db: AsyncSession) -> AdmissionState:
+        """Tranca a admissão até ao commit/rollback e devolve a ocupação atual. Tem de ser a primeira escrita da transação."""
+        await lock_admission(db)
+        return await self._state(db)
+
+    async def dispatch(self, db: AsyncSession) -> list[Simulation]:
+        """Passa a starting as simulações da fila que cabem. Quem chama faz commit e lança-as."""
+        state = await self.lock(db)
+        admitted = []
+        if not state.queued or state.running_count >= self.limits.max_running:
+            return admitted
+        queued = await db.scalars(
+            select(Simulation).where(Simulation.status == "queued").order_by(Simulation.created_at, Simulation.id)
+        )
+        # Por ordem de chegada, mas uma entrada bloqueada pelo limite do seu tenant não bloqueia os outros
+        for simulation in queued.all():
+            if state.running_count >= self.limits.max_running:
+                break
+            reservation = Reservation(simulation.tenant_id, simulation.estimated_rate)
+            if state.fits(reservation) and await set_simulation_status(db, simulation, "starting"):
+                state.activate(reservation)
+                admitted.append(simulation)
+        return admitted
+
+    async def position(self, db: AsyncSession, simulation: Simulation) -> int:
+        ahead = await db.scalar(select(func.count(Simulation.id)).where(
+            Simulation.status == "queued",
+            tuple_(Simulation.created_at, Simulation.id) < (simulation.created_at, simulation.id)
+        ))
+        return ahead + 1
+
+    async def stats(self, db: AsyncSession) -> dict:
+        state = await self._state(db)
+        return {
+            "running": state.running_count,
+            "queued": state.queued,
+            "message_rate": round(state.message_rate, 3),
+            "limits": self.limits._asdict()
+        }
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import Simulation, StoredConfig
+
+# Status em que uma simulação ainda precisa do ficheiro de config montado
+LIVE_STATUSES = ["queued", "starting", "running"]
+
+def canonical_json(config: dict) -> str:
+    return json.dumps(config, sort_keys=True, separators=(",", ":"))
+
+class ConfigStore:
+    """Configs do simulador guardadas uma única vez, pelo hash do JSON canónico, com contagem de referências."""
+
+    def __init__(self, directory: str, gc_grace_period: timedelta = timedelta(minutes=10)):
+        # Caminho absoluto: é usado como origem do bind mount do container
+        self.directory = os.path.abspath(directory)
+        self.gc_grace_period = gc_grace_period
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, config_hash: str) -> str:
+        return os.path.join(self.directory, f"{config_hash}.json")
+
+    async def acquire(self, db: AsyncSession, config: dict) -> str:
+        """Guarda a config (se ainda não existir) e soma uma referência. Devolve o hash."""
+        config_json = canonical_json(config)
+        config_hash = hashlib.sha256(config_json.encode()).hexdigest()
+
+        result = await db.execute(
+            update(StoredConfig).where(StoredConfig.config_hash == config_hash).values(
+                ref_count=StoredConfig.ref_count + 1,
+                released_at=datetime.utcnow()
+            ).execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            db.add(StoredConfig(config_hash=config_hash, config_json=config_json, ref_count=1))
+            await db.flush()
+
+        # Configs repetidas (templates) reutilizam o ficheiro já escrito, mas com o mtime renovado: um GC que já
+        # calculou as configs em uso antes desta referência não o apaga dentro do período de graça
+        path = self.path_for(config_hash)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(config_json)
+            os.replace(tmp_path, path)
+        return config_hash
+
+    async def release(self, db: AsyncSession, config_hash: str):
+        """Retira uma referência; o ficheiro só é apagado pelo garbage collector, que também acerta as contagens."""
+        await db.execute(
+            update(StoredConfig).where(StoredConfig.config_hash == config_hash).values(
+                ref_count=StoredConfig.ref_count - 1,
+                released_at=datetime.utcnow()
+            ).execution_options(synchronize_session=False)
+        )
+
+    async def get_config(self, db: AsyncSession, config_hash: str) -> dict | None:
+        config_json = await db.scalar(select(StoredConfig.config_json).where(StoredConfig.config_hash == config_hash))
+        return json.loads(config_json) if config_json else None
+
+    async def collect_garbage(self, db: AsyncSession) -> int:
+        """Acerta as referências a partir das simulações vivas e apaga os ficheiros sem uso há mais que o período de graça.
+
+        Uma config com referências mexidas no período de graça pode ter um lançamento a meio (acquire feito, linha da
+        simulação ainda por inserir): não é acertada nem apagada. As linhas ficam na BD (o JSON já é único por hash)
+        para os detalhes de simulações antigas.
+        """
+        result = await db.execute(
+            select(Simulation.config_hash, func.count(Simulation.id)).where(
+                Simulation.status.in_(LIVE_STATUSES),
+                Simulation.config_hash.isnot(None)
+            ).group_by(Simulation.config_hash)
+        )
+        live_counts = dict(result.all())
+        cutoff = datetime.utcnow() - self.gc_grace_period
+        in_use = set()
+        for stored in await db.scalars(select(StoredConfig)):
+            if (stored.released_at or stored.created_at) > cutoff:
+                in_use.add(stored.config_hash)
+                continue
+            stored.ref_count = live_counts.get(stored.config_hash, 0)
+            if stored.ref_count > 0:
+                in_use.add(stored.config_hash)
+        await db.commit()
+        return await asyncio.to_thread(self._remove_unused_files, in_use)
+
+    def _remove_unused_files(self, in_use: set[str]) -> int:
+        # Inclui ficheiros sem linha na BD (ex.: crash entre escrever o ficheiro e o commit)
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.split(".", 1)[0] in in_use:
+                continue
+            # O mtime é lido mesmo antes de apagar: um acquire depois do commit do GC renova-o
+            try:
+                if os.path.getmtime(path) > time.time() - self.gc_grace_period.total_seconds():
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                # Já apagado pelo GC de outro worker
+                continue
+            removed += 1
+        return removed
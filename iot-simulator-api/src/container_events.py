@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from datetime import datetime
+from typing import Awaitable, Callable, Iterator
+
+# Marca o fim do stream de eventos (desligado ou erro) na fila do event loop
+_END = object()
+
+class ContainerEventListener:
+    """Segue os eventos 'die' do Docker dos containers com a label simulation_id.
+
+    As fontes são injetadas (open_events bloqueante, list_running async) para poderem ser trocadas
+    por uma fonte falsa. Em cada (re)ligação faz primeiro uma listagem completa para acertar o que
+    mudou enquanto o stream esteve em baixo.
+    """
+
+    def __init__(
+        self,
+        open_events: Callable[[], Iterator[dict]],
+        list_running: Callable[[], Awaitable[set[str]]],
+        on_exit: Callable[[str, int], Awaitable[None]],
+        on_resync: Callable[[set[str], datetime], Awaitable[None]],
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 30.0
+    ):
+        self.open_events = open_events
+        self.list_running = list_running
+        self.on_exit = on_exit
+        self.on_resync = on_resync
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.is_connected = False
+        self._is_stopped = False
+        self._stream = None
+
+    def _pump(self, stream: Iterator[dict], queue: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        # Bloqueante: corre numa thread própria durante toda a ligação
+        try:
+            for event in stream:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+        except Exception as e:
+            if not self._is_stopped:
+                print(f"[EVENTS] Event stream error: {e}")
+        finally:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, _END)
+            except RuntimeError:
+                pass  # Event loop já fechado
+
+    async def _handle(self, event: dict):
+        attributes = event.get("Actor", {}).get("Attributes", {})
+        sim_id = attributes.get("simulation_id")
+        if not sim_id:
+            return
+        try:
+            exit_code = int(attributes.get("exitCode", 0))
+        except ValueError:
+            exit_code = -1
+        await self.on_exit(sim_id, exit_code)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        delay = self.retry_delay
+        # Pode voltar a correr depois de stop() (o lease dos jobs de fundo mudou de worker e voltou)
+        self._is_stopped = False
+        while not self._is_stopped:
+            queue: asyncio.Queue = asyncio.Queue()
+            try:
+                # Abrir o stream antes da listagem: um evento entre as duas não se perde
+                self._stream = await asyncio.to_thread(self.open_events)
+                threading.Thread(
+                    target=self._pump, args=(self._stream, queue, loop), daemon=True, name="docker-events"
+                ).start()
+
+                listed_at = datetime.utcnow()
+                await self.on_resync(await self.list_running(), listed_at)
+                self.is_connected = True
+                delay = self.retry_delay
+
+                while (event := await queue.get()) is not _END:
+                    try:
+                        await self._handle(event)
+                    except Exception as e:
+                        print(f"[EVENTS] Error handling event: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[EVENTS] Listener error: {e}")
+            finally:
+                self.is_connected = False
+                self._close_stream()
+
+            if not self._is_stopped:
+                print(f"[EVENTS] Reconnecting in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        if stream is not None and hasattr(stream, "close"):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def stop(self):
+        self._is_stopped = True
+        self._close_stream()
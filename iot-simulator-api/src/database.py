@@ -1,17 +1,63 @@
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Text, Boolean
+from sqlalchemy import Column, String, Integer, Float, DateTime, Text, Boolean, Index, event, func, inspect, select, update, delete
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import datetime, timedelta
+import asyncio
+import os
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./simulations.db"
+def _async_database_url(url: str) -> str:
+    """Aceita URLs sem driver (sqlite://, postgresql://) e escolhe o driver async."""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SQLALCHEMY_DATABASE_URL = _async_database_url(os.environ.get("DATABASE_URL", "sqlite:///./simulations.db"))
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+if IS_SQLITE:
+    # Com WAL os leitores não esperam pelo escritor, mas continua a haver um só escritor: pool pequeno.
+    # O aiosqlite usa NullPool por omissão; com pool as ligações (e a cache de páginas) são reutilizadas
+    engine = create_async_engine(
+        SQLALCHEMY_DATABASE_URL,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=int(os.environ.get("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", "5"))
+    )
+    
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Em WAL, NORMAL só faz fsync nos checkpoints: seguro contra corrupção, muito menos I/O por commit
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute("PRAGMA cache_size=-16000")  # 16 MB
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+else:
+    engine = create_async_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_size=int(os.environ.get("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", "20")),
+        pool_pre_ping=True,
+        pool_recycle=1800
+    )
+
+# expire_on_commit=False: depois do commit os atributos continuam acessíveis sem I/O implícito
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+SIMULATION_STATUSES = ["queued", "starting", "running", "stopped", "failed", "expired"]
+
 class Simulation(Base):
     __tablename__ = "simulations"
     
@@ -19,23 +65,249 @@ class Simulation(Base):
     simulation_id = Column(String, unique=True, index=True, nullable=False)
     container_id = Column(String, nullable=True)
     config_path = Column(String, nullable=False)
-    config_json = Column(Text, nullable=False)  # JSON como texto
-    status = Column(String, default="running")  # running, stopped, failed, expired
+    config_hash = Column(String, nullable=True, index=True)  # Config em simulation_configs
+    config_json = Column(Text, nullable=True)  # JSON como texto (só simulações anteriores ao config store)
+    status = Column(String, default="running")  # queued, starting, running, stopped, failed, expired
     created_at = Column(DateTime, default=datetime.utcnow)
     stopped_at = Column(DateTime, nullable=True)
     expires_at = Column(DateTime, nullable=False)
     duration_minutes = Column(Integer, default=30)
+    tenant_id = Column(String, nullable=False, default="default", server_default="default")
+    estimated_rate = Column(Float, nullable=False, default=0.0, server_default="0")  # mensagens/s estimadas pela config
+    
+    __table_args__ = (
+        # Usado pelo scheduler de expiração: simulações running ordenadas por expires_at
+        Index("ix_simulations_status_expires_at", "status", "expires_at"),
+        # GET /simulations: filtro por status ordenado por created_at, e sem filtro
+        Index("ix_simulations_status_created_at", "status", "created_at"),
+        Index("ix_simulations_created_at", "created_at"),
+    )
     
     def __repr__(self):
         return f"<Simulation {self.simulation_id} - {self.status}>"
 
-# Criar tabelas
-Base.metadata.create_all(bind=engine)
+class StoredConfig(Base):
+    """Config do simulador guardada uma vez por hash do JSON canónico, partilhada entre simulações."""
+    __tablename__ = "simulation_configs"
+    
+    config_hash = Column(String, primary_key=True)
+    config_json = Column(Text, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Última mudança de referências (acquire ou release): o GC não mexe em configs tocadas no período de graça
+    released_at = Column(DateTime, nullable=True)
 
-# Dependency para obter sessão
-def get_db():
-    db = SessionLocal()
+class SimulationStatusCount(Base):
+    """Contadores por status, mantidos na mesma transação que as mudanças de status."""
+    __tablename__ = "simulation_status_counts"
+    
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class JobLease(Base):
+    """Lease de um job de fundo partilhado por vários workers/réplicas da API: só o holder o corre."""
+    __tablename__ = "job_leases"
+    
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    acquired_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class AdmissionLock(Base):
+    """Linha única trancada por cada decisão de admissão: serializa as reservas e a fila de todos os workers."""
+    __tablename__ = "admission_lock"
+    
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class UsageMinute(Base):
+    """Uso medido pelo simulador (mensagens e bytes publicados), agregado por simulação e minuto."""
+    __tablename__ = "usage_minutes"
+    
+    simulation_id = Column(String, primary_key=True)
+    minute = Column(DateTime, primary_key=True)  # Início do minuto (UTC)
+    tenant_id = Column(String, nullable=False)
+    messages = Column(Integer, nullable=False, default=0)
+    bytes = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # Faturação: uso de um tenant num intervalo de tempo
+        Index("ix_usage_minutes_tenant_minute", "tenant_id", "minute"),
+    )
+
+class UsageOffset(Base):
+    """Até onde o ficheiro de uso de cada simulação já foi agregado (atualizado na mesma transação)."""
+    __tablename__ = "usage_offsets"
+    
+    simulation_id = Column(String, primary_key=True)
+    offset = Column(Integer, nullable=False, default=0)
+
+def _migrate_simulations_table(conn):
+    """Recria a tabela simulations de bases de dados antigas (SQLite não altera colunas existentes)."""
+    inspector = inspect(conn)
+    if not inspector.has_table("simulations"):
+        return
+    columns = {column["name"]: column for column in inspector.get_columns("simulations")}
+    if set(Simulation.__table__.columns.keys()) <= set(columns) and columns["config_json"]["nullable"]:
+        return
+    print("[DATABASE] Migrating simulations table")
+    copied = ", ".join(name for name in columns if name in Simulation.__table__.columns)
+    for index in inspector.get_indexes("simulations"):
+        conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{index["name"]}"')
+    conn.exec_driver_sql("ALTER TABLE simulations RENAME TO simulations_old")
+    Simulation.__table__.create(conn)
+    conn.exec_driver_sql(f"INSERT INTO simulations ({copied}) SELECT {copied} FROM simulations_old")
+    conn.exec_driver_sql("DROP TABLE simulations_old")
+
+def _create_schema(conn):
+    if conn.dialect.name == "sqlite":
+        _migrate_simulations_table(conn)
+    
+    # Criar tabelas
+    Base.metadata.create_all(bind=conn)
+    
+    # Criar índices novos em bases de dados já existentes
+    for index in Simulation.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+async def _increment_status_count(db: AsyncSession, status: str, delta: int):
+    result = await db.execute(
+        update(SimulationStatusCount).where(
+            SimulationStatusCount.status == status
+        ).values(count=SimulationStatusCount.count + delta).execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        db.add(SimulationStatusCount(status=status, count=delta))
+        await db.flush()
+
+async def add_simulation(db: AsyncSession, simulation: Simulation):
+    """Adiciona a simulação e atualiza os contadores (o commit fica a cargo de quem chama)."""
+    db.add(simulation)
+    await _increment_status_count(db, simulation.status, 1)
+
+async def set_simulation_status(db: AsyncSession, simulation: Simulation, status: str) -> bool:
+    """Muda o status e atualiza os contadores (o commit fica a cargo de quem chama).
+
+    A mudança é condicional ao status atual na BD: se outro caminho (paragem, expiração, eventos do
+    Docker) já o mudou, devolve False e não mexe nos contadores.
+    """
+    if simulation.status == status:
+        return False
+    await db.flush()
+    result = await db.execute(
+        update(Simulation).where(
+            Simulation.id == simulation.id,
+            Simulation.status == simulation.status
+        ).values(status=status).execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        await db.refresh(simulation)
+        return False
+    await _increment_status_count(db, simulation.status, -1)
+    await _increment_status_count(db, status, 1)
+    set_committed_value(simulation, "status", status)
+    return True
+
+async def get_status_counts(db: AsyncSession) -> dict[str, int]:
+    result = await db.execute(select(SimulationStatusCount.status, SimulationStatusCount.count))
+    return {row.status: row.count for row in result}
+
+async def rebuild_status_counts(db: AsyncSession):
+    """Recalcula os contadores a partir da tabela simulations com uma única query agrupada."""
+    counts = dict.fromkeys(SIMULATION_STATUSES, 0)
+    result = await db.execute(
+        select(Simulation.status, func.count(Simulation.id)).group_by(Simulation.status)
+    )
+    counts.update(result.all())
+    await db.execute(delete(SimulationStatusCount))
+    db.add_all(SimulationStatusCount(status=status, count=count) for status, count in counts.items())
+    await db.commit()
+
+async def init_db():
+    """Cria/migra o schema e inicializa os contadores. Chamado no startup da API."""
+    for attempt in range(3):
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(_create_schema)
+            break
+        except DBAPIError:
+            # Vários workers a criar o schema ao mesmo tempo: à segunda as tabelas já existem
+            if attempt == 2:
+                raise
+            await asyncio.sleep(0.5)
+    
+    # Inicializar contadores (bases de dados criadas antes desta tabela ou de um status novo) e o lock de admissão
+    async with SessionLocal() as db:
+        if set(await get_status_counts(db)) < set(SIMULATION_STATUSES):
+            await rebuild_status_counts(db)
+        if not await db.get(AdmissionLock, "admission"):
+            db.add(AdmissionLock(name="admission"))
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Outro worker criou a linha ao mesmo tempo
+                await db.rollback()
+
+async def lock_admission(db: AsyncSession):
+    """Tranca a admissão até ao fim da transação (commit/rollback).
+
+    Tem de ser a primeira escrita da transação: em SQLite é ela que toma o lock de escrita (esperando pelo
+    busy_timeout); em Postgres tranca a linha e os outros workers esperam no mesmo UPDATE.
+    """
+    await db.execute(
+        update(AdmissionLock).where(AdmissionLock.name == "admission").values(version=AdmissionLock.version + 1)
+    )
+
+async def acquire_lease(db: AsyncSession, name: str, holder: str, ttl_seconds: float) -> bool:
+    """Renova o lease se já é nosso, ou toma-o se expirou. Faz commit; True se ficámos com ele."""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    renewed = await db.execute(
+        update(JobLease).where(JobLease.name == name, JobLease.holder == holder).values(expires_at=expires_at)
+    )
+    if not renewed.rowcount:
+        # Expirado: o UPDATE condicional garante que só um dos workers o toma
+        taken = await db.execute(
+            update(JobLease).where(JobLease.name == name, JobLease.expires_at < now).values(
+                holder=holder, acquired_at=now, expires_at=expires_at
+            )
+        )
+        if not taken.rowcount:
+            if await db.scalar(select(JobLease.name).where(JobLease.name == name)):
+                await db.rollback()
+                return False
+            db.add(JobLease(name=name, holder=holder, acquired_at=now, expires_at=expires_at))
     try:
+        await db.commit()
+    except IntegrityError:
+        # Outro worker criou a linha ao mesmo tempo
+        await db.rollback()
+        return False
+    return True
+
+async def release_lease(db: AsyncSession, name: str, holder: str):
+    """Larga o lease (shutdown): outro worker pode tomá-lo logo, sem esperar pela expiração."""
+    await db.execute(delete(JobLease).where(JobLease.name == name, JobLease.holder == holder))
+    await db.commit()
+
+async def add_usage(db: AsyncSession, simulation_id: str, tenant_id: str, minutes: dict[datetime, tuple[int, int]]):
+    """Soma mensagens/bytes aos minutos já agregados (o commit fica a cargo de quem chama)."""
+    if not minutes:
+        return
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(UsageMinute).values([
+        {"simulation_id": simulation_id, "minute": minute, "tenant_id": tenant_id, "messages": messages, "bytes": size}
+        for minute, (messages, size) in minutes.items()
+    ])
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[UsageMinute.simulation_id, UsageMinute.minute],
+        set_={
+            "messages": UsageMinute.messages + statement.excluded.messages,
+            "bytes": UsageMinute.bytes + statement.excluded.bytes
+        }
+    ))
+
+# Dependency para obter sessão
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
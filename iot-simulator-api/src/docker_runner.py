@@ -0,0 +1,77 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+# Timeout (segundos) e máximo de chamadas em simultâneo por tipo de operação
+DEFAULT_TIMEOUTS = {"run": 60.0, "get": 10.0, "stop": 20.0, "logs": 10.0, "ping": 5.0}
+DEFAULT_CONCURRENCY = {"run": 8, "get": 16, "stop": 8, "logs": 8, "ping": 2}
+
+class DockerTimeoutError(Exception):
+    """Uma operação Docker não terminou dentro do timeout."""
+
+    def __init__(self, operation: str, timeout: float):
+        super().__init__(f"Docker operation '{operation}' timed out after {timeout:.0f}s")
+        self.operation = operation
+        self.timeout = timeout
+
+class DockerRunner:
+    """Corre as chamadas bloqueantes do Docker SDK fora do event loop, num executor limitado."""
+
+    def __init__(
+        self,
+        timeouts: dict[str, float] = DEFAULT_TIMEOUTS,
+        concurrency: dict[str, int] = DEFAULT_CONCURRENCY,
+    ):
+        self.timeouts = dict(timeouts)
+        self.concurrency = dict(concurrency)
+        # Uma thread por slot: um timeout não cancela a thread, por isso o executor nunca cresce além disto
+        self._executor = ThreadPoolExecutor(
+            max_workers=sum(self.concurrency.values()), thread_name_prefix="docker"
+        )
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, operation: str) -> asyncio.Semaphore:
+        if operation not in self._semaphores:
+            self._semaphores[operation] = asyncio.Semaphore(self.concurrency.get(operation, 4))
+        return self._semaphores[operation]
+
+    async def run(
+        self,
+        operation: str,
+        func: Callable[..., Any],
+        *args,
+        on_abandoned: Callable[[Any], None] | None = None,
+        **kwargs
+    ) -> Any:
+        """Corre func no executor. Depois de um timeout a chamada continua na thread; on_abandoned recebe o
+        resultado se ela ainda terminar com sucesso (ex.: remover o container que o run acabou por criar)."""
+        timeout = self.timeouts.get(operation, 30.0)
+        async with self._semaphore(operation):
+            future = self._executor.submit(func, *args, **kwargs)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+            except asyncio.TimeoutError:
+                if on_abandoned:
+                    future.add_done_callback(lambda done: self._abandoned(operation, done, on_abandoned))
+                raise DockerTimeoutError(operation, timeout)
+
+    def _abandoned(self, operation: str, future: Future, on_abandoned: Callable[[Any], None]):
+        # Ainda na fila quando deu timeout (cancelada) ou falhou: não há nada a desfazer
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            # Noutra thread: este callback pode correr no event loop se a chamada terminou entretanto
+            self._executor.submit(self._call_abandoned, operation, on_abandoned, future.result())
+        except RuntimeError:
+            # Executor já desligado (shutdown da API)
+            pass
+
+    @staticmethod
+    def _call_abandoned(operation: str, on_abandoned: Callable[[Any], None], result: Any):
+        try:
+            on_abandoned(result)
+        except Exception as e:
+            print(f"[DOCKER] Cleanup after '{operation}' timed out failed: {e}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable
+from database import SessionLocal, acquire_lease, release_lease
+
+class LeaseKeeper:
+    """Mantém um lease da BD com heartbeats e corre callbacks quando o ganha ou perde.
+
+    Todos os workers correm um; o que tem o lease corre os jobs de fundo. Se o holder morre, o lease
+    expira ao fim de ttl segundos e outro worker toma-o no heartbeat seguinte. Um holder que não
+    consegue renovar (BD em baixo) desiste antes de o lease expirar, para nunca haver dois ao mesmo tempo.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        on_acquired: Callable[[], Awaitable[None]],
+        on_lost: Callable[[], Awaitable[None]],
+        ttl: float = 15.0,
+        heartbeat_interval: float = 5.0
+    ):
+        if heartbeat_interval >= ttl:
+            raise ValueError("heartbeat_interval must be shorter than ttl")
+        self.name = name
+        self.holder = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.on_acquired = on_acquired
+        self.on_lost = on_lost
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.is_held = False
+        # Até quando (relógio local) o lease é de certeza nosso, com uma margem de um heartbeat
+        self._valid_until = 0.0
+
+    async def _heartbeat(self) -> bool:
+        started = time.monotonic()
+        try:
+            async with SessionLocal() as db:
+                held = await acquire_lease(db, self.name, self.holder, self.ttl)
+        except Exception as e:
+            print(f"[LEASE] Heartbeat for '{self.name}' failed: {e}")
+            return self.is_held and time.monotonic() < self._valid_until
+        if held:
+            self._valid_until = started + self.ttl - self.heartbeat_interval
+        return held
+
+    async def run(self):
+        try:
+            while True:
+                held = await self._heartbeat()
+                if held and not self.is_held:
+                    self.is_held = True
+                    print(f"[LEASE] {self.holder} acquired '{self.name}'")
+                    await self.on_acquired()
+                elif not held and self.is_held:
+                    self.is_held = False
+                    print(f"[LEASE] {self.holder} lost '{self.name}'")
+                    await self.on_lost()
+                await asyncio.sleep(self.heartbeat_interval)
+        finally:
+            if self.is_held:
+                self.is_held = False
+                await self.on_lost()
+
+    async def release(self):
+        try:
+            async with SessionLocal() as db:
+                await release_lease(db, self.name, self.holder)
+        except Exception as e:
+            print(f"[LEASE] Error releasing '{self.name}': {e}")
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+from collections import deque
+from typing import AsyncIterator, Callable, Iterator
+
+class LogStream:
+    """Um stream de logs em modo follow por simulação, partilhado por todos os subscritores num ring buffer."""
+
+    def __init__(self, sim_id: str, buffer_size: int):
+        self.sim_id = sim_id
+        self.lines: deque[str] = deque(maxlen=buffer_size)
+        # Número de sequência da próxima linha; a primeira linha no buffer é next_seq - len(lines)
+        self.next_seq = 0
+        self.subscribers = 0
+        self.closed = False
+        self._loop = asyncio.get_running_loop()
+        self._waiter = self._loop.create_future()
+        self._source = None
+
+    @property
+    def first_seq(self) -> int:
+        return self.next_seq - len(self.lines)
+
+    def start(self, open_stream: Callable[[], Iterator[bytes]]):
+        threading.Thread(target=self._follow, args=(open_stream,), daemon=True, name=f"logs-{self.sim_id}").start()
+
+    def _follow(self, open_stream: Callable[[], Iterator[bytes]]):
+        # Bloqueante: corre numa thread própria enquanto houver subscritores
+        pending = b""
+        try:
+            self._source = open_stream()
+            for chunk in self._source:
+                pending += chunk
+                *complete, pending = pending.split(b"\n")
+                for line in complete:
+                    self._call(self._append, line.decode("utf-8", errors="replace"))
+        except Exception as e:
+            if not self.closed:
+                print(f"[LOGS] Stream for {self.sim_id} ended: {e}")
+        finally:
+            if pending:
+                self._call(self._append, pending.decode("utf-8", errors="replace"))
+            self._call(self._close)
+
+    def _call(self, callback, *args):
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Event loop já fechado (shutdown da API)
+            pass
+
+    def _notify(self):
+        waiter, self._waiter = self._waiter, self._loop.create_future()
+        waiter.set_result(None)
+
+    def _append(self, line: str):
+        self.lines.append(line)
+        self.next_seq += 1
+        self._notify()
+
+    def _close(self):
+        if not self.closed:
+            self.closed = True
+            self._notify()
+
+    def stop(self):
+        self._close()
+        source = self._source
+        if source is not None and hasattr(source, "close"):
+            try:
+                source.close()
+            except Exception:
+                pass
+
+    def tail(self, count: int) -> list[str]:
+        return list(self.lines)[-count:]
+
+    async def follow(self) -> AsyncIterator[str | int]:
+        """Devolve as linhas do buffer e depois as novas; um int indica quantas linhas um cliente lento perdeu."""
+        cursor = self.first_seq
+        while True:
+            while cursor < self.next_seq:
+                if cursor < self.first_seq:
+                    # O cliente ficou para trás e o buffer já avançou: salta em vez de bloquear os outros
+                    skipped, cursor = self.first_seq - cursor, self.first_seq
+                    yield skipped
+                    continue
+                line = self.lines[cursor - self.first_seq]
+                cursor += 1
+                yield line
+            if self.closed:
+                return
+            await asyncio.shield(self._waiter)
+
+class LogStreamManager:
+    """Mantém no máximo um stream Docker por simulação, aberto só enquanto houver subscritores."""
+
+    def __init__(self, open_stream: Callable[[str], Iterator[bytes]], buffer_size: int = 500):
+        self.open_stream = open_stream
+        self.buffer_size = buffer_size
+        self.streams: dict[str, LogStream] = {}
+
+    def get(self, sim_id: str) -> LogStream | None:
+        stream = self.streams.get(sim_id)
+        return stream if stream and not stream.closed else None
+
+    async def subscribe(self, sim_id: str, container_id: str) -> AsyncIterator[str | int]:
+        stream = self.get(sim_id)
+        if stream is None:
+            stream = LogStream(sim_id, self.buffer_size)
+            stream.start(lambda: self.open_stream(container_id))
+            self.streams[sim_id] = stream
+        stream.subscribers += 1
+        try:
+            async for item in stream.follow():
+                yield item
+        finally:
+            stream.subscribers -= 1
+            if stream.subscribers == 0:
+                stream.stop()
+                if self.streams.get(sim_id) is stream:
+                    del self.streams[sim_id]
+
+    def close(self, sim_id: str):
+        stream = self.streams.pop(sim_id, None)
+        if stream:
+            stream.stop()
+
+    def close_all(self):
+        for sim_id in list(self.streams):
+            self.close(sim_id)
@@ -1,47 +1,159 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-import docker
+from sqlalchemy.ext.asyncio import AsyncSession
 import json
 import uuid
-import tempfile
-import threading
-import time
+import base64
 import os
+import time
 from typing import List, Optional
 from datetime import datetime, timedelta
-from database import get_db, Simulation, SessionLocal
+from database import get_db, init_db, engine, Simulation, SessionLocal, UsageMinute, add_simulation, set_simulation_status, get_status_counts
+from scheduler import ExpiryScheduler
+from config_store import ConfigStore
+from docker_runner import DockerTimeoutError
+from orchestrator import ContainerNotFound, ImageNotFound, create_orchestrator
+from log_streams import LogStreamManager
+from telemetry_tap import TelemetryTap
+from view_cache import CachedView, ViewCache
+from container_events import ContainerEventListener
+from leases import LeaseKeeper
+from usage import UsageIngestor
+from admission import AdmissionController, AdmissionLimits, AdmissionRejected, AdmissionState, QueueFull, count_topic_instances, estimate_message_rate
+from simulation_preview import PreviewInvalid, PreviewUnavailable, run_preview
 from contextlib import asynccontextmanager
 import asyncio
-from sqlalchemy import text
+from sqlalchemy import func, select, text, tuple_
+
+# Background task para o garbage collector das configs
+async def periodic_config_gc():
+    """Roda o garbage collector do config store a cada 10 minutos."""
+    while True:
+        try:
+            async with SessionLocal() as db:
+                removed = await config_store.collect_garbage(db)
+            if removed:
+                print(f"[CONFIG-GC] Removed {removed} unused config files")
+        except Exception as e:
+            print(f"[CONFIG-GC] Error: {e}")
+        
+        await asyncio.sleep(600)  # 10 minutos
+
+async def periodic_leader_sync():
+    """Apanha o trabalho criado pelos outros workers: expirações próximas e lançamentos interrompidos."""
+    while True:
+        try:
+            async with SessionLocal() as db:
+                horizon = datetime.utcnow() + timedelta(seconds=2 * LEASE_HEARTBEAT_SECONDS)
+                expiring = await db.execute(
+                    select(Simulation.simulation_id, Simulation.expires_at).where(
+                        Simulation.status == "running", Simulation.expires_at <= horizon
+                    )
+                )
+                for sim_id, expires_at in expiring:
+                    expiry_scheduler.schedule(sim_id, expires_at)
+                
+                # Lançamentos de um worker que morreu nunca chegam a ter container (e ocupam capacidade até aqui)
+                stale_before = datetime.utcnow() - timedelta(minutes=STALE_STARTING_MINUTES)
+                for simulation in await db.scalars(select(Simulation).where(
+                    Simulation.status == "starting", Simulation.created_at < stale_before
+                )):
+                    await set_simulation_status(db, simulation, "failed")
+                    simulation.stopped_at = datetime.utcnow()
+                    print(f"[LEASE] Launch of {simulation.simulation_id} never finished: marked failed")
+                await db.commit()
+        except Exception as e:
+            print(f"[LEASE] Sync error: {e}")
+        
+        await asyncio.sleep(LEASE_HEARTBEAT_SECONDS)
+
+async def worker_sync():
+    """Em todos os workers: lança o que a fila lhe der e acerta o estado local com a BD a cada WORKER_SYNC_SECONDS.
+
+    Um fim de simulação neste worker pede logo uma volta (dispatch_requested), para a fila andar sem esperar.
+    """
+    while True:
+        try:
+            await dispatch_queued()
+            await sync_local_state()
+        except Exception as e:
+            print(f"[WORKER] Sync error: {e}")
+        
+        try:
+            await asyncio.wait_for(dispatch_requested.wait(), timeout=WORKER_SYNC_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        dispatch_requested.clear()
 
-# Background task para verificar expirados
-async def periodic_cleanup():
-    """Roda cleanup a cada 5 minutos."""
+async def periodic_usage_ingest():
+    """Agrega o uso escrito pelos simuladores a cada USAGE_INGEST_SECONDS."""
     while True:
         try:
-            cleanup_expired_simulations()
+            async with SessionLocal() as db:
+                await usage_ingestor.ingest(db)
         except Exception as e:
-            print(f"[PERIODIC-CLEANUP] Error: {e}")
+            print(f"[USAGE] Error: {e}")
         
-        await asyncio.sleep(300)  # 5 minutos
+        await asyncio.sleep(USAGE_INGEST_SECONDS)
+
+# Jobs que só o worker com o lease corre
+leader_tasks: list[asyncio.Task] = []
+
+async def start_leader_jobs():
+    async with SessionLocal() as db:
+        running = (await db.execute(
+            select(Simulation.simulation_id, Simulation.expires_at).where(Simulation.status == "running")
+        )).all()
+    # As já expiradas são paradas de imediato
+    expiry_scheduler.activate((sim_id, expires_at) for sim_id, expires_at in running)
+    print(f"[LEASE] Loaded {len(running)} running simulations into the expiry scheduler")
+    leader_tasks.extend([
+        asyncio.create_task(expiry_scheduler.run()),
+        asyncio.create_task(periodic_config_gc()),
+        asyncio.create_task(container_events.run()),
+        asyncio.create_task(periodic_leader_sync())
+    ])
+    if usage_ingestor:
+        leader_tasks.append(asyncio.create_task(periodic_usage_ingest()))
+    print("[LEASE] Expiry scheduler, config GC and Docker event listener started")
+
+async def stop_leader_jobs():
+    container_events.stop()
+    for task in leader_tasks:
+        task.cancel()
+    await asyncio.gather(*leader_tasks, return_exceptions=True)
+    leader_tasks.clear()
+    expiry_scheduler.deactivate()
+    print("[LEASE] Expiry scheduler, config GC and Docker event listener stopped")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Executa ao startup e shutdown da API."""
     # STARTUP
-    print("[STARTUP] Running initial cleanup...")
-    cleanup_expired_simulations()
+    await init_db()
+    
+    async with SessionLocal() as db:
+        queued = (await get_status_counts(db)).get("queued", 0)
+    print(f"[STARTUP] {queued} simulations waiting for capacity")
     
-    # Iniciar background task
-    task = asyncio.create_task(periodic_cleanup())
-    print("[STARTUP] Background cleanup task started")
+    # A primeira volta escuta as simulações em curso e lança a fila (os limites podem ter subido desde o último arranque)
+    sync_task = asyncio.create_task(worker_sync())
+    # Expiração, GC e eventos do Docker correm num só worker: o que tiver o lease
+    lease_task = asyncio.create_task(scheduler_lease.run())
     
     yield  # API roda aqui
     
     # SHUTDOWN
-    task.cancel()
-    print("[SHUTDOWN] Background cleanup task stopped")
+    sync_task.cancel()
+    lease_task.cancel()
+    await asyncio.gather(sync_task, lease_task, return_exceptions=True)
+    await scheduler_lease.release()
+    log_streams.close_all()
+    telemetry_tap.close()
+    orchestrator.shutdown()
+    await engine.dispose()
+    print("[SHUTDOWN] Background jobs stopped")
 
 
 app = FastAPI(
@@ -51,7 +163,30 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-docker_client = docker.from_env()
+SIMULATOR_IMAGE = "ghcr.io/damascenorafael/mqtt-simulator:sha-a73a2e8"
+
+# Limites de recursos de cada container do simulador
+SIMULATOR_CPUS = float(os.environ.get("SIMULATOR_CPUS", "0.5"))
+SIMULATOR_MEMORY = os.environ.get("SIMULATOR_MEMORY", "256m")
+
+# docker (por omissão) ou fake: containers em memória, para benchmarks da API sem daemon Docker
+orchestrator = create_orchestrator(
+    os.environ.get("ORCHESTRATOR", "docker"), SIMULATOR_IMAGE, SIMULATOR_CPUS, SIMULATOR_MEMORY
+)
+config_store = ConfigStore(os.environ.get("SIMULATOR_CONFIG_DIR", "./configs"))
+
+# Medição de uso: precisa de uma imagem do simulador com --usage-file, por isso só liga com a pasta definida
+USAGE_DIR = os.environ.get("SIMULATOR_USAGE_DIR")
+USAGE_INGEST_SECONDS = float(os.environ.get("USAGE_INGEST_SECONDS", "10"))
+usage_ingestor = UsageIngestor(USAGE_DIR) if USAGE_DIR else None
+
+def usage_dir_for(sim_id: str) -> str | None:
+    return usage_ingestor.directory_for(sim_id) if usage_ingestor else None
+
+# O follow fica bloqueado enquanto o container corre; é lido numa thread do LogStreamManager
+log_streams = LogStreamManager(orchestrator.follow_logs, buffer_size=int(os.environ.get("LOG_STREAM_BUFFER", "500")))
+telemetry_tap = TelemetryTap(buffer_size=int(os.environ.get("TELEMETRY_BUFFER", "100")))
+view_cache = ViewCache()
 
 # === Modelos Pydantic ===
 class DataField(BaseModel):
@@ -97,186 +232,508 @@ class SimulationListItem(BaseModel):
     stopped_at: Optional[str]
     duration_minutes: int
 
-def cleanup_expired_simulations():
-    """Verifica e para simulações que já expiraram."""
-    db = SessionLocal()
-    
-    try:
-        # Buscar simulações running que já expiraram
-        now = datetime.utcnow()
-        expired = db.query(Simulation).filter(
-            Simulation.status == "running",
-            Simulation.expires_at <= now
-        ).all()
+class SimulationBatchRequest(BaseModel):
+    simulations: List[SimulationConfig] = Field(min_length=1, max_length=500)
+    parallelism: int = Field(default=10, ge=1, le=50)
+
+class SimulationBatchItem(BaseModel):
+    index: int
+    simulation_id: str
+    status: str
+    container_id: Optional[str] = None
+    queue_position: Optional[int] = None
+    error: Optional[str] = None
+
+class SimulationBatchResponse(BaseModel):
+    started: int
+    queued: int = 0
+    failed: int
+    results: List[SimulationBatchItem]
+
+admission = AdmissionController(AdmissionLimits(
+    max_running=int(os.environ.get("MAX_RUNNING_SIMULATIONS", "50")),
+    max_message_rate=float(os.environ.get("MAX_MESSAGE_RATE", "2000")),
+    tenant_max_running=int(os.environ.get("TENANT_MAX_RUNNING_SIMULATIONS", "10")),
+    tenant_max_message_rate=float(os.environ.get("TENANT_MAX_MESSAGE_RATE", "500")),
+    max_queued=int(os.environ.get("MAX_QUEUED_SIMULATIONS", "200"))
+))
+# Referências às tasks que arrancam simulações da fila (o event loop só guarda referências fracas)
+launch_tasks: set[asyncio.Task] = set()
+# Acorda o worker_sync: houve capacidade libertada neste worker
+dispatch_requested = asyncio.Event()
+WORKER_SYNC_SECONDS = float(os.environ.get("WORKER_SYNC_SECONDS", "5"))
+
+async def release_simulation_config(db: AsyncSession, simulation: Simulation):
+    """Liberta a config de uma simulação que terminou (o commit fica a cargo de quem chama)."""
+    if simulation.config_hash:
+        await config_store.release(db, simulation.config_hash)
+    elif os.path.exists(simulation.config_path):
+        # Simulações anteriores ao config store tinham um ficheiro temporário próprio
+        os.remove(simulation.config_path)
+
+async def simulation_config(db: AsyncSession, simulation: Simulation) -> dict:
+    if simulation.config_hash:
+        config = await config_store.get_config(db, simulation.config_hash)
+        config["duration_minutes"] = simulation.duration_minutes
+        return config
+    return json.loads(simulation.config_json)
+
+def attach_telemetry(sim_id: str, config: dict):
+    telemetry_tap.attach(
+        sim_id,
+        config.get("BROKER_URL", "test.mosquitto.org"),
+        config.get("BROKER_PORT", 1883),
+        [topic["PREFIX"] for topic in config["TOPICS"]]
+    )
+
+async def dispatch_queued():
+    """Arranca em background as simulações da fila a que há lugar.
+
+    O admission controller passa-as a starting sob o lock de admissão: cada uma é lançada por um único worker.
+    """
+    async with SessionLocal() as db:
+        admitted = await admission.dispatch(db)
+        await db.commit()
+    if admitted:
+        # As posições das restantes na fila mudaram
+        view_cache.invalidate()
+    for simulation in admitted:
+        task = asyncio.create_task(launch_queued(simulation.simulation_id))
+        launch_tasks.add(task)
+        task.add_done_callback(launch_tasks.discard)
+
+async def sync_local_state():
+    """Telemetria, streams de logs e cache são de cada worker: acerta-os com as simulações running da BD,
+    que podem ter sido arrancadas ou paradas por outro worker."""
+    # Antes da query: o que for ligado entretanto é de uma simulação que já está running
+    attached = set(telemetry_tap.simulation_ids())
+    streaming = set(log_streams.streams)
+    async with SessionLocal() as db:
+        running = set(await db.scalars(select(Simulation.simulation_id).where(Simulation.status == "running")))
+        for sim_id in (attached | streaming) - running:
+            log_streams.close(sim_id)
+            telemetry_tap.detach(sim_id)
+            view_cache.invalidate(sim_id)
+        started = running - attached
+        if started:
+            for simulation in await db.scalars(select(Simulation).where(Simulation.simulation_id.in_(started))):
+                if telemetry_tap.get(simulation.simulation_id):
+                    continue  # Arrancada neste worker entretanto
+                attach_telemetry(simulation.simulation_id, await simulation_config(db, simulation))
+                view_cache.invalidate(simulation.simulation_id)
+
+async def launch_queued(sim_id: str):
+    async with SessionLocal() as db:
+        simulation = await db.scalar(select(Simulation).where(Simulation.simulation_id == sim_id))
+        if not simulation or simulation.status != "starting":
+            return
         
-        print(f"[CLEANUP] Found {len(expired)} expired simulations")
+        try:
+            container_id = await orchestrator.run(sim_id, simulation.config_path, usage_dir_for(sim_id))
+        except Exception as e:
+            print(f"[ADMISSION] Failed to start queued simulation {sim_id}: {e}")
+            await finish_simulation(db, simulation, "failed")
+            return
         
-        for sim in expired:
-            print(f"[CLEANUP] Stopping expired simulation {sim.simulation_id}")
-            
-            # Tentar parar container
-            try:
-                container = docker_client.containers.get(sim.container_id)
-                container.stop(timeout=5)
-                print(f"[CLEANUP] Container stopped: {sim.simulation_id}")
-            except docker.errors.NotFound:
-                print(f"[CLEANUP] Container already gone: {sim.simulation_id}")
-            except Exception as e:
-                print(f"[CLEANUP] Error stopping {sim.simulation_id}: {e}")
-            
-            # Atualizar BD
-            sim.status = "expired"
-            sim.stopped_at = datetime.utcnow()
-            
-            # Limpar ficheiro config
-            if os.path.exists(sim.config_path):
-                os.remove(sim.config_path)
+        # A duração conta a partir do arranque do container
+        simulation.container_id = container_id
+        simulation.expires_at = datetime.utcnow() + timedelta(minutes=simulation.duration_minutes)
+        if not await set_simulation_status(db, simulation, "running"):
+            # Cancelada enquanto o container arrancava
+            await orchestrator.stop(container_id)
+            return
+        await db.commit()
+        view_cache.invalidate(sim_id)
+        expiry_scheduler.schedule(sim_id, simulation.expires_at)
+        attach_telemetry(sim_id, await simulation_config(db, simulation))
+        print(f"[ADMISSION] Started queued simulation {sim_id}")
+
+async def finish_simulation(db: AsyncSession, simulation: Simulation, status: str) -> bool:
+    """Passa uma simulação a um status final e liberta o que ela usava. False se outro caminho já o fez."""
+    if not await set_simulation_status(db, simulation, status):
+        return False
+    simulation.stopped_at = datetime.utcnow()
+    await release_simulation_config(db, simulation)
+    await db.commit()
+    sim_id = simulation.simulation_id
+    view_cache.invalidate(sim_id)
+    expiry_scheduler.cancel(sim_id)
+    log_streams.close(sim_id)
+    telemetry_tap.detach(sim_id)
+    # Os outros workers largam o que tinham desta simulação no próximo worker_sync
+    dispatch_requested.set()
+    return True
+
+async def expire_simulation(sim_id: str):
+    """Para uma simulação cuja duração terminou."""
+    async with SessionLocal() as db:
+        simulation = await db.scalar(select(Simulation).where(Simulation.simulation_id == sim_id))
         
-        db.commit()
-        print(f"[CLEANUP] Cleanup complete")
+        # Pode ter sido parada manualmente entretanto
+        if not simulation or simulation.status != "running":
+            return
         
-    except Exception as e:
-        print(f"[CLEANUP] Error: {e}")
-    finally:
-        db.close()
-
-# === Função Auto-Stop ===
-def auto_stop_container(container_id: str, config_path: str, sim_id: str, duration_seconds: int):
-    """Para container após duração."""
-    time.sleep(duration_seconds)
-    
-    # Obter sessão BD
-    db = SessionLocal()
-    
-    try:
-        # Parar container
+        # Parar container (o evento 'die' que isto gera é ignorado pelo listener)
+        stopping_simulations.add(sim_id)
         try:
-            container = docker_client.containers.get(container_id)
-            print(f"[AUTO-STOP] Stopping simulation {sim_id}")
-            container.stop(timeout=5)
-        except docker.errors.NotFound:
-            print(f"[AUTO-STOP] Container {sim_id} already stopped")
+            print(f"[EXPIRY] Stopping simulation {sim_id}")
+            await orchestrator.stop(simulation.container_id)
+        except ContainerNotFound:
+            print(f"[EXPIRY] Container {sim_id} already stopped")
         except Exception as e:
-            print(f"[AUTO-STOP] Error stopping {sim_id}: {e}")
+            print(f"[EXPIRY] Error stopping {sim_id}: {e}")
         
         # Atualizar BD
-        simulation = db.query(Simulation).filter(
-            Simulation.simulation_id == sim_id
-        ).first()
-        
-        if simulation:
-            simulation.status = "expired"
-            simulation.stopped_at = datetime.utcnow()
-            db.commit()
-            print(f"[AUTO-STOP] Updated DB for {sim_id}")
-        
-    finally:
-        # Cleanup ficheiro
-        if os.path.exists(config_path):
-            os.remove(config_path)
-            print(f"[AUTO-STOP] Cleaned config file for {sim_id}")
-        
-        db.close()
+        try:
+            if await finish_simulation(db, simulation, "expired"):
+                print(f"[EXPIRY] Updated DB for {sim_id}")
+        finally:
+            stopping_simulations.discard(sim_id)
+
+async def on_container_exit(sim_id: str, exit_code: int):
+    """Evento 'die' do Docker: o container terminou sem ser pela API (crash, OOM, docker stop manual)."""
+    if sim_id in stopping_simulations:
+        return
+    async with SessionLocal() as db:
+        simulation = await db.scalar(select(Simulation).where(Simulation.simulation_id == sim_id))
+        if not simulation or simulation.status != "running":
+            return
+        status = "stopped" if exit_code == 0 else "failed"
+        if await finish_simulation(db, simulation, status):
+            print(f"[EVENTS] Container of {sim_id} exited with code {exit_code}: marked {status}")
+
+async def resync_containers(running_ids: set[str], listed_at: datetime):
+    """Depois de (re)ligar ao stream de eventos: as simulações running sem container passam a stopped."""
+    async with SessionLocal() as db:
+        simulations = (await db.scalars(select(Simulation).where(Simulation.status == "running"))).all()
+        for simulation in simulations:
+            # expires_at - duração é o arranque do container: os que arrancaram depois da listagem não estão nela
+            started_at = simulation.expires_at - timedelta(minutes=simulation.duration_minutes)
+            if (
+                simulation.simulation_id in running_ids
+                or simulation.simulation_id in stopping_simulations
+                or started_at >= listed_at
+            ):
+                continue
+            if await finish_simulation(db, simulation, "stopped"):
+                print(f"[EVENTS] Container of {simulation.simulation_id} is gone: marked stopped")
+
+expiry_scheduler = ExpiryScheduler(expire_simulation)
+# Simulações a ser paradas pela API: o 'die' delas não é um crash
+stopping_simulations: set[str] = set()
+container_events = ContainerEventListener(
+    orchestrator.events, orchestrator.list_running, on_container_exit, resync_containers
+)
+
+LEASE_TTL_SECONDS = float(os.environ.get("LEASE_TTL_SECONDS", "15"))
+LEASE_HEARTBEAT_SECONDS = float(os.environ.get("LEASE_HEARTBEAT_SECONDS", "5"))
+# Um lançamento em 'starting' há mais do que isto pertencia a um worker que morreu
+STALE_STARTING_MINUTES = 10
+scheduler_lease = LeaseKeeper(
+    "scheduler", start_leader_jobs, stop_leader_jobs,
+    ttl=LEASE_TTL_SECONDS, heartbeat_interval=LEASE_HEARTBEAT_SECONDS
+)
 
 # === Endpoints ===
-@app.post("/simulations", response_model=SimulationResponse, status_code=201,tags=["Create Simulation"])
-async def create_simulation(config: SimulationConfig, db: Session = Depends(get_db)):
-    """Cria nova simulação IoT"""
+def reserve_capacity(state: AdmissionState, tenant_id: str, message_rate: float) -> int:
+    try:
+        return state.reserve(tenant_id, message_rate)
+    except QueueFull as e:
+        raise HTTPException(429, str(e))
+    except AdmissionRejected as e:
+        raise HTTPException(422, str(e))
+
+@app.post(
+    "/simulations",
+    response_model=SimulationResponse,
+    status_code=201,
+    responses={202: {"description": "Sem capacidade: simulação em fila (com queue_position)"}},
+    tags=["Create Simulation"]
+)
+async def create_simulation(
+    config: SimulationConfig,
+    x_tenant_id: str = Header(default="default", max_length=64),
+    db: AsyncSession = Depends(get_db)
+):
+    """Cria nova simulação IoT (ou põe-na em fila se não houver capacidade)"""
     sim_id = str(uuid.uuid4())[:8]
     
     # Preparar config para simulador
     simulator_config = config.dict(exclude={'duration_minutes'})
+    message_rate = estimate_message_rate(simulator_config)
+    # A reserva é a própria linha (starting ou queued): fica na BD com a config, no mesmo commit
+    queue_position = reserve_capacity(await admission.lock(db), x_tenant_id, message_rate)
+    
+    # Guardar config (ficheiro partilhado por configs iguais)
+    config_hash = await config_store.acquire(db, simulator_config)
+    db_simulation = Simulation(
+        simulation_id=sim_id,
+        config_path=config_store.path_for(config_hash),
+        config_hash=config_hash,
+        status="queued" if queue_position else "starting",
+        duration_minutes=config.duration_minutes,
+        expires_at=datetime.utcnow() + timedelta(minutes=config.duration_minutes),
+        tenant_id=x_tenant_id,
+        estimated_rate=message_rate
+    )
+    await add_simulation(db, db_simulation)
+    await db.commit()
+    view_cache.invalidate()
     
-    # Criar ficheiro temporário
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-        json.dump(simulator_config, f, indent=2)
-        config_path = f.name
+    if queue_position:
+        return JSONResponse(status_code=202, content={
+            "simulation_id": sim_id,
+            "status": "queued",
+            "queue_position": queue_position,
+            "created_at": db_simulation.created_at.isoformat(),
+            "config": simulator_config
+        })
     
     try:
         # Iniciar container
-        container = docker_client.containers.run(
-            "ghcr.io/damascenorafael/mqtt-simulator:sha-a73a2e8",
-            command=["-f", "/config/settings.json"],
-            name=f"sim-{sim_id}",
-            volumes={config_path: {'bind': '/config/settings.json', 'mode': 'ro'}},
-            detach=True,
-            remove=True,
-            labels={"simulation_id": sim_id}
-        )
-        # Calcular quando expira
-        expires_at = datetime.utcnow() + timedelta(minutes=config.duration_minutes)
-        
-        # Guardar na BD
+        container_id = await orchestrator.run(sim_id, db_simulation.config_path, usage_dir_for(sim_id))
+    except ImageNotFound:
+        await finish_simulation(db, db_simulation, "failed")
+        raise HTTPException(404, "Simulator image not found")
+    except DockerTimeoutError as e:
+        await finish_simulation(db, db_simulation, "failed")
+        raise HTTPException(504, str(e))
+    except Exception as e:
+        await finish_simulation(db, db_simulation, "failed")
+        raise HTTPException(500, f"Failed to start: {str(e)}")
+    
+    # A duração conta a partir do arranque do container
+    db_simulation.container_id = container_id
+    db_simulation.expires_at = datetime.utcnow() + timedelta(minutes=config.duration_minutes)
+    if not await set_simulation_status(db, db_simulation, "running"):
+        # Parada enquanto o container arrancava
+        await orchestrator.stop(container_id)
+        raise HTTPException(409, f"Simulation {db_simulation.status} while starting")
+    await db.commit()
+    view_cache.invalidate(sim_id)
+    
+    # Agendar expiração
+    expiry_scheduler.schedule(sim_id, db_simulation.expires_at)
+    attach_telemetry(sim_id, simulator_config)
+    
+    return SimulationResponse(
+        simulation_id=sim_id,
+        container_id=container_id[:12],
+        status="running",
+        created_at=db_simulation.created_at.isoformat(),
+        expires_in_minutes=config.duration_minutes,
+        config=simulator_config
+    )
+
+def cached_response(request: Request, view: CachedView) -> Response:
+    """Responde 304 se o cliente já tem esta versão (If-None-Match), senão devolve o corpo guardado."""
+    headers = {"ETag": view.etag, "Cache-Control": "no-cache", **view.headers}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or view.etag in (tag.strip() for tag in if_none_match.split(","))):
+        return Response(status_code=304, headers=headers)
+    return Response(view.body, media_type="application/json", headers=headers)
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+
+@app.post("/simulations/batch", response_model=SimulationBatchResponse, status_code=207, tags=["Create Simulation"])
+async def create_simulations_batch(
+    batch: SimulationBatchRequest,
+    x_tenant_id: str = Header(default="default", max_length=64),
+    db: AsyncSession = Depends(get_db)
+):
+    """Cria várias simulações: uma transação para as linhas, containers lançados em paralelo"""
+    # Todas as configs já foram validadas pelo modelo antes de chegar aqui
+    results: list[SimulationBatchItem | None] = [None] * len(batch.simulations)
+    simulations: list[tuple[int, Simulation, SimulationConfig]] = []
+    # Um só lock de admissão para o batch inteiro: as reservas são as linhas inseridas neste commit
+    state = await admission.lock(db)
+    for index, config in enumerate(batch.simulations):
+        sim_id = str(uuid.uuid4())[:8]
+        simulator_config = config.dict(exclude={'duration_minutes'})
+        message_rate = estimate_message_rate(simulator_config)
+        try:
+            queue_position = state.reserve(x_tenant_id, message_rate)
+        except AdmissionRejected as e:
+            results[index] = SimulationBatchItem(index=index, simulation_id=sim_id, status="rejected", error=str(e))
+            continue
+        config_hash = await config_store.acquire(db, simulator_config)
         db_simulation = Simulation(
             simulation_id=sim_id,
-            container_id=container.id,
-            config_path=config_path,
-            config_json=json.dumps(config.dict()),
-            status="running",
+            config_path=config_store.path_for(config_hash),
+            config_hash=config_hash,
+            status="queued" if queue_position else "starting",
             duration_minutes=config.duration_minutes,
-            expires_at=expires_at
+            expires_at=datetime.utcnow() + timedelta(minutes=config.duration_minutes),
+            tenant_id=x_tenant_id,
+            estimated_rate=message_rate
         )
-        db.add(db_simulation)
-        db.commit()
-        db.refresh(db_simulation)
-        
-        # Agendar auto-stop
-        duration_seconds = config.duration_minutes * 60
-        threading.Thread(
-            target=auto_stop_container,
-            args=(container.id, config_path, sim_id, duration_seconds),
-            daemon=True
-        ).start()
-        
-        return SimulationResponse(
-            simulation_id=sim_id,
-            container_id=container.id[:12],
-            status="running",
-            created_at=db_simulation.created_at.isoformat(),
-            expires_in_minutes=config.duration_minutes,
-            config=simulator_config
+        await add_simulation(db, db_simulation)
+        if queue_position:
+            results[index] = SimulationBatchItem(
+                index=index, simulation_id=sim_id, status="queued", queue_position=queue_position
+            )
+        else:
+            simulations.append((index, db_simulation, config))
+    await db.commit()
+    view_cache.invalidate()
+    
+    semaphore = asyncio.Semaphore(batch.parallelism)
+    
+    async def launch(db_simulation: Simulation):
+        async with semaphore:
+            try:
+                sim_id = db_simulation.simulation_id
+                return await orchestrator.run(sim_id, db_simulation.config_path, usage_dir_for(sim_id)), None
+            except ImageNotFound:
+                return None, "Simulator image not found"
+            except Exception as e:
+                return None, f"Failed to start: {str(e)}"
+    
+    launched = await asyncio.gather(*(launch(sim) for _, sim, _ in simulations))
+    
+    released = False
+    orphans = []
+    for (index, db_simulation, config), (container_id, error) in zip(simulations, launched):
+        sim_id = db_simulation.simulation_id
+        if error:
+            # Parada enquanto arrancava: quem a parou já libertou a config
+            if await set_simulation_status(db, db_simulation, "failed"):
+                db_simulation.stopped_at = datetime.utcnow()
+                await release_simulation_config(db, db_simulation)
+                released = True
+            results[index] = SimulationBatchItem(index=index, simulation_id=sim_id, status=db_simulation.status, error=error)
+            continue
+        if not await set_simulation_status(db, db_simulation, "running"):
+            # Parada enquanto o container arrancava: nem expiração nem resync olham para ela, é preciso pará-lo aqui
+            orphans.append(container_id)
+            results[index] = SimulationBatchItem(index=index, simulation_id=sim_id, status=db_simulation.status)
+            continue
+        # A duração conta a partir do arranque do container
+        db_simulation.container_id = container_id
+        db_simulation.expires_at = datetime.utcnow() + timedelta(minutes=db_simulation.duration_minutes)
+        results[index] = SimulationBatchItem(
+            index=index, simulation_id=sim_id, status="running", container_id=container_id[:12]
         )
-        
-    except docker.errors.ImageNotFound:
-        if os.path.exists(config_path):
-            os.remove(config_path)
-        raise HTTPException(404, "Simulator image not found")
-    except Exception as e:
-        if os.path.exists(config_path):
-            os.remove(config_path)
-        raise HTTPException(500, f"Failed to start: {str(e)}")
+    await db.commit()
+    for container_id in orphans:
+        try:
+            await orchestrator.stop(container_id)
+        except ContainerNotFound:
+            pass
+        except Exception as e:
+            print(f"Error stopping container: {e}")
+    view_cache.invalidate()
+    
+    for _, db_simulation, config in simulations:
+        if db_simulation.status == "running":
+            expiry_scheduler.schedule(db_simulation.simulation_id, db_simulation.expires_at)
+            attach_telemetry(db_simulation.simulation_id, config.dict())
+    if released:
+        dispatch_requested.set()
+    
+    started = sum(1 for result in results if result.status == "running")
+    queued = sum(1 for result in results if result.status == "queued")
+    return SimulationBatchResponse(started=started, queued=queued, failed=len(results) - started - queued, results=results)
+
+# Limite de payloads (tópicos x ticks) de um preview: a resposta inteira fica em memória
+MAX_PREVIEW_PAYLOADS = int(os.environ.get("MAX_PREVIEW_PAYLOADS", "500000"))
+
+@app.post("/simulations/preview", tags=["Create Simulation"])
+async def preview_simulation(
+    config: SimulationConfig,
+    ticks: int = Query(default=100, ge=1, le=10000),
+    seed: Optional[int] = None
+):
+    """Valida a config com o simulador e devolve os payloads de N ticks por tópico, sem container nem broker"""
+    simulator_config = config.dict(exclude={'duration_minutes'})
+    topic_count = sum(count_topic_instances(topic) for topic in simulator_config["TOPICS"])
+    if topic_count * ticks > MAX_PREVIEW_PAYLOADS:
+        raise HTTPException(422, f"Preview too large: {topic_count} topics x {ticks} ticks (max {MAX_PREVIEW_PAYLOADS} payloads)")
+    
+    try:
+        preview = await asyncio.to_thread(run_preview, simulator_config, ticks, seed)
+    except PreviewInvalid as e:
+        raise HTTPException(422, {"message": str(e), "errors": e.errors})
+    except PreviewUnavailable as e:
+        raise HTTPException(503, str(e))
+    # Só tipos JSON: JSONResponse direto evita o jsonable_encoder a percorrer cada payload
+    return JSONResponse(preview)
 
 @app.get("/simulations", response_model=List[SimulationListItem],tags=["List Simulations"])
 async def list_simulations(
+    request: Request,
     status: Optional[str] = None,
-    limit: int = 20,
-    db: Session = Depends(get_db)
+    limit: int = Query(default=20, ge=1, le=200),
+    after: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Lista simulações (com filtro opcional por status)"""
-    query = db.query(Simulation)
+    """Lista simulações (filtros por status e created_at, paginação com o cursor do header X-Next-Cursor)"""
+    cache_key = (status, limit, after, created_from, created_to)
+    view = view_cache.get_list(cache_key)
+    if view:
+        return cached_response(request, view)
+    generation = view_cache.generation
+    
+    # Só as colunas da listagem: config_json nunca é carregado
+    query = select(
+        Simulation.id,
+        Simulation.simulation_id,
+        Simulation.status,
+        Simulation.created_at,
+        Simulation.stopped_at,
+        Simulation.duration_minutes
+    )
     
     if status:
-        query = query.filter(Simulation.status == status)
+        query = query.where(Simulation.status == status)
+    if created_from:
+        query = query.where(Simulation.created_at >= created_from)
+    if created_to:
+        query = query.where(Simulation.created_at < created_to)
+    if after:
+        # Keyset: continua a seguir à última linha da página anterior, sem OFFSET
+        query = query.where(tuple_(Simulation.created_at, Simulation.id) < decode_cursor(after))
+    
+    result = await db.execute(query.order_by(Simulation.created_at.desc(), Simulation.id.desc()).limit(limit))
+    simulations = result.all()
     
-    simulations = query.order_by(Simulation.created_at.desc()).limit(limit).all()
+    headers = {}
+    if len(simulations) == limit:
+        last = simulations[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
     
-    return [
+    view = view_cache.render([
         SimulationListItem(
             simulation_id=sim.simulation_id,
             status=sim.status,
             created_at=sim.created_at.isoformat(),
             stopped_at=sim.stopped_at.isoformat() if sim.stopped_at else None,
             duration_minutes=sim.duration_minutes
-        )
+        ).model_dump()
         for sim in simulations
-    ]
+    ], headers)
+    view_cache.set_list(cache_key, view, generation)
+    return cached_response(request, view)
 
 @app.get("/simulations/{sim_id}", tags=["Get Simulation Details"])
-async def get_simulation(sim_id: str, db: Session = Depends(get_db)):
-    """Detalhes de simulação específica"""
-    simulation = db.query(Simulation).filter(
-        Simulation.simulation_id == sim_id
-    ).first()
+async def get_simulation(sim_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Detalhes de simulação específica (com ETag: um poll sem mudanças responde 304 sem BD nem Docker)"""
+    view = view_cache.get_detail(sim_id)
+    if view:
+        return cached_response(request, view)
+    generation = view_cache.generation
+    
+    simulation = await db.scalar(select(Simulation).where(Simulation.simulation_id == sim_id))
     
     if not simulation:
         raise HTTPException(404, "Simulation not found")
@@ -287,33 +744,182 @@ async def get_simulation(sim_id: str, db: Session = Depends(get_db)):
     
     if simulation.container_id and simulation.status == "running":
         try:
-            container = docker_client.containers.get(simulation.container_id)
-            container_status = container.status
-            logs = container.logs(tail=50).decode('utf-8').split('\n')
-        except docker.errors.NotFound:
-            container_status = "stopped"
-            # Atualizar BD
-            simulation.status = "stopped"
-            simulation.stopped_at = datetime.utcnow()
-            db.commit()
+            container_status = await orchestrator.status(simulation.container_id)
+            log_stream = log_streams.get(sim_id)
+            if log_stream:
+                # Já há um stream em modo follow: usar o buffer em vez de pedir os logs ao Docker
+                logs = log_stream.tail(50)
+            else:
+                logs = await orchestrator.logs(simulation.container_id, tail=50)
+        except DockerTimeoutError as e:
+            print(f"Error getting container: {e}")
+        except ContainerNotFound:
+            # Normalmente já tratado pelo listener de eventos; fica como salvaguarda
+            await finish_simulation(db, simulation, "stopped")
+            container_status = simulation.status
+            generation = view_cache.generation
     
-    return {
+    config = await simulation_config(db, simulation)
+    
+    view = view_cache.render({
         "simulation_id": simulation.simulation_id,
         "container_id": simulation.container_id[:12] if simulation.container_id else None,
         "status": container_status,
         "created_at": simulation.created_at.isoformat(),
         "stopped_at": simulation.stopped_at.isoformat() if simulation.stopped_at else None,
         "duration_minutes": simulation.duration_minutes,
-        "config": json.loads(simulation.config_json),
-        "logs": logs
+        "config": config,
+        "logs": logs,
+        "tenant_id": simulation.tenant_id,
+        "queue_position": await admission.position(db, simulation) if simulation.status == "queued" else None
+    })
+    # A posição na fila muda sem passar por uma invalidação desta simulação
+    if simulation.status != "queued":
+        view_cache.set_detail(sim_id, view, simulation.status == "running", generation)
+    return cached_response(request, view)
+
+async def get_running_container_id(db: AsyncSession, sim_id: str) -> str:
+    result = await db.execute(
+        select(Simulation.status, Simulation.container_id).where(Simulation.simulation_id == sim_id)
+    )
+    simulation = result.first()
+    
+    if not simulation:
+        raise HTTPException(404, "Simulation not found")
+    
+    if simulation.status != "running" or not simulation.container_id:
+        raise HTTPException(400, f"Simulation is {simulation.status}")
+    
+    return simulation.container_id
+
+@app.get("/simulations/{sim_id}/logs/stream", tags=["Get Simulation Details"])
+async def stream_simulation_logs(sim_id: str, db: AsyncSession = Depends(get_db)):
+    """Logs em tempo real (Server-Sent Events)"""
+    container_id = await get_running_container_id(db, sim_id)
+    
+    async def events():
+        async for item in log_streams.subscribe(sim_id, container_id):
+            if isinstance(item, int):
+                # Cliente lento: o buffer avançou e estas linhas perderam-se
+                yield f"event: skipped\ndata: {item}\n\n"
+            else:
+                yield f"data: {item}\n\n"
+        yield "event: end\ndata: \n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.websocket("/simulations/{sim_id}/logs/ws")
+async def websocket_simulation_logs(websocket: WebSocket, sim_id: str):
+    """Logs em tempo real (WebSocket)"""
+    async with SessionLocal() as db:
+        try:
+            container_id = await get_running_container_id(db, sim_id)
+        except HTTPException as e:
+            await websocket.close(code=1008, reason=e.detail)
+            return
+    
+    await websocket.accept()
+    try:
+        async for item in log_streams.subscribe(sim_id, container_id):
+            if isinstance(item, int):
+                await websocket.send_json({"skipped": item})
+            else:
+                await websocket.send_json({"line": item})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/simulations/{sim_id}/messages", tags=["Get Simulation Details"])
+async def get_simulation_messages(
+    sim_id: str,
+    limit: int = Query(default=50, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Últimas mensagens publicadas pela simulação, recebidas pela subscrição partilhada do broker"""
+    await get_running_container_id(db, sim_id)
+    
+    messages = telemetry_tap.get(sim_id)
+    recent = telemetry_tap.recent(sim_id, limit)
+    if messages is None or recent is None:
+        raise HTTPException(404, "No telemetry for this simulation")
+    
+    def decode(payload: bytes):
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return payload.decode("utf-8", errors="replace")
+    
+    return {
+        "simulation_id": sim_id,
+        "broker": f"{messages.broker[0]}:{messages.broker[1]}",
+        "total_messages": messages.total_messages,
+        "messages_per_second": round(messages.rate_per_second(time.time()), 3),
+        "messages": [
+            {
+                "topic": topic,
+                "payload": decode(payload),
+                "qos": qos,
+                "retain": retain,
+                "received_at": datetime.utcfromtimestamp(timestamp).isoformat()
+            }
+            for timestamp, topic, payload, qos, retain in recent
+        ]
+    }
+
+def usage_row(minute: datetime, messages: int, size: int) -> dict:
+    return {"minute": minute.isoformat(), "messages": messages, "bytes": size}
+
+@app.get("/simulations/{sim_id}/usage", tags=["Usage"])
+async def get_simulation_usage(sim_id: str, db: AsyncSession = Depends(get_db)):
+    """Mensagens e bytes publicados pela simulação, por minuto"""
+    tenant_id = await db.scalar(select(Simulation.tenant_id).where(Simulation.simulation_id == sim_id))
+    if tenant_id is None:
+        raise HTTPException(404, "Simulation not found")
+    
+    result = await db.execute(
+        select(UsageMinute.minute, UsageMinute.messages, UsageMinute.bytes)
+        .where(UsageMinute.simulation_id == sim_id)
+        .order_by(UsageMinute.minute)
+    )
+    minutes = [usage_row(*row) for row in result]
+    return {
+        "simulation_id": sim_id,
+        "tenant_id": tenant_id,
+        "messages": sum(row["messages"] for row in minutes),
+        "bytes": sum(row["bytes"] for row in minutes),
+        "minutes": minutes
+    }
+
+@app.get("/usage", tags=["Usage"])
+async def get_tenant_usage(
+    start: datetime = Query(alias="from"),
+    end: datetime = Query(alias="to"),
+    x_tenant_id: str = Header(default="default", max_length=64),
+    db: AsyncSession = Depends(get_db)
+):
+    """Uso do tenant (header X-Tenant-ID) entre from e to, por minuto, somando todas as simulações"""
+    result = await db.execute(
+        select(UsageMinute.minute, func.sum(UsageMinute.messages), func.sum(UsageMinute.bytes))
+        .where(
+            UsageMinute.tenant_id == x_tenant_id,
+            UsageMinute.minute >= start,
+            UsageMinute.minute < end
+        )
+        .group_by(UsageMinute.minute)
+        .order_by(UsageMinute.minute)
+    )
+    minutes = [usage_row(*row) for row in result]
+    return {
+        "tenant_id": x_tenant_id,
+        "messages": sum(row["messages"] for row in minutes),
+        "bytes": sum(row["bytes"] for row in minutes),
+        "minutes": minutes
     }
 
 @app.delete("/simulations/{sim_id}",tags=["Stop Simulation"])
-async def stop_simulation(sim_id: str, db: Session = Depends(get_db)):
+async def stop_simulation(sim_id: str, db: AsyncSession = Depends(get_db)):
     """Para simulação manualmente"""
-    simulation = db.query(Simulation).filter(
-        Simulation.simulation_id == sim_id
-    ).first()
+    simulation = await db.scalar(select(Simulation).where(Simulation.simulation_id == sim_id))
     
     if not simulation:
         raise HTTPException(404, "Simulation not found")
@@ -321,54 +927,53 @@ async def stop_simulation(sim_id: str, db: Session = Depends(get_db)):
     if simulation.status in ["stopped", "expired", "failed"]:
         raise HTTPException(400, f"Simulation already {simulation.status}")
     
-    # Parar container
+    # Parar container (uma simulação em fila ainda não tem)
+    stopping_simulations.add(sim_id)
     try:
-        container = docker_client.containers.get(simulation.container_id)
-        container.stop(timeout=5)
-    except docker.errors.NotFound:
-        pass  # Já parou
-    except Exception as e:
-        print(f"Error stopping container: {e}")
-    
-    # Atualizar BD
-    simulation.status = "stopped"
-    simulation.stopped_at = datetime.utcnow()
-    db.commit()
-    
-    # Cleanup ficheiro
-    if os.path.exists(simulation.config_path):
-        os.remove(simulation.config_path)
+        try:
+            if simulation.container_id:
+                await orchestrator.stop(simulation.container_id)
+        except ContainerNotFound:
+            pass  # Já parou
+        except Exception as e:
+            print(f"Error stopping container: {e}")
+        
+        # Atualizar BD (se entretanto expirou ou o container morreu, fica o status desse caminho)
+        await finish_simulation(db, simulation, "stopped")
+    finally:
+        stopping_simulations.discard(sim_id)
     
     return {
-        "status": "stopped",
+        "status": simulation.status,
         "simulation_id": sim_id,
-        "stopped_at": simulation.stopped_at.isoformat()
+        "stopped_at": simulation.stopped_at.isoformat() if simulation.stopped_at else None
     }
 
 @app.get("/stats", tags=["Get Statistics"])
-async def get_stats(db: Session = Depends(get_db)):
+async def get_stats(db: AsyncSession = Depends(get_db)):
     """Estatísticas gerais"""
-    total = db.query(Simulation).count()
-    running = db.query(Simulation).filter(Simulation.status == "running").count()
-    stopped = db.query(Simulation).filter(Simulation.status == "stopped").count()
-    expired = db.query(Simulation).filter(Simulation.status == "expired").count()
+    counts = await get_status_counts(db)
     
     return {
-        "total_simulations": total,
-        "running": running,
-        "stopped": stopped,
-        "expired": expired
+        "total_simulations": sum(counts.values()),
+        "running": counts.get("running", 0),
+        "queued": counts.get("queued", 0),
+        "stopped": counts.get("stopped", 0),
+        "expired": counts.get("expired", 0),
+        "admission": await admission.stats(db),
+        "telemetry": telemetry_tap.stats(),
+        "view_cache": view_cache.stats()
     }
 
 @app.get("/", tags=["Root"])
-async def root(db: Session = Depends(get_db)):
-    running_count = db.query(Simulation).filter(Simulation.status == "running").count()
+async def root(db: AsyncSession = Depends(get_db)):
+    running_count = (await get_status_counts(db)).get("running", 0)
     
     return {
         "service": "IoT Simulator API",
         "version": "2.0.0",
         "docs": "/docs",
-        "database": "sqlite",
+        "database": engine.dialect.name,
         "active_simulations": running_count
     }
 
@@ -376,17 +981,15 @@ async def root(db: Session = Depends(get_db)):
 async def health():
     """Health check"""
     try:
-        docker_client.ping()
+        await orchestrator.ping()
         docker_status = "connected"
-    except:
+    except Exception:
         docker_status = "disconnected"
     
     # Verificar BD
     try:
-        
-        db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        db.close()
+        async with SessionLocal() as db:
+            await db.execute(text("SELECT 1"))
         db_status = "connected"
     except Exception as e:
         print(f"Error connecting to database: {e}")
@@ -397,5 +1000,10 @@ async def health():
     return {
         "status": "healthy" if healthy else "unhealthy",
         "docker": docker_status,
+        "docker_events": (
+            "standby" if not scheduler_lease.is_held
+            else "connected" if container_events.is_connected else "reconnecting"
+        ),
+        "background_jobs": "leader" if scheduler_lease.is_held else "standby",
         "database": db_status
     }
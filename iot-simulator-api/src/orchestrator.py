@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Iterator
+import docker
+from docker_runner import DockerRunner
+
+class ContainerNotFound(Exception):
+    """O container já não existe."""
+
+class ImageNotFound(Exception):
+    """A imagem do simulador não existe."""
+
+class Orchestrator(ABC):
+    """Onde correm os containers do simulador. A API só fala com esta interface."""
+
+    @abstractmethod
+    async def run(self, sim_id: str, config_path: str, usage_dir: str | None = None) -> str:
+        """Arranca o simulador com a config dada e devolve o id do container.
+
+        Com usage_dir o simulador escreve nessa pasta os contadores de uso (--usage-file).
+        """
+
+    @abstractmethod
+    async def stop(self, container_id: str):
+        """Para o container (ContainerNotFound se já não existe)."""
+
+    @abstractmethod
+    async def status(self, container_id: str) -> str:
+        """Status do container (ContainerNotFound se já não existe)."""
+
+    @abstractmethod
+    async def logs(self, container_id: str, tail: int = 50) -> list[str]:
+        """Últimas linhas de log (ContainerNotFound se já não existe)."""
+
+    @abstractmethod
+    async def list_running(self) -> set[str]:
+        """simulation_id de todos os containers a correr."""
+
+    @abstractmethod
+    def follow_logs(self, container_id: str) -> Iterator[bytes]:
+        """Logs em modo follow. Bloqueante: é lido numa thread própria."""
+
+    @abstractmethod
+    def events(self) -> Iterator[dict]:
+        """Eventos 'die' no formato do Docker. Bloqueante: é lido numa thread própria."""
+
+    async def ping(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+class DockerOrchestrator(Orchestrator):
+    def __init__(self, image: str, cpus: float, memory: str, runner: DockerRunner | None = None):
+        self.image = image
+        self.cpus = cpus
+        self.memory = memory
+        self.runner = runner or DockerRunner()
+        # O cliente só é criado na primeira chamada (docker.from_env fala com o daemon)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self) -> docker.DockerClient:
+        with self._client_lock:
+            if self._client is None:
+                self._client = docker.from_env()
+            return self._client
+
+    async def _call(
+        self,
+        operation: str,
+        func: Callable[[docker.DockerClient], Any],
+        on_abandoned: Callable[[Any], None] | None = None
+    ) -> Any:
+        # Tudo (incluindo criar o cliente) corre no executor do DockerRunner
+        try:
+            return await self.runner.run(operation, lambda: func(self.client), on_abandoned=on_abandoned)
+        except docker.errors.ImageNotFound as e:
+            raise ImageNotFound(str(e))
+        except docker.errors.NotFound as e:
+            raise ContainerNotFound(str(e))
+
+    async def run(self, sim_id: str, config_path: str, usage_dir: str | None = None) -> str:
+        command = ["-f", "/config/settings.json"]
+        volumes = {config_path: {'bind': '/config/settings.json', 'mode': 'ro'}}
+        if usage_dir:
+            os.makedirs(usage_dir, exist_ok=True)
+            command += ["--usage-file", "/usage/usage.jsonl"]
+            volumes[usage_dir] = {'bind': '/usage', 'mode': 'rw'}
+        container = await self._call("run", lambda client: client.containers.run(
+            self.image,
+            command=command,
+            name=f"sim-{sim_id}",
+            volumes=volumes,
+            detach=True,
+            remove=True,
+            labels={"simulation_id": sim_id},
+            nano_cpus=int(self.cpus * 1e9),
+            mem_limit=self.memory
+        ), on_abandoned=self._remove_orphan)
+        return container.id
+
+    @staticmethod
+    def _remove_orphan(container):
+        # O run deu timeout mas o container chegou a arrancar: a simulação já foi dada como falhada
+        container.remove(force=True)
+        print(f"[DOCKER] Removed container {container.name} started after its run timed out")
+
+    async def stop(self, container_id: str):
+        await self._call("stop", lambda client: client.containers.get(container_id).stop(timeout=5))
+
+    async def status(self, container_id: str) -> str:
+        return await self._call("get", lambda client: client.containers.get(container_id).status)
+
+    async def logs(self, container_id: str, tail: int = 50) -> list[str]:
+        raw = await self._call("logs", lambda client: client.containers.get(container_id).logs(tail=tail))
+        return raw.decode('utf-8').split('\n')
+
+    async def list_running(self) -> set[str]:
+        containers = await self._call("get", lambda client: client.containers.list(
+            filters={"label": "simulation_id", "status": "running"}
+        ))
+        return {container.labels["simulation_id"] for container in containers}
+
+    def follow_logs(self, container_id: str) -> Iterator[bytes]:
+        return self.client.containers.get(container_id).logs(stream=True, follow=True, tail=50)
+
+    def events(self) -> Iterator[dict]:
+        return self.client.events(
+            decode=True,
+            filters={"type": "container", "event": "die", "label": "simulation_id"}
+        )
+
+    async def ping(self):
+        await self._call("ping", lambda client: client.ping())
+
+    def shutdown(self):
+        self.runner.shutdown()
+
+class _QueueStream:
+    """Iterador bloqueante sobre uma queue, com close() como os streams do Docker SDK."""
+
+    _CLOSED = object()
+
+    def __init__(self, on_close: Callable[["_QueueStream"], None] | None = None):
+        self.queue: queue.Queue = queue.Queue()
+        self.on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.queue.get()
+        if item is self._CLOSED:
+            raise StopIteration
+        return item
+
+    def close(self):
+        if self.on_close:
+            self.on_close(self)
+        self.queue.put(self._CLOSED)
+
+class _FakeContainer:
+    def __init__(self, sim_id: str, usage_dir: str | None):
+        self.id = uuid.uuid4().hex + uuid.uuid4().hex
+        self.sim_id = sim_id
+        self.usage_dir = usage_dir
+        self.status = "running"
+        self.started_at = time.monotonic()
+        self.started_at_wall = time.time()
+
+    def log_lines(self, start: int, end: int) -> list[str]:
+        return [f"[fake] {self.sim_id} tick {tick}" for tick in range(start, end)]
+
+    def tick_count(self, tick_interval: float) -> int:
+        return int((time.monotonic() - self.started_at) / tick_interval) + 1
+
+class _FakeLogStream:
+    """Uma linha por tick até o container parar ou o stream ser fechado."""
+
+    def __init__(self, container: _FakeContainer, tick_interval: float):
+        self.container = container
+        self.tick_interval = tick_interval
+        self.next_tick = max(container.tick_count(tick_interval) - 50, 0)
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        while self.container.tick_count(self.tick_interval) <= self.next_tick:
+            if self.closed.wait(self.tick_interval / 4) or self.container.status != "running":
+                raise StopIteration
+        if self.closed.is_set():
+            raise StopIteration
+        line = self.container.log_lines(self.next_tick, self.next_tick + 1)[0]
+        self.next_tick += 1
+        return f"{line}\n".encode()
+
+    def close(self):
+        self.closed.set()
+
+class FakeOrchestrator(Orchestrator):
+    """Containers em memória: para benchmarks da API e testes sem daemon Docker.
+
+    run_latency simula o tempo de arranque de um container; os logs são uma linha por tick.
+    """
+
+    def __init__(self, run_latency: float = 0.0, stop_latency: float = 0.0, tick_interval: float = 1.0):
+        self.run_latency = run_latency
+        self.stop_latency = stop_latency
+        self.tick_interval = tick_interval
+        self.containers: dict[str, _FakeContainer] = {}
+        self._event_streams: list[_QueueStream] = []
+        self._lock = threading.Lock()
+
+    async def _sleep(self, seconds: float):
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def _get(self, container_id: str) -> _FakeContainer:
+        container = self.containers.get(container_id)
+        if container is None:
+            raise ContainerNotFound(container_id)
+        return container
+
+    async def run(self, sim_id: str, config_path: str, usage_dir: str | None = None) -> str:
+        await self._sleep(self.run_latency)
+        container = _FakeContainer(sim_id, usage_dir)
+        self.containers[container.id] = container
+        return container.id
+
+    async def stop(self, container_id: str):
+        self._get(container_id)
+        await self._sleep(self.stop_latency)
+        self.exit(container_id, 143)
+
+    def exit(self, container_id: str, exit_code: int):
+        """Termina um container como se tivesse saído sozinho (crash, OOM...)."""
+        container = self.containers.pop(container_id, None)
+        if container is None:
+            return
+        if container.usage_dir:
+            self._write_usage(container)
+        container.status = "exited"
+        event = {
+            "Type": "container",
+            "Action": "die",
+            "Actor": {"ID": container_id, "Attributes": {"simulation_id": container.sim_id, "exitCode": str(exit_code)}}
+        }
+        with self._lock:
+            streams = list(self._event_streams)
+        for stream in streams:
+            stream.queue.put(event)
+
+    def _write_usage(self, container: _FakeContainer):
+        # Um único flush no fim, como o simulador no SIGTERM: uma mensagem de 64 bytes por tick
+        ticks = container.tick_count(self.tick_interval)
+        os.makedirs(container.usage_dir, exist_ok=True)
+        entry = {"start": container.started_at_wall, "end": time.time(), "topics": {f"fake/{container.sim_id}": [ticks, ticks * 64]}}
+        with open(os.path.join(container.usage_dir, "usage.jsonl"), "a", encoding="utf-8") as usage_file:
+            usage_file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    async def status(self, container_id: str) -> str:
+        return self._get(container_id).status
+
+    async def logs(self, container_id: str, tail: int = 50) -> list[str]:
+        container = self._get(container_id)
+        end = container.tick_count(self.tick_interval)
+        return container.log_lines(max(end - tail, 0), end)
+
+    async def list_running(self) -> set[str]:
+        return {container.sim_id for container in self.containers.values()}
+
+    def follow_logs(self, container_id: str) -> Iterator[bytes]:
+        return _FakeLogStream(self._get(container_id), self.tick_interval)
+
+    def events(self) -> Iterator[dict]:
+        def remove(stream: _QueueStream):
+            with self._lock:
+                if stream in self._event_streams:
+                    self._event_streams.remove(stream)
+
+        stream = _QueueStream(on_close=remove)
+        with self._lock:
+            self._event_streams.append(stream)
+        return stream
+
+def create_orchestrator(kind: str, image: str, cpus: float, memory: str) -> Orchestrator:
+    if kind == "docker":
+        return DockerOrchestrator(image, cpus, memory)
+    if kind == "fake":
+        return FakeOrchestrator(run_latency=float(os.environ.get("FAKE_RUN_LATENCY", "0.05")))
+    raise ValueError(f"Unknown orchestrator '{kind}' (expected 'docker' or 'fake')")
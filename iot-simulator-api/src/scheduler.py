@@ -0,0 +1,85 @@
+import asyncio
+import heapq
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable
+
+class ExpiryScheduler:
+    """Agenda a expiração de todas as simulações numa única task asyncio (min-heap por expires_at).
+
+    Só o processo com o lease dos jobs de fundo o tem ativo; nos outros schedule() não faz nada.
+    """
+
+    def __init__(self, on_expire: Callable[[str], Awaitable[None]], max_sleep_seconds: float = 1.0):
+        self.on_expire = on_expire
+        self.max_sleep_seconds = max_sleep_seconds
+        self._heap: list[tuple[datetime, str]] = []
+        # Entradas no heap que já não estão aqui (canceladas/reagendadas) são ignoradas ao sair
+        self._scheduled: dict[str, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+        self.is_active = False
+
+    def activate(self, entries: Iterable[tuple[str, datetime]]):
+        self.is_active = True
+        self.load(entries)
+
+    def deactivate(self):
+        self.is_active = False
+        self._heap.clear()
+        self._scheduled.clear()
+
+    def load(self, entries: Iterable[tuple[str, datetime]]):
+        for sim_id, expires_at in entries:
+            self._scheduled[sim_id] = expires_at
+            self._heap.append((expires_at, sim_id))
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def schedule(self, sim_id: str, expires_at: datetime):
+        if not self.is_active or self._scheduled.get(sim_id) == expires_at:
+            return
+        self._scheduled[sim_id] = expires_at
+        heapq.heappush(self._heap, (expires_at, sim_id))
+        # Acordar o loop se esta for a próxima expiração
+        if self._heap[0][1] == sim_id:
+            self._wakeup.set()
+
+    def cancel(self, sim_id: str):
+        self._scheduled.pop(sim_id, None)
+
+    def pending_count(self) -> int:
+        return len(self._scheduled)
+
+    def _pop_due(self, now: datetime) -> list[str]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, sim_id = heapq.heappop(self._heap)
+            if self._scheduled.get(sim_id) == expires_at:
+                del self._scheduled[sim_id]
+                due.append(sim_id)
+        return due
+
+    async def run(self):
+        while True:
+            for sim_id in self._pop_due(datetime.utcnow()):
+                # Cada paragem corre numa task para um Docker lento não atrasar as restantes
+                task = asyncio.create_task(self._expire(sim_id))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            timeout = self.max_sleep_seconds
+            if self._heap:
+                next_delay = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+                timeout = min(max(next_delay, 0), timeout)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _expire(self, sim_id: str):
+        try:
+            await self.on_expire(sim_id)
+        except Exception as e:
+            print(f"[EXPIRY] Error expiring {sim_id}: {e}")
@@ -0,0 +1,68 @@
+import os
+import random
+import sys
+import threading
+import time
+
+# O preview corre as classes de settings do próprio simulador (mqtt-simulator-master/mqtt-simulator)
+SIMULATOR_SOURCE_DIR = os.path.abspath(os.environ.get(
+    "SIMULATOR_SOURCE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "mqtt-simulator-master", "mqtt-simulator")
+))
+
+# Os geradores usam o módulo random global: um preview com seed de cada vez para ser reproduzível
+_lock = threading.Lock()
+
+class PreviewUnavailable(Exception):
+    """O código do simulador não está disponível neste deployment da API."""
+
+class PreviewInvalid(Exception):
+    """O simulador rejeitou a config (ou falhou a gerar valores)."""
+
+    def __init__(self, message: str, errors: list[dict]):
+        super().__init__(message)
+        self.errors = errors
+
+def _load_simulator():
+    if SIMULATOR_SOURCE_DIR not in sys.path:
+        sys.path.append(SIMULATOR_SOURCE_DIR)
+    try:
+        import preview
+        from pydantic import ValidationError
+        from utils.exceptions.simulator_validation_error import SimulatorValidationError
+    except ImportError as e:
+        raise PreviewUnavailable(f"Simulator sources not found in {SIMULATOR_SOURCE_DIR}: {e}")
+    return preview, (ValidationError, SimulatorValidationError)
+
+def _error_entries(error: Exception) -> list[dict]:
+    if hasattr(error, "errors"):
+        return [
+            {"loc": entry["loc"], "msg": entry["msg"], "input": str(entry.get("input"))}
+            for entry in error.errors()
+        ]
+    return [{"loc": None, "msg": str(error), "input": None}]
+
+def run_preview(config: dict, ticks: int, seed: int | None = None) -> dict:
+    """Gera ticks payloads por tópico, sem broker nem esperas. Bloqueante: chamar numa thread."""
+    preview, validation_errors = _load_simulator()
+    with _lock:
+        if seed is not None:
+            random.seed(seed)
+        started = time.perf_counter()
+        try:
+            topics = preview.preview_topics(config, ticks)
+        except validation_errors as e:
+            raise PreviewInvalid("Invalid simulator settings", _error_entries(e))
+        except (ValueError, ArithmeticError, NameError, TypeError) as e:
+            raise PreviewInvalid("Simulator failed to generate values", _error_entries(e))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "ticks": ticks,
+        "seed": seed,
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "topics": [
+            {"topic": topic.topic_url, "time_interval": topic.time_interval, "payloads": topic.payloads}
+            for topic in topics
+        ]
+    }
@@ -0,0 +1,166 @@
+import threading
+import time
+import uuid
+from collections import deque
+import paho.mqtt.client as mqtt
+
+class SimulationMessages:
+    """Ring buffer de tamanho fixo com as últimas mensagens de uma simulação, mais contadores de taxa."""
+
+    def __init__(self, broker: tuple[str, int], prefixes: list[str], buffer_size: int, rate_window: int):
+        self.broker = broker
+        self.prefixes = prefixes
+        self.messages: deque[tuple[float, str, bytes, int, bool]] = deque(maxlen=buffer_size)
+        self.total_messages = 0
+        # Contagem por segundo (segundo, mensagens) para a taxa na janela
+        self.rate_window = rate_window
+        self.rate_buckets: deque[list[int]] = deque(maxlen=rate_window)
+
+    def add(self, timestamp: float, topic: str, payload: bytes, qos: int, retain: bool):
+        self.messages.append((timestamp, topic, payload, qos, retain))
+        self.total_messages += 1
+        second = int(timestamp)
+        if self.rate_buckets and self.rate_buckets[-1][0] == second:
+            self.rate_buckets[-1][1] += 1
+        else:
+            self.rate_buckets.append([second, 1])
+
+    def rate_per_second(self, now: float) -> float:
+        since = int(now) - self.rate_window
+        return sum(count for second, count in self.rate_buckets if second > since) / self.rate_window
+
+class BrokerTap:
+    """Uma ligação MQTT por broker, subscrita aos prefixos de todas as simulações que o usam."""
+
+    def __init__(self, host: str, port: int, lock: threading.Lock):
+        self.host = host
+        self.port = port
+        self.lock = lock
+        # prefixo -> simulações que publicam debaixo dele
+        self.prefixes: dict[str, set[str]] = {}
+        self.simulations: dict[str, SimulationMessages] = {}
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"iot-simulator-api-tap-{uuid.uuid4().hex[:8]}")
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        # Não bloqueia o pedido: DNS e ligação acontecem na thread do loop, com reconnect automático
+        self.client.connect_async(host, port)
+        self.client.loop_start()
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"[TAP] Connection to {self.host}:{self.port} failed: {reason_code}")
+            return
+        with self.lock:
+            prefixes = list(self.prefixes)
+        # Uma sessão nova não tem subscrições: voltar a subscrever tudo
+        for prefix in prefixes:
+            client.subscribe(f"{prefix}/#")
+
+    def on_message(self, client, userdata, msg):
+        now = time.time()
+        levels = msg.topic.split("/")
+        with self.lock:
+            # "prefixo/#" também apanha o próprio prefixo: procurar cada nível do tópico
+            for depth in range(1, len(levels) + 1):
+                for sim_id in self.prefixes.get("/".join(levels[:depth]), ()):
+                    self.simulations[sim_id].add(now, msg.topic, msg.payload, msg.qos, msg.retain)
+
+    def attach(self, sim_id: str, messages: SimulationMessages) -> list[str]:
+        """Regista a simulação (com o lock partilhado já adquirido) e devolve os prefixos a subscrever."""
+        self.simulations[sim_id] = messages
+        new_prefixes = []
+        for prefix in messages.prefixes:
+            if prefix not in self.prefixes:
+                self.prefixes[prefix] = set()
+                new_prefixes.append(prefix)
+            self.prefixes[prefix].add(sim_id)
+        return new_prefixes
+
+    def detach(self, sim_id: str) -> list[str]:
+        """Remove a simulação (com o lock partilhado já adquirido) e devolve os prefixos que deixaram de ter uso."""
+        messages = self.simulations.pop(sim_id, None)
+        unused_prefixes = []
+        for prefix in messages.prefixes if messages else ():
+            self.prefixes[prefix].discard(sim_id)
+            if not self.prefixes[prefix]:
+                del self.prefixes[prefix]
+                unused_prefixes.append(prefix)
+        return unused_prefixes
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+class TelemetryTap:
+    """Recebe o que as simulações publicam sem uma ligação por utilizador: uma por broker, partilhada."""
+
+    def __init__(self, buffer_size: int = 100, rate_window: int = 60):
+        self.buffer_size = buffer_size
+        self.rate_window = rate_window
+        self.lock = threading.Lock()
+        self.brokers: dict[tuple[str, int], BrokerTap] = {}
+        self.simulations: dict[str, SimulationMessages] = {}
+
+    def attach(self, sim_id: str, broker_url: str, broker_port: int, prefixes: list[str]):
+        """Começa a guardar as mensagens de uma simulação. Seguro de chamar de qualquer thread."""
+        self.detach(sim_id)
+        broker = (broker_url, broker_port)
+        messages = SimulationMessages(broker, sorted(set(p.strip("/") for p in prefixes)), self.buffer_size, self.rate_window)
+        with self.lock:
+            tap = self.brokers.get(broker)
+            if tap is None:
+                tap = self.brokers[broker] = BrokerTap(broker_url, broker_port, self.lock)
+                print(f"[TAP] Connecting to {broker_url}:{broker_port}")
+            self.simulations[sim_id] = messages
+            new_prefixes = tap.attach(sim_id, messages)
+        for prefix in new_prefixes:
+            tap.client.subscribe(f"{prefix}/#")
+
+    def detach(self, sim_id: str):
+        with self.lock:
+            messages = self.simulations.pop(sim_id, None)
+            if not messages:
+                return
+            tap = self.brokers[messages.broker]
+            unused_prefixes = tap.detach(sim_id)
+            # A ligação ao broker só existe enquanto houver simulações nele
+            is_unused = not tap.simulations
+            if is_unused:
+                del self.brokers[messages.broker]
+        if is_unused:
+            # Fora do lock: loop_stop espera pela thread do paho, que pode estar à espera do lock em on_message.
+            # E fora do event loop: com o broker inalcançável essa thread pode estar segundos no DNS/connect
+            threading.Thread(target=tap.close, daemon=True).start()
+            return
+        for prefix in unused_prefixes:
+            tap.client.unsubscribe(f"{prefix}/#")
+
+    def get(self, sim_id: str) -> SimulationMessages | None:
+        with self.lock:
+            return self.simulations.get(sim_id)
+
+    def simulation_ids(self) -> list[str]:
+        with self.lock:
+            return list(self.simulations)
+
+    def recent(self, sim_id: str, limit: int) -> list[tuple[float, str, bytes, int, bool]] | None:
+        with self.lock:
+            messages = self.simulations.get(sim_id)
+            return list(messages.messages)[-limit:] if messages else None
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self.lock:
+            return {
+                "brokers": len(self.brokers),
+                "simulations": len(self.simulations),
+                "messages_per_second": round(sum(m.rate_per_second(now) for m in self.simulations.values()), 3)
+            }
+
+    def close(self):
+        with self.lock:
+            taps = list(self.brokers.values())
+            self.brokers.clear()
+            self.simulations.clear()
+        for tap in taps:
+            tap.close()
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import Simulation, UsageOffset, add_usage
+
+# Nome do ficheiro escrito pelo simulador (--usage-file) dentro da pasta de cada simulação
+USAGE_FILE = "usage.jsonl"
+
+def _read_new_lines(path: str, offset: int) -> tuple[list[str], int]:
+    """Linhas completas a partir de offset; uma linha a meio de ser escrita fica para a próxima leitura."""
+    with open(path, "rb") as usage_file:
+        usage_file.seek(offset)
+        data = usage_file.read()
+    end = data.rfind(b"\n") + 1
+    return data[:end].decode("utf-8").splitlines(), offset + end
+
+def _aggregate_by_minute(lines: list[str]) -> dict[datetime, tuple[int, int]]:
+    minutes: dict[datetime, tuple[int, int]] = {}
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        # Um flush cobre no máximo alguns segundos: conta todo no minuto em que foi escrito
+        minute = datetime.utcfromtimestamp(entry["end"] // 60 * 60)
+        messages, size = minutes.get(minute, (0, 0))
+        for topic_messages, topic_bytes in entry["topics"].values():
+            messages += topic_messages
+            size += topic_bytes
+        minutes[minute] = (messages, size)
+    return minutes
+
+class UsageIngestor:
+    """Agrega na BD (usage_minutes) os ficheiros de uso escritos pelos containers do simulador.
+
+    Cada simulação tem uma pasta <directory>/<simulation_id> montada no container. O offset lido é
+    guardado na mesma transação que os totais, por isso um restart nunca conta um flush duas vezes.
+    """
+
+    def __init__(self, directory: str, cleanup_after: timedelta = timedelta(minutes=2)):
+        # Caminho absoluto: é usado como origem do bind mount do container
+        self.directory = os.path.abspath(directory)
+        self.cleanup_after = cleanup_after
+        os.makedirs(self.directory, exist_ok=True)
+
+    def directory_for(self, sim_id: str) -> str:
+        return os.path.join(self.directory, sim_id)
+
+    async def ingest(self, db: AsyncSession) -> int:
+        """Lê o que os simuladores escreveram desde a última vez. Devolve o número de flushes agregados."""
+        sim_ids = await asyncio.to_thread(os.listdir, self.directory)
+        flushes = 0
+        for sim_id in sim_ids:
+            try:
+                flushes += await self._ingest_simulation(db, sim_id)
+            except Exception as e:
+                await db.rollback()
+                print(f"[USAGE] Error ingesting {sim_id}: {e}")
+        return flushes
+
+    async def _ingest_simulation(self, db: AsyncSession, sim_id: str) -> int:
+        simulation = await db.scalar(select(Simulation).where(Simulation.simulation_id == sim_id))
+        if not simulation:
+            # O container arranca antes de a linha ser gravada: só uma pasta antiga é lixo
+            if await asyncio.to_thread(self._is_older_than, sim_id, self.cleanup_after):
+                await self._remove(db, sim_id)
+            return 0
+
+        path = os.path.join(self.directory_for(sim_id), USAGE_FILE)
+        flushes = 0
+        if os.path.exists(path):
+            usage_offset = await db.get(UsageOffset, sim_id)
+            offset = usage_offset.offset if usage_offset else 0
+            lines, new_offset = await asyncio.to_thread(_read_new_lines, path, offset)
+            if new_offset != offset:
+                await add_usage(db, sim_id, simulation.tenant_id, _aggregate_by_minute(lines))
+                if usage_offset:
+                    usage_offset.offset = new_offset
+                else:
+                    db.add(UsageOffset(simulation_id=sim_id, offset=new_offset))
+                await db.commit()
+                flushes = len(lines)
+
+        # Terminada há algum tempo: o último flush (escrito no SIGTERM) já foi lido
+        if simulation.stopped_at and simulation.stopped_at < datetime.utcnow() - self.cleanup_after:
+            await self._remove(db, sim_id)
+        return flushes
+
+    def _is_older_than(self, sim_id: str, age: timedelta) -> bool:
+        modified_at = datetime.utcfromtimestamp(os.path.getmtime(self.directory_for(sim_id)))
+        return modified_at < datetime.utcnow() - age
+
+    async def _remove(self, db: AsyncSession, sim_id: str):
+        await db.execute(delete(UsageOffset).where(UsageOffset.simulation_id == sim_id))
+        await db.commit()
+        await asyncio.to_thread(shutil.rmtree, self.directory_for(sim_id), True)
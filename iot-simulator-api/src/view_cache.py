@@ -0,0 +1,108 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+class CachedView(NamedTuple):
+    etag: str
+    body: bytes
+    headers: dict[str, str]
+
+class TTLCache:
+    """LRU com tempo de vida por entrada."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Any, tuple[float, CachedView]] = OrderedDict()
+
+    def get(self, key) -> CachedView | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, view = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return view
+
+    def set(self, key, view: CachedView, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, view)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class ViewCache:
+    """Respostas já serializadas de GET /simulations e /simulations/{id}, invalidadas em cada mudança de status."""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        running_ttl: float = 2.0,
+        final_ttl: float = 300.0,
+        list_ttl: float = 30.0
+    ):
+        # Uma simulação a correr tem logs e status do container que mudam sem passar pela API: TTL curto.
+        # Depois de parar a vista só muda se a linha mudar, e isso passa sempre por invalidate()
+        self.running_ttl = running_ttl
+        self.final_ttl = final_ttl
+        self.list_ttl = list_ttl
+        self.details = TTLCache(max_entries)
+        self.lists = TTLCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+        # Incrementado em cada invalidação: uma vista calculada antes de uma mudança de status não é guardada
+        self.generation = 0
+
+    @staticmethod
+    def render(content: Any, headers: dict[str, str] | None = None) -> CachedView:
+        # Mesmo formato que o JSONResponse do FastAPI
+        body = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        return CachedView(etag, body, headers or {})
+
+    def _count(self, view: CachedView | None) -> CachedView | None:
+        if view is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return view
+
+    def get_detail(self, sim_id: str) -> CachedView | None:
+        return self._count(self.details.get(sim_id))
+
+    def set_detail(self, sim_id: str, view: CachedView, is_running: bool, generation: int):
+        if generation == self.generation:
+            self.details.set(sim_id, view, self.running_ttl if is_running else self.final_ttl)
+
+    def get_list(self, key: tuple) -> CachedView | None:
+        return self._count(self.lists.get(key))
+
+    def set_list(self, key: tuple, view: CachedView, generation: int):
+        if generation == self.generation:
+            self.lists.set(key, view, self.list_ttl)
+
+    def invalidate(self, sim_id: str | None = None):
+        """Chamado em cada criação/mudança de status. As listagens podem conter qualquer simulação: limpam-se todas."""
+        self.generation += 1
+        if sim_id is not None:
+            self.details.pop(sim_id)
+        self.lists.clear()
+
+    def stats(self) -> dict:
+        return {
+            "details": len(self.details),
+            "lists": len(self.lists),
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,353 @@
+"""
+Aggregation
+
+Incremental window rollups (count, sum, min, max, mean) per station and field,
+fed by the ingestion writer. Each window keeps a fixed amount of state per
+station and field, whatever the message rate:
+
+- tumbling windows (1m, 1h, 1d, ...) keep one running aggregate for the
+  current window; "total" never closes and replaces the accumulated totals
+- sliding windows (15m/1m: 15 minutes, moving every minute) keep one aggregate
+  per step ("pane") and merge the panes of the window when a pane closes
+
+Windows are aligned to the epoch (UTC) and use the receive time. The ingestion
+advances them to the time of each buffer swap, which no message of the later
+batches is older than. A value for a window that was already closed anyway
+(after the clock stepped back, say) is late: it is counted and left out, so a
+complete window is never reopened and overwritten by a partial one. Closed windows
+are stored in the window_aggregates table; the open ones are stored there too,
+as incomplete rows, so reports can read the current day or the running totals
+without scanning the readings. The state of the open windows is checkpointed in
+the aggregation_checkpoints table in the same transaction, and restored on start.
+"""
+
+import json
+import re
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import NamedTuple
+
+DURATION_PATTERN = re.compile(r"^(\d+)([smhd])$")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+TOTAL_WINDOW = "total"
+DEFAULT_WINDOWS = ("1m", "1h", "1d", "15m/1m", TOTAL_WINDOW)
+
+
+class Aggregate:
+    __slots__ = ("count", "total", "minimum", "maximum")
+
+    def __init__(self, count: int = 0, total: float = 0.0, minimum: float = 0.0, maximum: float = 0.0):
+        self.count = count
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def add(self, value: float) -> None:
+        if self.count == 0:
+            self.minimum = self.maximum = value
+        elif value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+        self.count += 1
+        self.total += value
+
+    def merge(self, other: "Aggregate") -> None:
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.minimum, self.maximum = other.minimum, other.maximum
+        else:
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+        self.count += other.count
+        self.total += other.total
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_list(self) -> list:
+        return [self.count, self.total, self.minimum, self.maximum]
+
+
+class WindowResult(NamedTuple):
+    window: str
+    station: str
+    field: str
+    start: float
+    end: float | None
+    aggregate: Aggregate
+    is_complete: bool
+
+
+def parse_duration(text: str) -> int:
+    match = DURATION_PATTERN.match(text)
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"invalid duration '{text}', expected a number followed by s, m, h or d (e.g. 15m)")
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+class TumblingWindow:
+    def __init__(self, name: str, size: int | None):
+        self.name = name
+        # None is the "total" window, which never closes
+        self.size = size
+        self.current: dict[tuple[str, str], tuple[float, Aggregate]] = {}
+        # every window ending at or before it was closed, for all the stations and fields
+        self.closed_until = 0.0
+
+    def window_start(self, timestamp: float) -> float:
+        return 0.0 if self.size is None else timestamp // self.size * self.size
+
+    def add(self, station: str, field: str, timestamp: float, value: float, closed: list[WindowResult]) -> bool:
+        """Adds the value to its window. Returns False if the value is late: its window was already closed."""
+        key = (station, field)
+        start = self.window_start(timestamp)
+        entry = self.current.get(key)
+        if self.size is not None and (start + self.size <= self.closed_until or (entry and start < entry[0])):
+            return False
+        if entry is None or start > entry[0]:
+            if entry is not None:
+                closed.append(self.result(key, *entry, True))
+            entry = self.current[key] = (start, Aggregate())
+        entry[1].add(value)
+        return True
+
+    def advance(self, watermark: float, closed: list[WindowResult]) -> None:
+        if self.size is None:
+            return
+        self.closed_until = max(self.closed_until, watermark // self.size * self.size)
+        for key, (start, aggregate) in list(self.current.items()):
+            if start + self.size <= watermark:
+                closed.append(self.result(key, start, aggregate, True))
+                del self.current[key]
+
+    def result(self, key: tuple[str, str], start: float, aggregate: Aggregate, is_complete: bool) -> WindowResult:
+        end = None if self.size is None else start + self.size
+        return WindowResult(self.name, key[0], key[1], start, end, aggregate, is_complete)
+
+    def open_results(self) -> list[WindowResult]:
+        return [self.result(key, start, aggregate, False) for key, (start, aggregate) in self.current.items()]
+
+    def state(self) -> dict:
+        return {
+            f"{station}/{field}": [start, *aggregate.to_list()]
+            for (station, field), (start, aggregate) in self.current.items()
+        }
+
+    def restore(self, state: dict) -> None:
+        for key, (start, *values) in state.items():
+            station, field = key.rsplit("/", 1)
+            self.current[(station, field)] = (start, Aggregate(*values))
+
+
+class SlidingWindow:
+    """A window of size seconds emitted every step seconds, merged from the size / step last panes."""
+
+    def __init__(self, name: str, size: int, step: int):
+        if size % step != 0:
+            raise ValueError(f"invalid window '{name}', the size must be a multiple of the step")
+        self.name = name
+        self.size = size
+        self.step = step
+        self.panes: dict[tuple[str, str], deque[tuple[float, Aggregate]]] = {}
+        # end of the next window to emit, per station and field
+        self.next_end: dict[tuple[str, str], float] = {}
+        # every window ending at or before it was closed, for all the stations and fields
+        self.closed_until = 0.0
+
+    def add(self, station: str, field: str, timestamp: float, value: float, closed: list[WindowResult]) -> bool:
+        """Adds the value to its pane. Returns False if the value is late: the first window with the pane was closed."""
+        key = (station, field)
+        pane_start = timestamp // self.step * self.step
+        pane_end = pane_start + self.step
+        if pane_end <= self.closed_until or pane_end < self.next_end.get(key, pane_end):
+            return False
+        panes = self.panes.get(key)
+        if panes is None:
+            panes = self.panes[key] = deque()
+            self.next_end[key] = pane_end
+        elif panes and pane_start > panes[-1][0]:
+            # every window ending at or before the new pane is complete
+            self.close_windows(key, panes, pane_start, closed)
+        if not panes or pane_start > panes[-1][0]:
+            if not panes:
+                self.next_end[key] = max(self.next_end[key], pane_end)
+            panes.append((pane_start, Aggregate()))
+        # next_end is past the last pane, so a value that isn't late is always in it
+        panes[-1][1].add(value)
+        return True
+
+    def close_windows(self, key: tuple[str, str], panes: deque, until: float, closed: list[WindowResult]) -> None:
+        end = self.next_end[key]
+        while panes and end <= until:
+            start = end - self.size
+            while panes and panes[0][0] < start:
+                panes.popleft()
+            if not panes:
+                break
+            if panes[0][0] >= end:
+                # no values in this window: skip to the first window with the next pane
+                end = panes[0][0] + self.step
+                continue
+            aggregate = Aggregate()
+            for pane_start, pane in panes:
+                if pane_start >= end:
+                    break
+                aggregate.merge(pane)
+            closed.append(WindowResult(self.name, key[0], key[1], start, end, aggregate, True))
+            end += self.step
+        self.next_end[key] = end
+
+    def advance(self, watermark: float, closed: list[WindowResult]) -> None:
+        self.closed_until = max(self.closed_until, watermark // self.step * self.step)
+        for key, panes in list(self.panes.items()):
+            self.close_windows(key, panes, watermark, closed)
+            if not panes:
+                del self.panes[key]
+                del self.next_end[key]
+
+    def open_results(self) -> list[WindowResult]:
+        # the next window to emit, with the panes received so far
+        results = []
+        for key, panes in self.panes.items():
+            end = self.next_end[key]
+            aggregate = Aggregate()
+            for pane_start, pane in panes:
+                if end - self.size <= pane_start < end:
+                    aggregate.merge(pane)
+            if aggregate.count:
+                results.append(WindowResult(self.name, key[0], key[1], end - self.size, end, aggregate, False))
+        return results
+
+    def state(self) -> dict:
+        return {
+            f"{station}/{field}": [
+                self.next_end[(station, field)],
+                [[start, *aggregate.to_list()] for start, aggregate in panes],
+            ]
+            for (station, field), panes in self.panes.items()
+        }
+
+    def restore(self, state: dict) -> None:
+        for key, (next_end, panes) in state.items():
+            station, field = key.rsplit("/", 1)
+            self.panes[(station, field)] = deque((start, Aggregate(*values)) for start, *values in panes)
+            self.next_end[(station, field)] = next_end
+
+
+def create_window(spec: str) -> TumblingWindow | SlidingWindow:
+    if spec == TOTAL_WINDOW:
+        return TumblingWindow(spec, None)
+    if "/" in spec:
+        size, step = spec.split("/", 1)
+        return SlidingWindow(spec, parse_duration(size), parse_duration(step))
+    return TumblingWindow(spec, parse_duration(spec))
+
+
+def iso_timestamp(timestamp: float | None) -> str | None:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class Aggregator:
+    def __init__(self, path: Path, fields: tuple[str, ...], windows: list[str], checkpoint_interval: float = 10.0):
+        self.path = path
+        self.fields = fields
+        self.windows = [create_window(spec) for spec in windows]
+        self.checkpoint_interval = checkpoint_interval
+        self.watermark = 0.0
+        # values left out of a window that was already closed, one per window
+        self.late_count = 0
+        self._closed: list[WindowResult] = []
+        self._last_checkpoint = time.monotonic()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS window_aggregates ("
+            "window TEXT NOT NULL, station TEXT NOT NULL, field TEXT NOT NULL, "
+            "window_start TEXT NOT NULL, window_end TEXT, "
+            "count INTEGER NOT NULL, sum REAL NOT NULL, min REAL NOT NULL, max REAL NOT NULL, mean REAL NOT NULL, "
+            "complete INTEGER NOT NULL, PRIMARY KEY (window, station, field, window_start))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS aggregation_checkpoints ("
+            "window TEXT PRIMARY KEY, watermark REAL NOT NULL, state TEXT NOT NULL, updated_at TEXT NOT NULL)"
+        )
+        self.connection.commit()
+        self.restore()
+
+    def restore(self) -> None:
+        rows = {
+            window: (watermark, state)
+            for window, watermark, state in self.connection.execute(
+                "SELECT window, watermark, state FROM aggregation_checkpoints"
+            )
+        }
+        for window in self.windows:
+            if window.name in rows:
+                watermark, state = rows[window.name]
+                window.restore(json.loads(state))
+                self.watermark = max(self.watermark, watermark)
+        # the windows closed before the checkpoint are closed again: late values can't reopen them
+        self.advance(self.watermark)
+
+    def add(self, timestamp: float, station: str, values: tuple[float | None, ...]) -> None:
+        closed = self._closed
+        for field, value in zip(self.fields, values):
+            if value is None:
+                continue
+            for window in self.windows:
+                if not window.add(station, field, timestamp, value, closed):
+                    self.late_count += 1
+        if timestamp > self.watermark:
+            self.watermark = timestamp
+
+    def advance(self, watermark: float) -> None:
+        self.watermark = max(self.watermark, watermark)
+        for window in self.windows:
+            window.advance(self.watermark, self._closed)
+
+    def is_checkpoint_due(self) -> bool:
+        return time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+
+    def checkpoint(self) -> int:
+        """Stores the closed windows, the open ones and their state in one transaction. Returns the rows written."""
+        results = self._closed + [result for window in self.windows for result in window.open_results()]
+        rows = [
+            (
+                result.window, result.station, result.field, iso_timestamp(result.start), iso_timestamp(result.end),
+                result.aggregate.count, result.aggregate.total, result.aggregate.minimum, result.aggregate.maximum,
+                result.aggregate.mean, int(result.is_complete),
+            )
+            for result in results
+        ]
+        updated_at = iso_timestamp(time.time())
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO window_aggregates "
+                "(window, station, field, window_start, window_end, count, sum, min, max, mean, complete) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO aggregation_checkpoints (window, watermark, state, updated_at) VALUES (?, ?, ?, ?)",
+                [
+                    (window.name, self.watermark, json.dumps(window.state(), separators=(",", ":")), updated_at)
+                    for window in self.windows
+                ],
+            )
+        self._closed = []
+        self._last_checkpoint = time.monotonic()
+        return len(rows)
+
+    def close(self) -> None:
+        self.checkpoint()
+        self.connection.close()
@@ -13,7 +13,11 @@ from typing import Any
 
 from azure.iot.device.aio import IoTHubDeviceClient
 from azure.iot.device import Message
+from connection_ramp import ConnectionRamp, first_tick, retry_delay
+from profiler import TopicProfile
 from settings_classes import BrokerSettings, ClientSettings, DataSettings
+from stream_log import StreamLogWriter
+from usage_meter import UsageMeter
 
 
 class AzurePublisher(threading.Thread):
@@ -32,6 +36,11 @@ class AzurePublisher(threading.Thread):
         topic_payload_root: dict[str, Any],
         client_settings: ClientSettings,
         is_verbose: bool,
+        stream_recorder: StreamLogWriter | None = None,
+        usage_meter: UsageMeter | None = None,
+        profile: TopicProfile | None = None,
+        connection_ramp: ConnectionRamp | None = None,
+        tick_phase: float | None = None,
     ):
         threading.Thread.__init__(self)
         # Set as daemon thread to allow clean program exit
@@ -43,9 +52,16 @@ class AzurePublisher(threading.Thread):
         self.topic_payload_root = topic_payload_root
         self.client_settings = client_settings
         self.is_verbose = is_verbose
+        self.stream_recorder = stream_recorder
+        self.usage = usage_meter.counter(topic_url) if usage_meter is not None else None
+        self.profile = profile
+        self.connection_ramp = connection_ramp
+        self.tick_phase = tick_phase
 
         self.loop = False
+        self._stop_event = threading.Event()
         self.payload: dict[str, Any] | None = None
+        self.published_count = 0
         self.client: IoTHubDeviceClient | None = None
         self.event_loop: asyncio.AbstractEventLoop | None = None
 
@@ -75,6 +91,10 @@ class AzurePublisher(threading.Thread):
 
     async def connect_async(self):
         """Async connection to Azure IoT Hub."""
+        if self.connection_ramp is not None:
+            # the slot wait blocks, off the event loop so the other tasks of the thread keep running
+            if not await asyncio.to_thread(self.connection_ramp.acquire, self._stop_event):
+                raise RuntimeError("Publisher stopped while waiting to connect")
         self.client = self.create_client()
         await self.client.connect()
         print(f"Connected to Azure IoT Hub for topic: {self.topic_url}")
@@ -104,7 +124,10 @@ class AzurePublisher(threading.Thread):
             raise RuntimeError("Client not connected")
 
         # Create message with JSON payload
-        message = Message(json.dumps(payload))
+        encoding_started = time.perf_counter_ns()
+        payload_json = json.dumps(payload)
+        encoded = time.perf_counter_ns()
+        message = Message(payload_json)
         message.content_encoding = "utf-8"
         message.content_type = "application/json"
 
@@ -117,12 +140,24 @@ class AzurePublisher(threading.Thread):
                 self.client.send_message(message),
                 timeout=30.0  # 30 second timeout
             )
+            # send_message returns once the hub acknowledged the message: the publish phase includes the ack
+            published = time.perf_counter_ns()
+
+            self.published_count += 1
+            if self.usage is not None:
+                self.usage.add(len(payload_json))
+            if self.stream_recorder is not None:
+                self.stream_recorder.append(self.topic_url, payload_json.encode("utf-8"))
 
             # Log publish event
             on_publish_log = f"[{time.strftime('%H:%M:%S')}] Telemetry sent to Azure IoT Hub: {self.topic_url}"
             if self.is_verbose:
                 on_publish_log += f"\n\t[payload] {json.dumps(payload)}"
             print(on_publish_log)
+            if self.profile is not None:
+                self.profile.encoding.add(encoded - encoding_started)
+                self.profile.publish.add(published - encoded)
+                self.profile.logging.add(time.perf_counter_ns() - published)
 
         except asyncio.TimeoutError:
             raise Exception(f"Timeout sending message to Azure IoT Hub for {self.topic_url}")
@@ -132,7 +167,8 @@ class AzurePublisher(threading.Thread):
     async def publish_loop_async(self):
         """Main async publishing loop with reconnection handling."""
         max_retries = 3
-        retry_delay = 5
+        min_delay = self.broker_settings.connect_retry_min_delay
+        max_delay = self.broker_settings.connect_retry_max_delay
 
         # Initial connection with retries
         for attempt in range(max_retries):
@@ -140,18 +176,25 @@ class AzurePublisher(threading.Thread):
                 await self.connect_async()
                 break
             except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"Connection attempt {attempt + 1} failed: {e}. Retrying in {retry_delay}s...")
-                    await asyncio.sleep(retry_delay)
+                if attempt < max_retries - 1 and self.loop:
+                    delay = retry_delay(attempt, min_delay, max_delay)
+                    print(f"Connection attempt {attempt + 1} failed: {e}. Retrying in {delay:.1f}s...")
+                    await asyncio.sleep(delay)
                 else:
                     print(f"Failed to connect after {max_retries} attempts: {e}")
                     return
 
+        # first publish at the tick phase of the topic, so the topics don't all send together
+        await asyncio.sleep(first_tick(self.tick_phase, self.client_settings.time_interval) - time.monotonic())
+
         try:
             while self.loop:
+                generation_started = time.perf_counter_ns()
                 self.payload = self.generate_payload()
                 if self.payload is None:
                     break
+                if self.profile is not None:
+                    self.profile.generation.add(time.perf_counter_ns() - generation_started)
 
                 try:
                     await self.send_telemetry_async(self.payload)
@@ -163,7 +206,7 @@ class AzurePublisher(threading.Thread):
                         # Shutdown old client
                         if self.client:
                             await self.client.shutdown()
-                        await asyncio.sleep(2)
+                        await asyncio.sleep(retry_delay(1, min_delay, max_delay))
                         # Create and connect new client
                         await self.connect_async()
                         print(f"Reconnected successfully for {self.topic_url}")
@@ -211,6 +254,7 @@ class AzurePublisher(threading.Thread):
     def stop(self):
         """Stop the publisher."""
         self.loop = False
+        self._stop_event.set()
 
     def generate_payload(self) -> dict[str, Any] | None:
         """
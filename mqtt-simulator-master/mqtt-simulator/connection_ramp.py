@@ -0,0 +1,62 @@
+"""
+Connection Ramp
+
+Spreads the connections and the ticks of the publishers, which otherwise all
+connect in the same instant and publish in lockstep every time interval:
+
+- ConnectionRamp spaces the connection attempts of all the publishers of a
+  settings file to a maximum rate, retries and reconnects included
+- retry_delay is an exponential backoff with full jitter, so the publishers
+  that failed together don't retry together
+- tick_phases places the topics of a topic entry evenly across its time
+  interval, aligned to the wall clock, so simulators on several nodes (or
+  restarted ones) keep the same phases
+
+The jitter uses its own random generator: --seed only makes the generated data
+reproducible, and retries must not consume values from it.
+"""
+
+import random
+import threading
+import time
+import zlib
+
+_jitter = random.Random()
+
+
+class ConnectionRamp:
+    def __init__(self, rate: float):
+        # rate 0 doesn't limit the connections
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event: threading.Event) -> bool:
+        """Waits for the next connection slot. Returns False if stop_event was set meanwhile."""
+        if self.interval == 0:
+            return not stop_event.is_set()
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        return not stop_event.wait(slot - now)
+
+
+def retry_delay(attempt: int, min_delay: float, max_delay: float) -> float:
+    # the first retry already waits between min_delay and twice it; the exponent is capped so hours of
+    # failed attempts don't overflow the float (2**32 times min_delay is past any max_delay anyway)
+    return _jitter.uniform(min_delay, min(max_delay, min_delay * 2 ** min(attempt + 1, 32)))
+
+
+def tick_phases(prefix: str, topic_count: int, time_interval: float) -> list[float]:
+    """Offset in seconds within the time interval of each topic of a topic entry."""
+    # topic entries with the same interval get different offsets, single topics included
+    entry_offset = zlib.crc32(prefix.encode("utf-8")) / 2**32
+    return [(index + entry_offset) / topic_count * time_interval for index in range(topic_count)]
+
+
+def first_tick(tick_phase: float | None, time_interval: float) -> float:
+    """time.monotonic() of the first tick: now, or the next time the wall clock is at the phase."""
+    if tick_phase is None or time_interval <= 0:
+        return time.monotonic()
+    return time.monotonic() + (tick_phase - time.time()) % time_interval
@@ -0,0 +1,148 @@
+"""
+Coordinator
+
+Splits the topic URLs of one settings file across worker nodes connected over
+TCP, using a consistent hash ring so that a worker joining or leaving only
+moves the topics that hash to it. Workers report their metrics periodically and
+the coordinator prints the aggregated cluster metrics.
+"""
+
+import socket
+import threading
+import time
+from typing import Any
+
+from utils.cluster_messages import ClusterConnection
+from utils.consistent_hash_ring import ConsistentHashRing
+from utils.read_publishers import read_topic_urls
+
+METRICS_INTERVAL = 10
+
+
+class Coordinator(threading.Thread):
+    def __init__(self, settings: dict[str, Any], address: tuple[str, int], is_verbose: bool):
+        threading.Thread.__init__(self)
+
+        self.settings = settings
+        self.address = address
+        self.is_verbose = is_verbose
+        # shown by the Simulator in place of a topic
+        self.topic_url = f"coordinator on {address[0]}:{address[1]}"
+
+        self.topic_urls = read_topic_urls(settings)
+        self.ring = ConsistentHashRing()
+        self.workers: dict[str, ClusterConnection] = {}
+        self.worker_topics: dict[str, set[str]] = {}
+        self.worker_metrics: dict[str, dict[str, Any]] = {}
+
+        self.loop = False
+        self._lock = threading.Lock()
+        self._last_published_count = 0
+        self._server_socket = socket.create_server(address)
+
+    def run(self):
+        self.loop = True
+        self._server_socket.settimeout(1.0)
+        print(f"Coordinator listening on {self.address[0]}:{self.address[1]} ({len(self.topic_urls)} topics)")
+        next_report = time.monotonic() + METRICS_INTERVAL
+        while self.loop:
+            try:
+                worker_socket, _ = self._server_socket.accept()
+                worker_socket.settimeout(None)
+                threading.Thread(target=self.handle_worker, args=(worker_socket,), daemon=True).start()
+            except socket.timeout:
+                pass
+            except OSError:
+                break
+            if time.monotonic() >= next_report:
+                self.print_metrics()
+                next_report += METRICS_INTERVAL
+
+    def stop(self):
+        self.loop = False
+        self._server_socket.close()
+        with self._lock:
+            for connection in self.workers.values():
+                connection.close()
+
+    def handle_worker(self, worker_socket: socket.socket):
+        connection = ClusterConnection(worker_socket)
+        worker_id: str | None = None
+        try:
+            hello = connection.receive()
+            if hello is None or hello.get("type") != "hello":
+                return
+            worker_id = hello["worker_id"]
+            connection.send({"type": "settings", "settings": self.settings})
+            with self._lock:
+                self.workers[worker_id] = connection
+                self.worker_topics[worker_id] = set()
+                self.ring.add_node(worker_id)
+                self.rebalance()
+            print(f"Worker joined: {worker_id}")
+            while (message := connection.receive()) is not None:
+                if message.get("type") == "metrics":
+                    with self._lock:
+                        self.worker_metrics[worker_id] = message
+        except (OSError, ValueError) as e:
+            if self.loop:
+                print(f"Worker connection error ({worker_id}): {e}")
+        finally:
+            connection.close()
+            if worker_id is not None and self.loop:
+                print(f"Worker left: {worker_id}")
+                with self._lock:
+                    self.workers.pop(worker_id, None)
+                    self.worker_topics.pop(worker_id, None)
+                    self.ring.remove_node(worker_id)
+                    self.rebalance()
+
+    def rebalance(self):
+        # must be called with the lock held, workers only receive the topics that changed owner
+        moved_count = 0
+        for worker_id, topics in self.ring.assign(self.topic_urls).items():
+            new_topics = set(topics)
+            old_topics = self.worker_topics.get(worker_id, set())
+            added = new_topics - old_topics
+            removed = old_topics - new_topics
+            if not added and not removed:
+                continue
+            moved_count += len(added)
+            try:
+                self.workers[worker_id].send({"type": "assign", "add": sorted(added), "remove": sorted(removed)})
+                self.worker_topics[worker_id] = new_topics
+            except OSError as e:
+                print(f"Failed to send assignment to {worker_id}: {e}")
+        print(f"Rebalanced {len(self.topic_urls)} topics over {len(self.workers)} workers ({moved_count} moved)")
+
+    def get_metrics(self) -> dict[str, Any]:
+        with self._lock:
+            workers = {
+                worker_id: {
+                    "topics": len(self.worker_topics.get(worker_id, ())),
+                    "published": self.worker_metrics.get(worker_id, {}).get("published", 0),
+                    "queued": self.worker_metrics.get(worker_id, {}).get("queued", 0),
+                    "spool_bytes": self.worker_metrics.get(worker_id, {}).get("spool_bytes", 0),
+                }
+                for worker_id in self.workers
+            }
+        return {
+            "workers": workers,
+            "topics": sum(worker["topics"] for worker in workers.values()),
+            "published": sum(worker["published"] for worker in workers.values()),
+            "queued": sum(worker["queued"] for worker in workers.values()),
+            "spool_bytes": sum(worker["spool_bytes"] for worker in workers.values()),
+        }
+
+    def print_metrics(self):
+        metrics = self.get_metrics()
+        rate = max(metrics["published"] - self._last_published_count, 0) / METRICS_INTERVAL
+        self._last_published_count = metrics["published"]
+        print(
+            f"[{time.strftime('%H:%M:%S')}] Cluster: {len(metrics['workers'])} workers, "
+            f"{metrics['topics']} topics, {metrics['published']} published ({rate:.1f} msg/s)"
+            + (f", {metrics['queued']} queued ({metrics['spool_bytes']} bytes on disk)" if metrics["queued"] else "")
+        )
+        if self.is_verbose:
+            for worker_id, worker in metrics["workers"].items():
+                print(f"\t[{worker_id}] {worker['topics']} topics, {worker['published']} published")
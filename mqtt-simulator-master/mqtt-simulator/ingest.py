@@ -0,0 +1,241 @@
+import argparse
+import signal
+import sys
+import time
+from json import JSONDecodeError
+from pathlib import Path
+
+from aggregation import DEFAULT_WINDOWS, Aggregator, create_window
+from ingestion import (
+    DEFAULT_FIELDS,
+    DEFAULT_TOPIC,
+    AggregationSink,
+    Ingestion,
+    ParquetSink,
+    SqliteSink,
+    validate_fields,
+)
+from pydantic import ValidationError as PydanticValidationError
+from utils.print_validation_error import print_validation_error
+from utils.read_publishers import read_broker_settings
+
+
+def default_settings() -> Path:
+    base_folder = Path(__file__).resolve().parent.parent
+    settings_file = base_folder / "config/settings_mqtt_localhost.json"
+    return settings_file
+
+
+def is_valid_file(arg: str) -> Path:
+    settings_file = Path(arg)
+    if not settings_file.is_file():
+        raise argparse.ArgumentTypeError(f"argument -f/--file: can't open '{arg}'")
+    return settings_file
+
+
+def is_positive_int(arg: str) -> int:
+    value = int(arg)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("must be a positive integer")
+    return value
+
+
+def is_positive_float(arg: str) -> float:
+    value = float(arg)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("must be a positive number of seconds")
+    return value
+
+
+def is_valid_fields(arg: str) -> tuple[str, ...]:
+    try:
+        return validate_fields([field.strip() for field in arg.split(",") if field.strip()])
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def is_valid_windows(arg: str) -> tuple[str, ...]:
+    windows = tuple(window.strip() for window in arg.split(",") if window.strip())
+    try:
+        for window in windows:
+            create_window(window)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return windows
+
+
+parser = argparse.ArgumentParser(description="Store the messages of the station topics in SQLite (and Parquet) in batches")
+parser.add_argument(
+    "-f",
+    "--file",
+    dest="settings_file",
+    type=is_valid_file,
+    help="settings file with the broker to subscribe to",
+    default=default_settings(),
+    metavar="",
+)
+parser.add_argument(
+    "-t",
+    "--topic",
+    dest="topics",
+    action="append",
+    help=f"topic filter to subscribe to, can be repeated (default: {DEFAULT_TOPIC})",
+    default=None,
+    metavar="",
+)
+parser.add_argument(
+    "--qos",
+    dest="qos",
+    type=int,
+    choices=(0, 1, 2),
+    help="subscription QoS (default: 0)",
+    default=0,
+    metavar="",
+)
+parser.add_argument(
+    "--db",
+    dest="db_file",
+    type=Path,
+    help="SQLite database, the readings table is created if missing (default: readings.db)",
+    default=Path("readings.db"),
+    metavar="",
+)
+parser.add_argument(
+    "--no-readings",
+    dest="is_readings_disabled",
+    action="store_true",
+    help="don't store the raw messages in the readings table",
+    default=False
+)
+parser.add_argument(
+    "--aggregate",
+    dest="is_aggregate_enabled",
+    action="store_true",
+    help="keep window aggregates per station and field in the window_aggregates table of --db",
+    default=False
+)
+parser.add_argument(
+    "--windows",
+    dest="windows",
+    type=is_valid_windows,
+    help=f"comma separated tumbling (1h) and sliding (15m/1m) windows (default: {','.join(DEFAULT_WINDOWS)})",
+    default=DEFAULT_WINDOWS,
+    metavar="",
+)
+parser.add_argument(
+    "--checkpoint-interval",
+    dest="checkpoint_interval",
+    type=is_positive_float,
+    help="seconds between checkpoints of the window aggregates (default: 10)",
+    default=10.0,
+    metavar="",
+)
+parser.add_argument(
+    "--parquet-dir",
+    dest="parquet_dir",
+    type=Path,
+    help="also write Parquet files partitioned by station and day to this folder (requires pyarrow)",
+    default=None,
+    metavar="",
+)
+parser.add_argument(
+    "--fields",
+    dest="fields",
+    type=is_valid_fields,
+    help=f"comma separated payload fields stored as numeric columns (default: {','.join(DEFAULT_FIELDS)})",
+    default=DEFAULT_FIELDS,
+    metavar="",
+)
+parser.add_argument(
+    "--batch-size",
+    dest="batch_size",
+    type=is_positive_int,
+    help="write as soon as this many messages are buffered (default: 1000)",
+    default=1000,
+    metavar="",
+)
+parser.add_argument(
+    "--flush-interval",
+    dest="flush_interval",
+    type=is_positive_float,
+    help="seconds between SQLite writes when the batch isn't full (default: 1)",
+    default=1.0,
+    metavar="",
+)
+parser.add_argument(
+    "--parquet-interval",
+    dest="parquet_interval",
+    type=is_positive_float,
+    help="seconds between Parquet files of each partition (default: 60)",
+    default=60.0,
+    metavar="",
+)
+parser.add_argument(
+    "--report-interval",
+    dest="report_interval",
+    type=is_positive_float,
+    help="seconds between ingest rate and write latency reports (default: 10)",
+    default=10.0,
+    metavar="",
+)
+parser.add_argument(
+    "-v",
+    "--verbose",
+    dest="is_verbose",
+    action="store_true",
+    help="print rejected messages",
+    default=False
+)
+args = parser.parse_args()
+
+try:
+    broker_settings = read_broker_settings(args.settings_file)
+except (JSONDecodeError, PydanticValidationError) as e:
+    print_validation_error(e)
+    sys.exit(1)
+if broker_settings.is_azure_enabled():
+    print("Ingestion subscribes to an MQTT broker, Azure IoT Hub settings are not supported")
+    sys.exit(1)
+
+sinks: list[SqliteSink | ParquetSink | AggregationSink] = []
+if not args.is_readings_disabled:
+    sinks.append(SqliteSink(args.db_file, args.fields))
+if args.is_aggregate_enabled:
+    sinks.append(AggregationSink(Aggregator(args.db_file, args.fields, list(args.windows), args.checkpoint_interval)))
+if args.parquet_dir:
+    try:
+        sinks.append(ParquetSink(args.parquet_dir, args.fields, args.parquet_interval))
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+if not sinks:
+    print("Nothing to store: --no-readings needs --aggregate or --parquet-dir")
+    sys.exit(1)
+
+ingestion = Ingestion(
+    broker_settings,
+    args.topics or [DEFAULT_TOPIC],
+    sinks,
+    args.fields,
+    args.qos,
+    args.batch_size,
+    args.flush_interval,
+    args.report_interval,
+    args.is_verbose,
+)
+
+
+def signal_handler(sig, frame):
+    print("\n\nShutting down gracefully...")
+    ingestion.stop()
+
+
+signal.signal(signal.SIGINT, signal_handler)
+signal.signal(signal.SIGTERM, signal_handler)
+
+print(f"Starting: {ingestion.topic_url} -> {args.db_file}" + (f", {args.parquet_dir}" if args.parquet_dir else ""))
+ingestion.start()
+
+# Keep the main thread alive (and able to handle signals) until the writer has flushed
+while ingestion.is_alive():
+    time.sleep(0.5)
@@ -0,0 +1,378 @@
+"""
+Ingestion
+
+Subscribes to the station topics (linha_producao/estacao/+ by default) and
+stores every message in bulk: the MQTT callback only appends the raw message to
+a buffer, and a writer thread drains it every flush interval (or as soon as a
+batch is full) into SQLite with a single executemany per transaction, in WAL
+mode. Optionally the same rows are written to Parquet files partitioned by
+station and day:
+
+    <directory>/station=1/date=2025-01-31/part-1738281600000-0.parquet
+
+The ingest rate and the write latency of each sink are printed periodically.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import paho.mqtt.client as mqtt
+from aggregation import Aggregator
+from settings_classes import BrokerSettings
+from tls_context import handshake_stats, shared_ssl_context
+
+DEFAULT_TOPIC = "linha_producao/estacao/+"
+DEFAULT_FIELDS = ("producao", "paragem", "stock", "defeitos")
+TABLE_NAME = "readings"
+FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+RESERVED_COLUMNS = {"id", "station", "timestamp", "topic", "payload"}
+
+
+class Message(NamedTuple):
+    received_at: float
+    topic: str
+    payload: bytes
+
+
+class Reading(NamedTuple):
+    received_at: float
+    station: str
+    topic: str
+    values: tuple[float | None, ...]
+    payload: str
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def to_number(value: Any) -> float | None:
+    # bool is an int subclass, but a flag stored as 1.0 is still more useful than NULL
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+def parse_message(message: Message, fields: tuple[str, ...]) -> Reading | None:
+    try:
+        data = json.loads(message.payload)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    # the station is the last topic level: linha_producao/estacao/<station>
+    station = message.topic.rsplit("/", 1)[-1]
+    values = tuple(to_number(data.get(field)) for field in fields)
+    return Reading(message.received_at, station, message.topic, values, message.payload.decode("utf-8"))
+
+
+def iso_timestamp(received_at: float) -> str:
+    # same format as the Node-RED flow (Date.toISOString)
+    return datetime.fromtimestamp(received_at, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+class SinkStats:
+    """Rows written and write latencies since the last report, for one sink."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.batches = 0
+        self.latencies: list[float] = []
+
+    def add(self, rows: int, elapsed: float) -> None:
+        self.rows += rows
+        self.batches += 1
+        self.latencies.append(elapsed)
+
+    def report(self, interval: float) -> str:
+        line = (
+            f"{self.name}: {self.rows / interval:.1f} rows/s in {self.batches} batches, "
+            f"write p50 {percentile(self.latencies, 0.5) * 1000:.1f} ms, "
+            f"p99 {percentile(self.latencies, 0.99) * 1000:.1f} ms"
+        )
+        self.rows = 0
+        self.batches = 0
+        self.latencies = []
+        return line
+
+
+class SqliteSink:
+    def __init__(self, path: Path, fields: tuple[str, ...]):
+        self.path = path
+        self.fields = fields
+        self.stats = SinkStats("sqlite")
+        # only used by the writer thread, but opened on the main thread
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets readers (dashboards, Node-RED) query while a batch is being written,
+        # and synchronous=NORMAL only syncs on checkpoints instead of on every commit
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        field_columns = "".join(f", {field} REAL" for field in fields)
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} ("
+            "id INTEGER PRIMARY KEY, station TEXT NOT NULL, timestamp TEXT NOT NULL, topic TEXT NOT NULL"
+            f"{field_columns}, payload TEXT NOT NULL)"
+        )
+        self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_station_timestamp ON {TABLE_NAME} (station, timestamp)"
+        )
+        self.connection.commit()
+        columns = ", ".join(("station", "timestamp", "topic", *fields, "payload"))
+        placeholders = ", ".join("?" * (len(fields) + 4))
+        self.insert_sql = f"INSERT INTO {TABLE_NAME} ({columns}) VALUES ({placeholders})"
+
+    def write(self, readings: list[Reading], watermark: float) -> None:
+        if not readings:
+            return
+        started = time.perf_counter()
+        rows = [
+            (reading.station, iso_timestamp(reading.received_at), reading.topic, *reading.values, reading.payload)
+            for reading in readings
+        ]
+        # one transaction per batch
+        with self.connection:
+            self.connection.executemany(self.insert_sql, rows)
+        self.stats.add(len(rows), time.perf_counter() - started)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class ParquetSink:
+    """Buffers rows per station and day, and writes one file per partition every flush interval."""
+
+    def __init__(self, directory: Path, fields: tuple[str, ...], flush_interval: float = 60.0, max_rows: int = 100_000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.directory = directory
+        self.fields = fields
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.stats = SinkStats("parquet")
+        self.schema = pyarrow.schema(
+            [("timestamp", pyarrow.timestamp("ms", tz="UTC")), ("topic", pyarrow.string())]
+            + [(field, pyarrow.float64()) for field in fields]
+            + [("payload", pyarrow.string())]
+        )
+        self._partitions: dict[tuple[str, str], list[Reading]] = {}
+        self._buffered_rows = 0
+        self._last_flush = time.monotonic()
+        self._file_sequence = 0
+
+    def write(self, readings: list[Reading], watermark: float) -> None:
+        for reading in readings:
+            day = datetime.fromtimestamp(reading.received_at, timezone.utc).strftime("%Y-%m-%d")
+            self._partitions.setdefault((reading.station, day), []).append(reading)
+        self._buffered_rows += len(readings)
+        if self._buffered_rows >= self.max_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._partitions:
+            return
+        started = time.perf_counter()
+        file_stamp = int(time.time() * 1000)
+        try:
+            for (station, day), readings in self._partitions.items():
+                partition = self.directory / f"station={station}" / f"date={day}"
+                partition.mkdir(parents=True, exist_ok=True)
+                columns = {
+                    "timestamp": [int(reading.received_at * 1000) for reading in readings],
+                    "topic": [reading.topic for reading in readings],
+                }
+                for index, field in enumerate(self.fields):
+                    columns[field] = [reading.values[index] for reading in readings]
+                columns["payload"] = [reading.payload for reading in readings]
+                table = self.pa.Table.from_pydict(columns, schema=self.schema)
+                self.pq.write_table(table, partition / f"part-{file_stamp}-{self._file_sequence}.parquet")
+                self._file_sequence += 1
+            self.stats.add(self._buffered_rows, time.perf_counter() - started)
+        finally:
+            # a failed flush is dropped like a failed batch: retrying it forever would grow the buffer without bound
+            self._partitions = {}
+            self._buffered_rows = 0
+
+    def close(self) -> None:
+        self.flush()
+
+
+class AggregationSink:
+    """Feeds the window aggregates with every batch, and checkpoints them every checkpoint interval."""
+
+    def __init__(self, aggregator: Aggregator):
+        self.aggregator = aggregator
+        self.stats = SinkStats("aggregates")
+
+    def write(self, readings: list[Reading], watermark: float) -> None:
+        started = time.perf_counter()
+        for reading in readings:
+            self.aggregator.add(reading.received_at, reading.station, reading.values)
+        self.aggregator.advance(watermark)
+        if self.aggregator.is_checkpoint_due():
+            self.aggregator.checkpoint()
+        if readings:
+            self.stats.add(len(readings), time.perf_counter() - started)
+
+    def close(self) -> None:
+        self.aggregator.close()
+
+
+class Ingestion(threading.Thread):
+    def __init__(
+        self,
+        broker_settings: BrokerSettings,
+        topics: list[str],
+        sinks: list[SqliteSink | ParquetSink | AggregationSink],
+        fields: tuple[str, ...] = DEFAULT_FIELDS,
+        qos: int = 0,
+        batch_size: int = 1000,
+        flush_interval: float = 1.0,
+        report_interval: float = 10.0,
+        is_verbose: bool = False,
+    ):
+        threading.Thread.__init__(self, name="ingestion-writer")
+
+        self.broker_settings = broker_settings
+        self.topics = topics
+        self.sinks = sinks
+        self.fields = fields
+        self.qos = qos
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self.is_verbose = is_verbose
+        # shown in the startup message like a publisher topic
+        self.topic_url = ", ".join(topics)
+
+        self.loop = False
+        self._buffer: list[Message] = []
+        self._buffer_lock = threading.Lock()
+        self._batch_ready = threading.Event()
+        self.received_count = 0
+        self.rejected_count = 0
+        self.client = self.create_client()
+
+    def create_client(self) -> mqtt.Client:
+        client = mqtt.Client(
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            protocol=self.broker_settings.protocol,
+        )
+        if self.broker_settings.is_tls_enabled():
+            client.tls_set_context(shared_ssl_context(self.broker_settings))
+        if self.broker_settings.is_auth_enabled():
+            client.username_pw_set(
+                username=self.broker_settings.auth_username,
+                password=self.broker_settings.auth_password,
+            )
+        client.on_connect = self.on_connect
+        client.on_message = self.on_message
+        return client
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"Ingestion failed to connect: {reason_code}")
+            return
+        # subscribing here also restores the subscriptions after a reconnect
+        client.subscribe([(topic, self.qos) for topic in self.topics])
+        print(f"Ingestion subscribed to: {self.topic_url}")
+
+    def on_message(self, client, userdata, message):
+        # runs on the network thread: keep it to an append, parsing is done by the writer
+        with self._buffer_lock:
+            self._buffer.append(Message(time.time(), message.topic, message.payload))
+            self.received_count += 1
+            if len(self._buffer) >= self.batch_size:
+                self._batch_ready.set()
+
+    def connect(self):
+        self.loop = True
+        self.client.connect(self.broker_settings.url, self.broker_settings.port)
+        self.client.loop_start()
+
+    def stop(self):
+        self.loop = False
+        self._batch_ready.set()
+
+    def run(self):
+        self.connect()
+        next_report = time.monotonic() + self.report_interval
+        last_received = 0
+        while self.loop:
+            self._batch_ready.wait(self.flush_interval)
+            self._batch_ready.clear()
+            self.flush()
+            if time.monotonic() >= next_report:
+                last_received = self.print_report(last_received)
+                next_report += self.report_interval
+        self.client.disconnect()
+        self.client.loop_stop()
+        # whatever arrived before the disconnect
+        self.flush()
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"Ingestion failed to close {sink.stats.name}: {e}")
+        print(f"Ingestion finished: {self.received_count} messages, {self.rejected_count} rejected")
+        if self.broker_settings.is_tls_enabled():
+            print(handshake_stats().summary())
+
+    def flush(self) -> None:
+        with self._buffer_lock:
+            messages, self._buffer = self._buffer, []
+            # messages are stamped under the lock: none of the next batches is older than this
+            watermark = time.time()
+        readings = []
+        for message in messages:
+            reading = parse_message(message, self.fields)
+            if reading is None:
+                self.rejected_count += 1
+                if self.is_verbose:
+                    print(f"[{time.strftime('%H:%M:%S')}] Rejected non JSON object payload on: {message.topic}")
+            else:
+                readings.append(reading)
+        # sinks also get the empty batches: Parquet files and windows are closed on time too
+        for sink in self.sinks:
+            try:
+                sink.write(readings, watermark)
+            except Exception as e:
+                # a failed batch is dropped: blocking the writer would grow the buffer without bound. Any error
+                # (sqlite3, OSError, pyarrow, ...) is caught, so one sink can't stop the writer thread
+                print(f"Ingestion failed to write {len(readings)} rows to {sink.stats.name}: {e}")
+
+    def print_report(self, last_received: int) -> int:
+        received = self.received_count
+        with self._buffer_lock:
+            backlog = len(self._buffer)
+        late = sum(sink.aggregator.late_count for sink in self.sinks if isinstance(sink, AggregationSink))
+        print(
+            f"[{time.strftime('%H:%M:%S')}] Ingest: {(received - last_received) / self.report_interval:.1f} msg/s, "
+            f"backlog {backlog}, rejected {self.rejected_count}, late {late}"
+        )
+        for sink in self.sinks:
+            print(f"    {sink.stats.report(self.report_interval)}")
+        return received
+
+
+def validate_fields(fields: list[str]) -> tuple[str, ...]:
+    """Field names become SQLite columns, so they must be plain identifiers."""
+    for field in fields:
+        if not FIELD_NAME_PATTERN.match(field) or field.lower() in RESERVED_COLUMNS:
+            raise ValueError(f"invalid field name '{field}'")
+    return tuple(fields)
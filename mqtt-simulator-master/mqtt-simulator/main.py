@@ -1,15 +1,23 @@
 import argparse
+import random
 import signal
 import sys
 import time
 from json import JSONDecodeError
 from pathlib import Path
 
+from coordinator import Coordinator
+from profiler import Profiler
 from pydantic import ValidationError as PydanticValidationError
+from replayer import Replayer
 from simulator import Simulator
+from stream_log import StreamLogReader, StreamLogWriter
+from usage_meter import UsageMeter
+from utils.cluster_messages import parse_address
 from utils.exceptions.simulator_validation_error import SimulatorValidationError
 from utils.print_validation_error import print_validation_error
-from utils.read_publishers import read_publishers
+from utils.read_publishers import read_broker_settings, read_publishers, read_settings_file
+from worker import Worker
 
 
 def default_settings() -> Path:
@@ -25,6 +33,34 @@ def is_valid_file(arg: str) -> Path:
     return settings_file
 
 
+def is_valid_speed(arg: str) -> float:
+    speed = float(arg)
+    if speed < 0:
+        raise argparse.ArgumentTypeError("argument --speed: must be 0 (max speed) or a positive multiplier")
+    return speed
+
+
+def is_valid_interval(arg: str) -> float:
+    interval = float(arg)
+    if interval <= 0:
+        raise argparse.ArgumentTypeError("argument --usage-interval: must be a positive number of seconds")
+    return interval
+
+
+def is_valid_sample_duration(arg: str) -> float:
+    duration = float(arg)
+    if duration <= 0:
+        raise argparse.ArgumentTypeError("argument --profile-sample: must be a positive number of seconds")
+    return duration
+
+
+def is_valid_address(arg: str) -> tuple[str, int]:
+    try:
+        return parse_address(arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid address '{arg}', expected host:port")
+
+
 parser = argparse.ArgumentParser()
 parser.add_argument(
     "-f",
@@ -43,15 +79,138 @@ parser.add_argument(
     help="enable verbose output",
     default=False
 )
+parser.add_argument(
+    "--seed",
+    dest="seed",
+    type=int,
+    help="seed for the random data generation",
+    default=None,
+    metavar="",
+)
+parser.add_argument(
+    "--record",
+    dest="record_file",
+    type=Path,
+    help="append every published message to a stream log file",
+    default=None,
+    metavar="",
+)
+parser.add_argument(
+    "--replay",
+    dest="replay_file",
+    type=is_valid_file,
+    help="republish a recorded stream log file instead of simulating",
+    default=None,
+    metavar="",
+)
+parser.add_argument(
+    "--speed",
+    dest="replay_speed",
+    type=is_valid_speed,
+    help="replay speed multiplier, 0 replays as fast as possible (default: 1)",
+    default=1.0,
+    metavar="",
+)
+parser.add_argument(
+    "--seek",
+    dest="replay_seek",
+    type=float,
+    help="start the replay at this offset in seconds from the start of the recording",
+    default=0.0,
+    metavar="",
+)
+parser.add_argument(
+    "--usage-file",
+    dest="usage_file",
+    type=Path,
+    help="append per-topic message and byte counts to this file for usage metering",
+    default=None,
+    metavar="",
+)
+parser.add_argument(
+    "--usage-interval",
+    dest="usage_interval",
+    type=is_valid_interval,
+    help="seconds between usage flushes (default: 10)",
+    default=10.0,
+    metavar="",
+)
+parser.add_argument(
+    "--profile",
+    dest="is_profile_enabled",
+    action="store_true",
+    help="time the generation, encoding, publish, ack and logging of each message and print a summary at shutdown",
+    default=False
+)
+parser.add_argument(
+    "--profile-sample",
+    dest="profile_sample_duration",
+    type=is_valid_sample_duration,
+    help="also sample the stacks of every thread for this many seconds from the start (implies --profile)",
+    default=None,
+    metavar="",
+)
+parser.add_argument(
+    "--profile-stacks",
+    dest="profile_stacks_file",
+    type=Path,
+    help="collapsed stacks file for flamegraph.pl or speedscope (default: profile.folded)",
+    default=Path("profile.folded"),
+    metavar="",
+)
+parser.add_argument(
+    "--coordinator",
+    dest="coordinator_address",
+    type=is_valid_address,
+    help="split the settings file topics across workers connecting to host:port",
+    default=None,
+    metavar="",
+)
+parser.add_argument(
+    "--worker",
+    dest="worker_address",
+    type=is_valid_address,
+    help="publish the topics assigned by the coordinator at host:port",
+    default=None,
+    metavar="",
+)
 args = parser.parse_args()
 
+if args.seed is not None:
+    random.seed(args.seed)
+
+stream_recorder = StreamLogWriter(args.record_file) if args.record_file else None
+usage_meter = UsageMeter(args.usage_file, args.usage_interval) if args.usage_file else None
+profiler = (
+    Profiler(args.profile_sample_duration or 0.0, args.profile_stacks_file)
+    if args.is_profile_enabled or args.profile_sample_duration
+    else None
+)
+
 try:
-    publishers = read_publishers(args.settings_file, args.is_verbose)
+    if args.replay_file:
+        stream_log = StreamLogReader(args.replay_file)
+        publishers = [
+            Replayer(
+                read_broker_settings(args.settings_file),
+                stream_log,
+                args.replay_speed,
+                args.replay_seek,
+                args.is_verbose,
+                usage_meter,
+            )
+        ]
+    elif args.coordinator_address:
+        publishers = [Coordinator(read_settings_file(args.settings_file), args.coordinator_address, args.is_verbose)]
+    elif args.worker_address:
+        publishers = [Worker(args.worker_address, args.is_verbose, stream_recorder, usage_meter, profiler)]
+    else:
+        publishers = read_publishers(args.settings_file, args.is_verbose, stream_recorder, usage_meter, profiler)
 except (JSONDecodeError, PydanticValidationError, SimulatorValidationError) as e:
     print_validation_error(e)
     sys.exit(1)
 
-simulator = Simulator(publishers)
+simulator = Simulator(publishers, stream_recorder, usage_meter, profiler)
 
 # Set up signal handler for graceful shutdown
 def signal_handler(sig, frame):
@@ -62,6 +221,8 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
+# docker stop sends SIGTERM: stopping the same way flushes the last usage counts
+signal.signal(signal.SIGTERM, signal_handler)
 
 # Start the simulator
 simulator.run()
@@ -70,6 +231,8 @@ simulator.run()
 try:
     while any(p.is_alive() for p in simulator.publishers):
         time.sleep(1)
+    # All publishers finished on their own: shut down the same way as on a signal (recorder, usage, summaries)
+    simulator.stop()
 except KeyboardInterrupt:
     print("\n\nShutting down gracefully...")
     simulator.stop()
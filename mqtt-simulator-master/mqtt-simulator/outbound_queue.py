@@ -0,0 +1,140 @@
+"""
+Outbound Queue
+
+Bounded queue of the payloads a publisher generates while its connection to
+the broker is down. Without it paho keeps every QoS 1/2 message in memory until
+the reconnect, which can exhaust the memory of a simulator with thousands of
+topics during a long outage, and then sends them all at once.
+
+When the queue is full the overflow policy decides what is lost:
+
+- drop-oldest: the oldest queued payload is dropped for the new one
+- drop-newest: the new payload is dropped
+- spill: new payloads are appended to a segment file on disk, up to a size
+  limit (then the new payloads are dropped); once something was spilled, every
+  new payload goes to the segment too, so the order is kept
+
+Each spilled payload is stored as a 4 byte big endian length followed by the
+payload. The segment is truncated as soon as it has been drained, and removed
+when the queue is closed: it bounds memory during an outage, it does not keep
+messages across restarts.
+
+The queue is only used by the thread of its publisher, so it takes no lock; the
+counters are read by other threads for the metrics.
+"""
+
+import hashlib
+import re
+import struct
+from collections import deque
+from pathlib import Path
+from typing import Iterable, Literal, NamedTuple
+
+OverflowPolicy = Literal["drop-oldest", "drop-newest", "spill"]
+LENGTH_PREFIX = struct.Struct(">I")
+
+
+class OutboundStats(NamedTuple):
+    queued: int
+    spool_bytes: int
+    dropped: int
+    spilled: int
+
+
+def sum_outbound_stats(queues: Iterable["OutboundQueue"]) -> OutboundStats:
+    queued = spool_bytes = dropped = spilled = 0
+    for queue in queues:
+        queued += len(queue)
+        spool_bytes += queue.spool_bytes
+        dropped += queue.dropped_count
+        spilled += queue.spilled_count
+    return OutboundStats(queued, spool_bytes, dropped, spilled)
+
+
+def spool_file_name(topic_url: str) -> str:
+    # readable, but made unique by the hash: "a/b" and "a_b" are different topics
+    digest = hashlib.sha1(topic_url.encode("utf-8")).hexdigest()[:8]
+    return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', topic_url)}-{digest}.spool"
+
+
+class OutboundQueue:
+    def __init__(
+        self,
+        max_messages: int,
+        overflow: OverflowPolicy = "drop-oldest",
+        spool_path: Path | None = None,
+        max_spool_bytes: int = 0,
+    ):
+        if overflow == "spill" and spool_path is None:
+            raise ValueError("the spill overflow policy needs a spool path")
+        self.max_messages = max_messages
+        self.overflow = overflow
+        self.spool_path = spool_path
+        self.max_spool_bytes = max_spool_bytes
+        self._messages: deque[bytes] = deque()
+        self._spool = None
+        self._spool_read_offset = 0
+        self.spool_bytes = 0
+        self.spool_messages = 0
+        self.dropped_count = 0
+        self.spilled_count = 0
+
+    def __len__(self) -> int:
+        return len(self._messages) + self.spool_messages
+
+    def put(self, payload: bytes) -> None:
+        if self.spool_messages > 0:
+            self._spill(payload)
+        elif len(self._messages) < self.max_messages:
+            self._messages.append(payload)
+        elif self.overflow == "drop-oldest":
+            self._messages.popleft()
+            self._messages.append(payload)
+            self.dropped_count += 1
+        elif self.overflow == "spill":
+            self._spill(payload)
+        else:
+            self.dropped_count += 1
+
+    def get(self) -> bytes | None:
+        """The oldest payload, or None if the queue is empty."""
+        if self._messages:
+            return self._messages.popleft()
+        if self.spool_messages == 0:
+            return None
+        self._spool.seek(self._spool_read_offset)
+        (length,) = LENGTH_PREFIX.unpack(self._spool.read(LENGTH_PREFIX.size))
+        payload = self._spool.read(length)
+        self._spool_read_offset += LENGTH_PREFIX.size + length
+        self.spool_messages -= 1
+        if self.spool_messages == 0:
+            # drained: start the segment over instead of letting it grow for the whole run
+            self._spool.truncate(0)
+            self._spool_read_offset = 0
+            self.spool_bytes = 0
+        return payload
+
+    def _spill(self, payload: bytes) -> None:
+        size = LENGTH_PREFIX.size + len(payload)
+        if self.spool_bytes + size > self.max_spool_bytes:
+            self.dropped_count += 1
+            return
+        if self._spool is None:
+            self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+            self._spool = open(self.spool_path, "w+b")
+        # append only: reads seek back, so every write goes to the end
+        self._spool.seek(0, 2)
+        self._spool.write(LENGTH_PREFIX.pack(len(payload)))
+        self._spool.write(payload)
+        self.spool_bytes += size
+        self.spool_messages += 1
+        self.spilled_count += 1
+
+    def close(self) -> None:
+        self._messages.clear()
+        self.spool_messages = 0
+        self.spool_bytes = 0
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+            self.spool_path.unlink(missing_ok=True)
@@ -0,0 +1,52 @@
+"""
+Preview
+
+Generates the payload series a settings file would publish, in-process: the
+same topic and data settings classes as the publishers, but every tick runs
+back to back with no broker and no sleeping. Used by the API to try a config
+before launching a container.
+"""
+
+from typing import Any, NamedTuple
+
+from settings_classes import BrokerSettings, ClientSettings, DataSettings, DataSettingsFactory, TopicSettingsFactory
+
+# same fallback as read_publishers_from_json
+DEFAULT_TIME_INTERVAL = 10
+
+
+class TopicPreview(NamedTuple):
+    topic_url: str
+    time_interval: int
+    payloads: list[dict[str, Any]]
+
+
+def generate_payloads(topic_data: list[DataSettings], payload_root: dict[str, Any], ticks: int) -> list[dict[str, Any]]:
+    # one series per data, generated in a single call, then assembled tick by tick:
+    # a data is in the payload of a tick while it is active, as in Publisher.generate_payload
+    columns = [(data.name, data.generate_values(ticks)) for data in topic_data]
+    # the publisher stops once every data of its topic is exhausted
+    tick_count = max((len(values) for _, values in columns), default=0)
+    payloads: list[dict[str, Any]] = [dict(payload_root) for _ in range(tick_count)]
+    for name, values in columns:
+        for payload, value in zip(payloads, values):
+            payload[name] = value
+    return payloads
+
+
+def preview_topics(json_object: dict[str, Any], ticks: int) -> list[TopicPreview]:
+    """Raises the same validation errors as read_publishers_from_json for an invalid settings object."""
+    BrokerSettings.model_validate(json_object)
+    broker_time_interval = ClientSettings.model_validate(json_object).time_interval or DEFAULT_TIME_INTERVAL
+
+    previews: list[TopicPreview] = []
+    for topic_object in json_object.get("TOPICS"):
+        time_interval = ClientSettings.model_validate(topic_object).time_interval or broker_time_interval
+        topic_settings = TopicSettingsFactory.create(topic_object)
+        for topic_url in topic_settings.topic_urls():
+            # each topic_url has its own data settings instances, as with the publishers
+            topic_data = [DataSettingsFactory.create(data_object) for data_object in topic_object.get("DATA")]
+            previews.append(
+                TopicPreview(topic_url, time_interval, generate_payloads(topic_data, topic_settings.payload_root, ticks))
+            )
+    return previews
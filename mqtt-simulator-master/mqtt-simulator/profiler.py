@@ -0,0 +1,199 @@
+"""
+Profiler
+
+Per-phase timings of the publish hot path, to tell what keeps a simulator from
+keeping up with the configured intervals:
+
+- generation: generate_payload (the data settings of the topic)
+- encoding: json.dumps of the payload
+- publish: the client publish call
+- ack: from the publish call to its on_publish callback, i.e. the broker's
+  PUBACK (QoS 1) or PUBCOMP (QoS 2), or the write to the socket for QoS 0.
+  It is latency, not time spent by the simulator, so it is left out of the
+  share of each family
+- logging: building and printing the on_publish log line
+
+Each publisher records into its own TopicProfile, so the hot path is a few
+integer additions with no shared lock (the logging phase is only written by the
+network thread of the publisher's client; the ack phase takes the publisher's
+own lock that matches the publish times to the acks). Profiles are merged per topic
+family (the PREFIX of the settings, with /+ for multiple and list topics) in
+the summary printed at shutdown.
+
+Optionally a sampling profiler records the stacks of every thread for a fixed
+window and writes them in the collapsed format of flamegraph.pl and
+speedscope: one "frame;frame;frame count" line per distinct stack.
+"""
+
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+PHASES = ("generation", "encoding", "publish", "ack", "logging")
+# quarter octave buckets: up to 25% error on the percentiles, with a fixed size histogram
+BUCKET_COUNT = 4 * 64
+
+
+def bucket_index(elapsed_ns: int) -> int:
+    bits = elapsed_ns.bit_length()
+    if bits < 3:
+        return elapsed_ns
+    return (bits << 2) | ((elapsed_ns >> (bits - 3)) & 3)
+
+
+def bucket_upper_bound(index: int) -> int:
+    if index < 12:
+        return index
+    bits, quarter = index >> 2, index & 3
+    return (5 + quarter) << (bits - 3)
+
+
+class PhaseTimes:
+    __slots__ = ("count", "total", "maximum", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+        self.buckets = [0] * BUCKET_COUNT
+
+    def add(self, elapsed_ns: int) -> None:
+        self.count += 1
+        self.total += elapsed_ns
+        if elapsed_ns > self.maximum:
+            self.maximum = elapsed_ns
+        self.buckets[bucket_index(elapsed_ns)] += 1
+
+    def merge(self, other: "PhaseTimes") -> None:
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def percentile(self, fraction: float) -> int:
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min(bucket_upper_bound(index), self.maximum)
+        return self.maximum
+
+
+class TopicProfile:
+    __slots__ = PHASES
+
+    def __init__(self):
+        for phase in PHASES:
+            setattr(self, phase, PhaseTimes())
+
+
+class SamplingProfiler(threading.Thread):
+    def __init__(self, duration: float, interval: float = 0.005):
+        threading.Thread.__init__(self, daemon=True, name="profiler-sampler")
+        self.duration = duration
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        end = time.monotonic() + self.duration
+        while time.monotonic() < end and not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def sample(self) -> None:
+        # every publisher thread is named Thread-<n>: numbers are dropped so their stacks add up
+        names = {thread.ident: re.sub(r"\d+", "N", thread.name) for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+            frames: list[str] = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            frames.append(names.get(ident, "unknown"))
+            self.stacks[";".join(reversed(frames))] += 1
+        self.sample_count += 1
+
+    def write_collapsed(self, path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as stacks_file:
+            for stack, count in self.stacks.most_common():
+                stacks_file.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    def __init__(self, sample_duration: float = 0.0, stacks_path: Path | None = None):
+        self.stacks_path = stacks_path
+        self.sampler = SamplingProfiler(sample_duration) if sample_duration > 0 else None
+        self._lock = threading.Lock()
+        self._profiles: dict[str, list[TopicProfile]] = {}
+        self._is_closed = False
+
+    def topic_profile(self, topic_family: str) -> TopicProfile:
+        """A new profile for one publisher of the family, merged with the others in the summary."""
+        profile = TopicProfile()
+        with self._lock:
+            self._profiles.setdefault(topic_family, []).append(profile)
+        return profile
+
+    def start(self) -> None:
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._is_closed:
+                return
+            self._is_closed = True
+        if self.sampler is not None:
+            self.sampler.stop()
+            if self.stacks_path is not None:
+                self.sampler.write_collapsed(self.stacks_path)
+                print(f"Profiled {self.sampler.sample_count} stack samples to: {self.stacks_path}")
+        print(self.summary())
+
+    def merged_profiles(self) -> dict[str, dict[str, PhaseTimes]]:
+        with self._lock:
+            families = {family: list(profiles) for family, profiles in self._profiles.items()}
+        merged: dict[str, dict[str, PhaseTimes]] = {}
+        for family, profiles in families.items():
+            phases = merged[family] = {phase: PhaseTimes() for phase in PHASES}
+            for profile in profiles:
+                for phase in PHASES:
+                    phases[phase].merge(getattr(profile, phase))
+        return merged
+
+    def summary(self) -> str:
+        merged = self.merged_profiles()
+        if not merged:
+            return "Profile: no messages published by the profiled publishers"
+        width = max(len("topic family"), *(len(family) for family in merged))
+        lines = [
+            "Profile (times in microseconds per call, share of the family's total time, ack excluded):",
+            f"{'topic family':<{width}}  {'phase':<10}  {'calls':>9}  {'total ms':>10}  {'share':>6}"
+            f"  {'mean':>9}  {'p50':>9}  {'p99':>9}  {'max':>9}",
+        ]
+        for family, phases in sorted(merged.items()):
+            # the ack phase overlaps with the others, it's time waiting for the broker
+            family_total = sum(times.total for phase, times in phases.items() if phase != "ack") or 1
+            for phase, times in phases.items():
+                if times.count == 0:
+                    continue
+                share = "-" if phase == "ack" else f"{times.total / family_total:.1%}"
+                lines.append(
+                    f"{family:<{width}}  {phase:<10}  {times.count:>9}  {times.total / 1e6:>10.1f}"
+                    f"  {share:>6}  {times.total / times.count / 1e3:>9.1f}"
+                    f"  {times.percentile(0.5) / 1e3:>9.1f}  {times.percentile(0.99) / 1e3:>9.1f}"
+                    f"  {times.maximum / 1e3:>9.1f}"
+                )
+        return "\n".join(lines)
@@ -1,11 +1,22 @@
 import json
-import ssl
 import threading
 import time
+from pathlib import Path
 from typing import Any
 
 import paho.mqtt.client as mqtt
+from connection_ramp import ConnectionRamp, first_tick, retry_delay
+from outbound_queue import OutboundQueue, spool_file_name
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from profiler import TopicProfile
 from settings_classes import BrokerSettings, ClientSettings, DataSettings
+from stream_log import StreamLogWriter
+from tls_context import shared_ssl_context
+from usage_meter import UsageMeter
+
+# each publisher owns a single topic on its own connection, so a single alias is enough
+TOPIC_ALIAS = 1
 
 
 class Publisher(threading.Thread):
@@ -17,6 +28,11 @@ class Publisher(threading.Thread):
         topic_payload_root: dict[str, Any],
         client_settings: ClientSettings,
         is_verbose: bool,
+        stream_recorder: StreamLogWriter | None = None,
+        usage_meter: UsageMeter | None = None,
+        profile: TopicProfile | None = None,
+        connection_ramp: ConnectionRamp | None = None,
+        tick_phase: float | None = None,
     ):
         threading.Thread.__init__(self)
 
@@ -26,9 +42,28 @@ class Publisher(threading.Thread):
         self.topic_payload_root = topic_payload_root
         self.client_settings = client_settings
         self.is_verbose = is_verbose
+        self.stream_recorder = stream_recorder
+        self.usage = usage_meter.counter(topic_url) if usage_meter is not None else None
+        self.profile = profile
+        # with --profile, the publish time of each message in flight by mid, to time its ack
+        self._publish_times: dict[int, int] = {}
+        self._early_acks: dict[int, int] = {}
+        self._publish_times_lock = threading.Lock()
+        self.connection_ramp = connection_ramp
+        self.reconnect_attempt = 0
+        self.tick_phase = tick_phase
 
         self.loop = False
+        self._stop_event = threading.Event()
+        self.next_tick = 0.0
         self.payload: dict[str, Any] | None = None
+        self.topic_alias_maximum = 0
+        self.is_topic_alias_sent = False
+        self.topic_alias_bytes_saved = 0
+        self.published_count = 0
+        self.publish_properties = self.create_publish_properties(topic_alias=None)
+        self.topic_alias_publish_properties = self.create_publish_properties(topic_alias=TOPIC_ALIAS)
+        self.outbound = self.create_outbound_queue()
         self.client = self.create_client()
 
     def create_client(self) -> mqtt.Client:
@@ -38,16 +73,14 @@ class Publisher(threading.Thread):
             protocol=self.broker_settings.protocol,
             clean_session=clean_session,
         )
+        client.on_connect = self.on_connect
+        client.on_disconnect = self.on_disconnect
+        client.on_connect_fail = self.on_connect_fail
         client.on_publish = self.on_publish
+        # paho reconnects as soon as the callbacks return: the backoff and the ramp are in wait_before_reconnect
+        client.reconnect_delay_set(min_delay=0, max_delay=0)
         if self.broker_settings.is_tls_enabled():
-            client.tls_set(
-                ca_certs=self.broker_settings.tls_ca_path,
-                certfile=self.broker_settings.tls_cert_path,
-                keyfile=self.broker_settings.tls_key_path,
-                cert_reqs=ssl.CERT_REQUIRED,
-                tls_version=ssl.PROTOCOL_TLSv1_2,
-                ciphers=None,
-            )
+            client.tls_set_context(shared_ssl_context(self.broker_settings))
         if self.broker_settings.is_auth_enabled():
             client.username_pw_set(
                 username=self.broker_settings.auth_username,
@@ -55,33 +88,225 @@ class Publisher(threading.Thread):
             )
         return client
 
-    def connect(self):
+    def create_outbound_queue(self) -> OutboundQueue | None:
+        if self.broker_settings.outbound_queue_size == 0:
+            return None
+        spool_path = None
+        if self.broker_settings.outbound_overflow == "spill":
+            spool_path = Path(self.broker_settings.outbound_spool_dir) / spool_file_name(self.topic_url)
+        return OutboundQueue(
+            self.broker_settings.outbound_queue_size,
+            self.broker_settings.outbound_overflow,
+            spool_path,
+            self.broker_settings.outbound_spool_max_bytes,
+        )
+
+    def create_publish_properties(self, topic_alias: int | None) -> Properties | None:
+        if self.broker_settings.protocol != mqtt.MQTTv5:
+            return None
+        properties = Properties(PacketTypes.PUBLISH)
+        if topic_alias is not None:
+            properties.TopicAlias = topic_alias
+        if self.client_settings.message_expiry_interval is not None:
+            properties.MessageExpiryInterval = self.client_settings.message_expiry_interval
+        return properties
+
+    def create_connect_properties(self) -> Properties | None:
+        if self.broker_settings.protocol != mqtt.MQTTv5 or self.broker_settings.session_expiry_interval is None:
+            return None
+        properties = Properties(PacketTypes.CONNECT)
+        properties.SessionExpiryInterval = self.broker_settings.session_expiry_interval
+        return properties
+
+    def connect(self) -> bool:
         self.loop = True
-        self.client.connect(self.broker_settings.url, self.broker_settings.port)
+        attempt = 0
+        while True:
+            if self.connection_ramp is not None and not self.connection_ramp.acquire(self._stop_event):
+                return False
+            try:
+                self.client.connect(
+                    self.broker_settings.url,
+                    self.broker_settings.port,
+                    properties=self.create_connect_properties(),
+                )
+                break
+            except OSError as e:
+                delay = retry_delay(
+                    attempt, self.broker_settings.connect_retry_min_delay, self.broker_settings.connect_retry_max_delay
+                )
+                attempt += 1
+                print(
+                    f"[{time.strftime('%H:%M:%S')}] Connection failed for {self.topic_url}: {e}, "
+                    f"retrying in {delay:.1f}s"
+                )
+                if self._stop_event.wait(delay):
+                    return False
         self.client.loop_start()
+        return True
 
     def stop(self):
         self.loop = False
+        self._stop_event.set()
         self.client.loop_stop()
         self.client.disconnect()
 
     def run(self):
-        self.connect()
+        if not self.connect():
+            return
+        profile = self.profile
+        self.next_tick = first_tick(self.tick_phase, self.client_settings.time_interval)
+        self.wait_until(self.next_tick)
         while self.loop:
+            # reading the clock costs well under a microsecond, the timings are only kept with --profile
+            started = time.perf_counter_ns()
             self.payload = self.generate_payload()
-            self.client.publish(
-                topic=self.topic_url,
-                payload=json.dumps(self.payload),
-                qos=self.client_settings.qos,
-                retain=self.client_settings.retain,
+            generated = time.perf_counter_ns()
+            payload = json.dumps(self.payload).encode("utf-8")
+            encoded = time.perf_counter_ns()
+            # while the connection is down, and until what was queued meanwhile is drained, keep the order
+            if self.outbound is not None and (self.outbound or not self.client.is_connected()):
+                self.outbound.put(payload)
+            else:
+                self.send(payload)
+            if profile is not None:
+                profile.generation.add(generated - started)
+                profile.encoding.add(encoded - generated)
+                profile.publish.add(time.perf_counter_ns() - encoded)
+            if self.stream_recorder is not None:
+                self.stream_recorder.append(
+                    self.topic_url,
+                    payload,
+                    qos=self.client_settings.qos,
+                    retain=self.client_settings.retain,
+                )
+            self.wait(self.client_settings.time_interval)
+        if self.outbound is not None:
+            self.outbound.close()
+
+    def send(self, payload: bytes):
+        topic, properties = self.resolve_topic_alias()
+        published = time.perf_counter_ns()
+        message_info = self.client.publish(
+            topic=topic,
+            payload=payload,
+            qos=self.client_settings.qos,
+            retain=self.client_settings.retain,
+            properties=properties,
+        )
+        if not self.is_message_sent_or_queued(message_info.rc):
+            return
+        if self.usage is not None:
+            self.usage.add(len(payload))
+        if self.profile is not None:
+            self.track_ack(message_info.mid, published)
+
+    def track_ack(self, mid: int, published: int):
+        # paho can call on_publish before publish returns the mid: whichever of the two runs last records the time
+        with self._publish_times_lock:
+            acked = self._early_acks.pop(mid, None)
+            if acked is None:
+                self._publish_times[mid] = published
+                return
+            self.profile.ack.add(acked - published)
+
+    def wait(self, interval: float):
+        # ticks are scheduled from the first one, so the phase doesn't drift with the time spent publishing
+        self.next_tick += interval
+        behind = time.monotonic() - self.next_tick
+        if behind >= interval > 0:
+            # publish the latest missed tick now and skip the others, rather than publishing them in a burst
+            self.next_tick += behind // interval * interval
+        self.wait_until(self.next_tick)
+
+    def wait_until(self, deadline: float):
+        if self.outbound:
+            self.drain(deadline)
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            self._stop_event.wait(remaining)
+
+    def drain(self, deadline: float):
+        # rate limited, so a reconnect after a long outage doesn't flood the broker with the backlog
+        period = 1 / self.broker_settings.outbound_drain_rate
+        next_send = time.monotonic()
+        while self.loop and self.outbound and self.client.is_connected():
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                if next_send >= deadline:
+                    return
+                self._stop_event.wait(delay)
+            self.send(self.outbound.get())
+            next_send += period
+
+    def is_message_sent_or_queued(self, rc: mqtt.MQTTErrorCode) -> bool:
+        # while disconnected paho drops QoS 0 messages but keeps QoS 1/2 ones to send after the reconnect
+        if rc == mqtt.MQTT_ERR_NO_CONN:
+            return self.client_settings.qos > 0
+        return rc == mqtt.MQTT_ERR_SUCCESS
+
+    def resolve_topic_alias(self) -> tuple[str, Properties | None]:
+        # paho retransmits QoS 1/2 messages as stored after a reconnect, when the alias is not defined yet
+        # on the new connection, so only QoS 0 messages can be sent with the alias alone
+        if self.client_settings.qos != 0 or self.topic_alias_maximum < TOPIC_ALIAS:
+            return self.topic_url, self.publish_properties
+        if not self.is_topic_alias_sent:
+            self.is_topic_alias_sent = True
+            return self.topic_url, self.topic_alias_publish_properties
+        self.topic_alias_bytes_saved += len(self.topic_url.encode("utf-8"))
+        return "", self.topic_alias_publish_properties
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        self.reconnect_attempt = 0
+        # topic aliases only live as long as the network connection, they are set again on every connect
+        self.is_topic_alias_sent = False
+        if self.outbound:
+            print(
+                f"[{time.strftime('%H:%M:%S')}] Reconnected: {self.topic_url}, draining {len(self.outbound)} queued "
+                f"messages at {self.broker_settings.outbound_drain_rate:g} msg/s"
             )
-            time.sleep(self.client_settings.time_interval)
+        if self.broker_settings.protocol == mqtt.MQTTv5 and self.broker_settings.topic_alias:
+            self.topic_alias_maximum = getattr(properties, "TopicAliasMaximum", 0)
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        # also called for the disconnect of stop, which must not wait
+        if self.loop:
+            self.wait_before_reconnect()
+
+    def on_connect_fail(self, client, userdata):
+        self.wait_before_reconnect()
+
+    def wait_before_reconnect(self):
+        # runs in paho's network thread before each automatic reconnect, so reconnects back off with jitter and
+        # take a slot of the ramp like the first connection, instead of reconnecting all together after an outage
+        delay = retry_delay(
+            self.reconnect_attempt,
+            self.broker_settings.connect_retry_min_delay,
+            self.broker_settings.connect_retry_max_delay,
+        )
+        self.reconnect_attempt += 1
+        if self._stop_event.wait(delay):
+            return
+        if self.connection_ramp is not None:
+            self.connection_ramp.acquire(self._stop_event)
 
     def on_publish(self, client, userdata, mid, reason_code, properties):
+        acked = time.perf_counter_ns()
+        self.published_count += 1
+        if self.profile is not None:
+            with self._publish_times_lock:
+                published = self._publish_times.pop(mid, None)
+                if published is None:
+                    self._early_acks[mid] = acked
+                else:
+                    self.profile.ack.add(acked - published)
+        logging_started = time.perf_counter_ns()
         on_publish_log = f"[{time.strftime('%H:%M:%S')}] Data published on: {self.topic_url}"
         if self.is_verbose:
             on_publish_log += f"\n\t[payload] {json.dumps(self.payload)}"
         print(on_publish_log)
+        if self.profile is not None:
+            self.profile.logging.add(time.perf_counter_ns() - logging_started)
 
     def generate_payload(self) -> dict[str, Any] | None:
         payload: dict[str, Any] = {}
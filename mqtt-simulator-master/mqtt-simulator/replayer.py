@@ -0,0 +1,98 @@
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+from settings_classes import BrokerSettings
+from stream_log import StreamLogReader
+from tls_context import shared_ssl_context
+from usage_meter import TopicUsage, UsageMeter
+
+
+class Replayer(threading.Thread):
+    def __init__(
+        self,
+        broker_settings: BrokerSettings,
+        stream_log: StreamLogReader,
+        speed: float,
+        seek_seconds: float,
+        is_verbose: bool,
+        usage_meter: UsageMeter | None = None,
+    ):
+        threading.Thread.__init__(self)
+
+        self.broker_settings = broker_settings
+        self.stream_log = stream_log
+        # speed 0 replays as fast as possible, otherwise it's a multiplier of the recorded pace
+        self.speed = speed
+        self.seek_seconds = seek_seconds
+        self.is_verbose = is_verbose
+        self.usage_meter = usage_meter
+        self.topic_usage: dict[str, TopicUsage] = {}
+        # shown by the Simulator in place of a topic, a replay publishes on every recorded topic
+        self.topic_url = f"replay of {stream_log.path}"
+
+        self.loop = False
+        self._stop_event = threading.Event()
+        self.replayed_count = 0
+        self.client = self.create_client()
+
+    def create_client(self) -> mqtt.Client:
+        client = mqtt.Client(
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            protocol=self.broker_settings.protocol,
+        )
+        if self.broker_settings.is_tls_enabled():
+            client.tls_set_context(shared_ssl_context(self.broker_settings))
+        if self.broker_settings.is_auth_enabled():
+            client.username_pw_set(
+                username=self.broker_settings.auth_username,
+                password=self.broker_settings.auth_password,
+            )
+        return client
+
+    def connect(self):
+        self.loop = True
+        self.client.connect(self.broker_settings.url, self.broker_settings.port)
+        self.client.loop_start()
+
+    def stop(self):
+        self.loop = False
+        self._stop_event.set()
+
+    def run(self):
+        self.connect()
+        first_timestamp: float | None = None
+        replay_start = time.monotonic()
+        for record in self.stream_log.records(self.seek_seconds):
+            if not self.loop:
+                break
+            if first_timestamp is None:
+                first_timestamp = record.timestamp
+            if self.speed > 0:
+                # records are stored in publish order, so keeping the global offsets keeps every topic's timing
+                delay = replay_start + (record.timestamp - first_timestamp) / self.speed - time.monotonic()
+                if delay > 0 and self._stop_event.wait(delay):
+                    break
+            self.client.publish(
+                topic=record.topic,
+                payload=record.payload,
+                qos=record.qos,
+                retain=record.retain,
+            )
+            self.replayed_count += 1
+            if self.usage_meter is not None:
+                self.get_topic_usage(record.topic).add(len(record.payload))
+            if self.is_verbose:
+                print(f"[{time.strftime('%H:%M:%S')}] Data replayed on: {record.topic}")
+        print(f"Replay finished: {self.replayed_count} messages")
+        self.loop = False
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.stream_log.close()
+
+    def get_topic_usage(self, topic: str) -> TopicUsage:
+        # cached per replayer so the meter lock is only taken once per topic
+        usage = self.topic_usage.get(topic)
+        if usage is None:
+            usage = self.topic_usage[topic] = self.usage_meter.counter(topic)
+        return usage
@@ -13,6 +13,10 @@ class BrokerSettings(BaseModel):
     port: int = Field(alias="BROKER_PORT", default=1883)
     protocol: int = Field(alias="PROTOCOL_VERSION", default=4)
 
+    # MQTT v5 only settings
+    topic_alias: bool = Field(alias="TOPIC_ALIAS", default=True)
+    session_expiry_interval: int | None = Field(alias="SESSION_EXPIRY_INTERVAL", default=None)
+
     tls_ca_path: str | None = Field(alias="TLS_CA_PATH", default=None)
     tls_cert_path: str | None = Field(alias="TLS_CERT_PATH", default=None)
     tls_key_path: str | None = Field(alias="TLS_KEY_PATH", default=None)
@@ -20,6 +24,22 @@ class BrokerSettings(BaseModel):
     auth_username: str | None = Field(alias="AUTH_USERNAME", default=None)
     auth_password: str | None = Field(alias="AUTH_PASSWORD", default=None)
 
+    # Connection attempts per second across all the topics (0 is unlimited), and the retry backoff bounds
+    connect_rate: float = Field(alias="CONNECT_RATE", default=0, ge=0)
+    connect_retry_min_delay: float = Field(alias="CONNECT_RETRY_MIN_DELAY", default=1, gt=0)
+    connect_retry_max_delay: float = Field(alias="CONNECT_RETRY_MAX_DELAY", default=60, gt=0)
+    # Spread the topics of each topic entry across its time interval instead of publishing them together
+    tick_spread: bool = Field(alias="TICK_SPREAD", default=True)
+
+    # Messages generated while a connection is down, per connection (0 publishes straight to paho)
+    outbound_queue_size: int = Field(alias="OUTBOUND_QUEUE_SIZE", default=1000, ge=0)
+    outbound_overflow: Literal["drop-oldest", "drop-newest", "spill"] = Field(
+        alias="OUTBOUND_OVERFLOW", default="drop-oldest"
+    )
+    outbound_spool_dir: str = Field(alias="OUTBOUND_SPOOL_DIR", default="spool")
+    outbound_spool_max_bytes: int = Field(alias="OUTBOUND_SPOOL_MAX_BYTES", default=10_000_000, ge=0)
+    outbound_drain_rate: float = Field(alias="OUTBOUND_DRAIN_RATE", default=50, gt=0)
+
     # Azure IoT Hub settings
     # Single connection string (backwards compatibility)
     azure_connection_string: str | None = Field(alias="AZURE_CONNECTION_STRING", default=None)
@@ -8,6 +8,7 @@ class ClientSettings(BaseModel):
     retain: bool | None = Field(alias="RETAIN", default=None)
     qos: int | None = Field(alias="QOS", default=None)
     time_interval: int | None = Field(alias="TIME_INTERVAL", default=None)
+    message_expiry_interval: int | None = Field(alias="MESSAGE_EXPIRY_INTERVAL", default=None)
 
     def resolve_with_default(self, default: ClientSettings) -> ClientSettings:
         def resolve[T](value: T, default_value: T) -> T:
@@ -18,4 +19,5 @@ class ClientSettings(BaseModel):
             RETAIN=resolve(self.retain, default.retain),
             QOS=resolve(self.qos, default.qos),
             TIME_INTERVAL=resolve(self.time_interval, default.time_interval),
+            MESSAGE_EXPIRY_INTERVAL=resolve(self.message_expiry_interval, default.message_expiry_interval),
         )
@@ -42,6 +42,15 @@ class DataSettings(ABC, BaseModel):
         self._old_value = new_value
         return new_value
 
+    def generate_values(self, count: int) -> list[Any]:
+        """Next ``count`` values in one call, stopping early if the data becomes inactive."""
+        values: list[Any] = []
+        for _ in range(count):
+            if not self._is_active:
+                break
+            values.append(self.generate_value())
+        return values
+
     @abstractmethod
     def generate_initial_value(self) -> Any:
         pass
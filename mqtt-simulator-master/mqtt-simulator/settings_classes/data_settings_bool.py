@@ -7,5 +7,25 @@ class DataSettingsBool(DataSettings):
     def generate_initial_value(self):
         return random.choice([True, False])
 
+    def generate_values(self, count: int) -> list[bool]:
+        # same steps as generate_value, with the previous value kept in a local
+        chance = random.random
+        retain_probability, reset_probability = self.retain_probability, self.reset_probability
+        old_value = self.get_old_value()
+        values: list[bool] = []
+        for _ in range(count):
+            if old_value is None:
+                new_value = self.initial_value if self.initial_value is not None else random.choice([True, False])
+            elif chance() < retain_probability:
+                new_value = old_value
+            elif chance() < reset_probability:
+                new_value = random.choice([True, False])
+            else:
+                new_value = not old_value
+            values.append(new_value)
+            old_value = new_value
+        self._old_value = old_value
+        return values
+
     def generate_next_value(self):
         return not self.get_old_value()  # can be kept the same according to RETAIN_PROBABILITY
@@ -29,6 +29,37 @@ class DataSettingsNumber(DataSettings):
             # float number
             return random.uniform(self.min_value, self.max_value)
 
+    def generate_values(self, count: int) -> list[int | float]:
+        # same steps as generate_value, with the settings and the previous value kept in locals:
+        # pydantic private attributes are slow to access in a tight loop
+        uniform, chance = random.uniform, random.random
+        min_value, max_value, max_step, is_int = self.min_value, self.max_value, self.max_step, self.is_int
+        retain_probability, reset_probability = self.retain_probability, self.reset_probability
+        decrease_probability = 1 - self.increase_probability
+        restart_on_boundaries = self.restart_on_boundaries
+        old_value = self.get_old_value()
+        values: list[int | float] = []
+        for _ in range(count):
+            if old_value is None:
+                new_value = self.initial_value if self.initial_value is not None else self.generate_initial_value()
+            elif chance() < retain_probability:
+                new_value = old_value
+            elif chance() < reset_probability or (
+                restart_on_boundaries and (old_value == min_value or old_value == max_value)
+            ):
+                new_value = self.generate_initial_value()
+            else:
+                step = uniform(0, max_step)
+                step = round(step) if is_int else step
+                if chance() < decrease_probability:
+                    new_value = max(old_value - step, min_value)
+                else:
+                    new_value = min(old_value + step, max_value)
+            values.append(new_value)
+            old_value = new_value
+        self._old_value = old_value
+        return values
+
     def generate_next_value(self):
         if self.restart_on_boundaries and self.is_old_value_on_boundary():
             return self.generate_initial_value()
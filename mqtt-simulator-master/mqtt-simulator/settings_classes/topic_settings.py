@@ -13,6 +13,10 @@ class TopicSettings(ABC, BaseModel):
     def topic_urls(self) -> list[str]:
         pass
 
+    # the topic urls of these settings as an MQTT topic filter, used to group them in the profile
+    def topic_family(self) -> str:
+        return f"{self.prefix}/+"
+
     @model_validator(mode="before")
     @classmethod
     def validate_data(cls, data: Any) -> Any:
@@ -24,6 +28,9 @@ class TopicSingleSettings(TopicSettings):
     def topic_urls(self) -> list[str]:
         return [self.prefix]
 
+    def topic_family(self) -> str:
+        return self.prefix
+
 
 class TopicMultipleSettings(TopicSettings):
     range_start: int = Field(alias="RANGE_START")
@@ -1,11 +1,29 @@
+from outbound_queue import sum_outbound_stats
+from profiler import Profiler
 from publisher import Publisher
+from stream_log import StreamLogWriter
+from tls_context import handshake_stats
+from usage_meter import UsageMeter
 
 
 class Simulator:
-    def __init__(self, publishers: list[Publisher]):
+    def __init__(
+        self,
+        publishers: list[Publisher],
+        stream_recorder: StreamLogWriter | None = None,
+        usage_meter: UsageMeter | None = None,
+        profiler: Profiler | None = None,
+    ):
         self.publishers = publishers
+        self.stream_recorder = stream_recorder
+        self.usage_meter = usage_meter
+        self.profiler = profiler
 
     def run(self):
+        if self.usage_meter is not None:
+            self.usage_meter.start()
+        if self.profiler is not None:
+            self.profiler.start()
         for publisher in self.publishers:
             print(f"Starting: {publisher.topic_url} ...")
             publisher.start()
@@ -14,3 +32,29 @@ class Simulator:
         for publisher in self.publishers:
             print(f"Stopping: {publisher.topic_url} ...")
             publisher.stop()
+        topic_alias_bytes_saved = sum(
+            publisher.topic_alias_bytes_saved for publisher in self.publishers if isinstance(publisher, Publisher)
+        )
+        if topic_alias_bytes_saved > 0:
+            print(f"Topic aliases saved {topic_alias_bytes_saved} bytes on the wire")
+        outbound = sum_outbound_stats(
+            publisher.outbound
+            for publisher in self.publishers
+            if isinstance(publisher, Publisher) and publisher.outbound is not None
+        )
+        if outbound.queued or outbound.dropped or outbound.spilled:
+            print(
+                f"Outbound queues: {outbound.queued} messages not sent ({outbound.spool_bytes} bytes on disk), "
+                f"{outbound.dropped} dropped on overflow, {outbound.spilled} spilled to disk"
+            )
+        handshakes = handshake_stats()
+        if handshakes.count > 0:
+            print(handshakes.summary())
+        if self.stream_recorder is not None:
+            self.stream_recorder.close()
+            print(f"Recorded {self.stream_recorder.get_record_count()} messages to: {self.stream_recorder.path}")
+        if self.usage_meter is not None:
+            self.usage_meter.close()
+            print(f"Metered {self.usage_meter.get_message_count()} messages to: {self.usage_meter.path}")
+        if self.profiler is not None:
+            self.profiler.close()
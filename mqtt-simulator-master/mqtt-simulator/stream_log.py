@@ -0,0 +1,159 @@
+"""
+Stream Log
+
+Append-only capture of published messages, used to record a simulation run and
+replay the exact same message sequence later.
+
+A stream log is made of two files:
+- the data file (``<path>``): a magic header followed by fixed-size record
+  headers (timestamp, topic id, payload length, flags) and the raw payload bytes
+- the index file (``<path>.idx``): JSON lines with the topic table and a sparse
+  time index (timestamp -> data file offset) used to seek without a full scan
+"""
+
+import bisect
+import json
+import mmap
+import struct
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import NamedTuple
+
+MAGIC = b"MQSIMLOG1\n"
+RECORD_HEADER = struct.Struct("<dIIB")
+RETAIN_FLAG = 0b100
+QOS_MASK = 0b011
+
+
+def index_path(path: Path) -> Path:
+    return path.with_name(path.name + ".idx")
+
+
+class StreamLogRecord(NamedTuple):
+    timestamp: float
+    topic: str
+    payload: bytes
+    qos: int
+    retain: bool
+
+
+class StreamLogWriter:
+    def __init__(self, path: Path, index_interval: float = 1.0):
+        self.path = path
+        self.index_interval = index_interval
+        self._lock = threading.Lock()
+        self._topic_ids: dict[str, int] = {}
+        self._next_index_timestamp = 0.0
+        self._record_count = 0
+        self._is_closed = False
+
+        is_new = not path.exists() or path.stat().st_size == 0
+        self._data_file = open(path, "ab")
+        self._index_file = open(index_path(path), "a", encoding="utf-8")
+        if is_new:
+            self._data_file.write(MAGIC)
+        else:
+            # keep appending to an existing capture with its topic table
+            self._topic_ids = {topic: topic_id for topic_id, topic in StreamLogReader.read_topics(path).items()}
+        self._offset = self._data_file.tell()
+
+    def append(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False) -> None:
+        with self._lock:
+            if self._is_closed:
+                # a publisher thread can still be finishing its last tick while the simulator stops
+                return
+            timestamp = time.time()
+            topic_id = self._topic_ids.get(topic)
+            if topic_id is None:
+                topic_id = len(self._topic_ids)
+                self._topic_ids[topic] = topic_id
+                self._write_index_entry({"topic_id": topic_id, "topic": topic})
+            if timestamp >= self._next_index_timestamp:
+                # flush first so that an indexed offset always points to data on disk
+                self._data_file.flush()
+                self._write_index_entry({"timestamp": timestamp, "offset": self._offset})
+                self._next_index_timestamp = timestamp + self.index_interval
+            flags = (qos & QOS_MASK) | (RETAIN_FLAG if retain else 0)
+            self._data_file.write(RECORD_HEADER.pack(timestamp, topic_id, len(payload), flags))
+            self._data_file.write(payload)
+            self._offset += RECORD_HEADER.size + len(payload)
+            self._record_count += 1
+
+    def get_record_count(self) -> int:
+        return self._record_count
+
+    def close(self) -> None:
+        with self._lock:
+            self._is_closed = True
+            self._data_file.close()
+            self._index_file.close()
+
+    def _write_index_entry(self, entry: dict) -> None:
+        self._index_file.write(json.dumps(entry) + "\n")
+        self._index_file.flush()
+
+
+class StreamLogReader:
+    def __init__(self, path: Path):
+        self.path = path
+        self._topics = self.read_topics(path)
+        self._index_timestamps: list[float] = []
+        self._index_offsets: list[int] = []
+        for entry in self._read_index_entries(path):
+            if "timestamp" in entry:
+                self._index_timestamps.append(entry["timestamp"])
+                self._index_offsets.append(entry["offset"])
+
+        self._data_file = open(path, "rb")
+        self._mmap = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' is not a stream log file")
+
+    @staticmethod
+    def _read_index_entries(path: Path) -> Iterator[dict]:
+        with open(index_path(path), encoding="utf-8") as index_file:
+            for line in index_file:
+                if line.strip():
+                    yield json.loads(line)
+
+    @classmethod
+    def read_topics(cls, path: Path) -> dict[int, str]:
+        return {
+            entry["topic_id"]: entry["topic"] for entry in cls._read_index_entries(path) if "topic_id" in entry
+        }
+
+    def seek_offset(self, seconds: float) -> int:
+        """Data file offset of the first record at or after ``seconds`` from the start of the capture."""
+        if not self._index_timestamps:
+            return len(MAGIC)
+        target = self._index_timestamps[0] + seconds
+        position = bisect.bisect_right(self._index_timestamps, target) - 1
+        return self._index_offsets[max(position, 0)]
+
+    def records(self, seek_seconds: float = 0.0) -> Iterator[StreamLogRecord]:
+        offset = self.seek_offset(seek_seconds) if seek_seconds > 0 else len(MAGIC)
+        target = self._index_timestamps[0] + seek_seconds if self._index_timestamps else None
+        size = len(self._mmap)
+        while offset + RECORD_HEADER.size <= size:
+            timestamp, topic_id, payload_length, flags = RECORD_HEADER.unpack_from(self._mmap, offset)
+            payload_start = offset + RECORD_HEADER.size
+            offset = payload_start + payload_length
+            if offset > size:
+                # truncated record at the tail of an interrupted capture
+                break
+            if target is not None and timestamp < target:
+                continue
+            yield StreamLogRecord(
+                timestamp=timestamp,
+                topic=self._topics[topic_id],
+                payload=self._mmap[payload_start:offset],
+                qos=flags & QOS_MASK,
+                retain=bool(flags & RETAIN_FLAG),
+            )
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._data_file.close()
@@ -0,0 +1,114 @@
+"""
+TLS Context
+
+One ssl.SSLContext per set of TLS settings, shared by every client instead of
+a client.tls_set per topic. tls_set reads and parses the CA, certificate and
+key files again for each connection, which makes the startup of a simulator
+with thousands of TLS topics CPU bound.
+
+The shared context also resumes TLS sessions: every connection offers the
+session of the last completed handshake, so reconnects (and the connections
+after the first one) skip the certificate exchange and the key agreement when
+the broker accepts it. A session the broker doesn't accept just falls back to
+a full handshake.
+
+The handshakes of every context are counted and timed, full and resumed
+separately, for the summary printed when the simulator stops.
+"""
+
+import functools
+import ssl
+import threading
+import time
+from typing import NamedTuple
+
+from settings_classes import BrokerSettings
+
+
+class HandshakeStats(NamedTuple):
+    count: int
+    resumed: int
+    total_ns: int
+    maximum_ns: int
+
+    def summary(self) -> str:
+        mean_ms = self.total_ns / self.count / 1e6 if self.count else 0.0
+        return (
+            f"TLS handshakes: {self.count} ({self.resumed} resumed), "
+            f"mean {mean_ms:.1f} ms, max {self.maximum_ns / 1e6:.1f} ms"
+        )
+
+
+class TimedSSLSocket(ssl.SSLSocket):
+    def do_handshake(self, block: bool = False) -> None:
+        started = time.perf_counter_ns()
+        super().do_handshake(block)
+        self.context.record_handshake(self, time.perf_counter_ns() - started)
+
+
+class SharedSSLContext(ssl.SSLContext):
+    sslsocket_class = TimedSSLSocket
+
+    def __init__(self, protocol: int):
+        self.session: ssl.SSLSession | None = None
+        self._lock = threading.Lock()
+        self._count = 0
+        self._resumed = 0
+        self._total_ns = 0
+        self._maximum_ns = 0
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        # paho doesn't pass a session: offer the last one to resume it
+        if kwargs.get("session") is None:
+            kwargs["session"] = self.session
+        return super().wrap_socket(sock, *args, **kwargs)
+
+    def record_handshake(self, ssl_socket: ssl.SSLSocket, elapsed_ns: int) -> None:
+        with self._lock:
+            self._count += 1
+            self._resumed += ssl_socket.session_reused
+            self._total_ns += elapsed_ns
+            self._maximum_ns = max(self._maximum_ns, elapsed_ns)
+            if ssl_socket.session is not None:
+                self.session = ssl_socket.session
+
+    def handshake_stats(self) -> HandshakeStats:
+        with self._lock:
+            return HandshakeStats(self._count, self._resumed, self._total_ns, self._maximum_ns)
+
+
+_contexts: list[SharedSSLContext] = []
+
+
+@functools.cache
+def _create_ssl_context(ca_path: str | None, cert_path: str | None, key_path: str | None) -> SharedSSLContext:
+    # same as the tls_set the clients used: TLS 1.2 with the broker certificate verified
+    context = SharedSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.maximum_version = ssl.TLSVersion.TLSv1_2
+    if cert_path is not None:
+        context.load_cert_chain(cert_path, key_path)
+    if ca_path is not None:
+        context.load_verify_locations(ca_path)
+    else:
+        context.load_default_certs()
+    _contexts.append(context)
+    return context
+
+
+def shared_ssl_context(broker_settings: BrokerSettings) -> SharedSSLContext:
+    """The context of the TLS settings of broker_settings, created by the first client that needs it."""
+    return _create_ssl_context(
+        broker_settings.tls_ca_path, broker_settings.tls_cert_path, broker_settings.tls_key_path
+    )
+
+
+def handshake_stats() -> HandshakeStats:
+    count = resumed = total_ns = maximum_ns = 0
+    for context in list(_contexts):
+        stats = context.handshake_stats()
+        count += stats.count
+        resumed += stats.resumed
+        total_ns += stats.total_ns
+        maximum_ns = max(maximum_ns, stats.maximum_ns)
+    return HandshakeStats(count, resumed, total_ns, maximum_ns)
@@ -0,0 +1,89 @@
+"""
+Usage Meter
+
+Per-topic message and byte counters for usage-based billing, flushed
+periodically to an append-only file of JSON lines, one line per flush with the
+counts since the previous flush:
+
+    {"start": 1700000000.0, "end": 1700000010.0, "topics": {"place/roof": [5, 310]}}
+
+Each topic counter is only incremented by the thread publishing that topic, so
+the publish hot path is two integer additions with no lock; the flush thread
+reads the totals and writes the difference to the last flushed values.
+"""
+
+import json
+import threading
+import time
+from pathlib import Path
+
+
+class TopicUsage:
+    __slots__ = ("messages", "bytes")
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def add(self, payload_size: int) -> None:
+        self.messages += 1
+        self.bytes += payload_size
+
+
+class UsageMeter:
+    def __init__(self, path: Path, flush_interval: float = 10.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters: dict[str, TopicUsage] = {}
+        self._flushed: dict[str, tuple[int, int]] = {}
+        self._last_flush = time.time()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._is_closed = False
+        self._file = open(path, "a", encoding="utf-8")
+
+    def counter(self, topic: str) -> TopicUsage:
+        """Counter for a topic, shared by every publisher of that topic in this process."""
+        with self._lock:
+            usage = self._counters.get(topic)
+            if usage is None:
+                usage = self._counters[topic] = TopicUsage()
+            return usage
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._flush_periodically, daemon=True, name="usage-meter")
+        self._thread.start()
+
+    def _flush_periodically(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._is_closed:
+                return
+            now = time.time()
+            topics: dict[str, list[int]] = {}
+            for topic, usage in self._counters.items():
+                totals = (usage.messages, usage.bytes)
+                flushed_messages, flushed_bytes = self._flushed.get(topic, (0, 0))
+                if totals[0] != flushed_messages:
+                    topics[topic] = [totals[0] - flushed_messages, totals[1] - flushed_bytes]
+                    self._flushed[topic] = totals
+            if topics:
+                entry = {"start": self._last_flush, "end": now, "topics": topics}
+                self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                self._file.flush()
+            self._last_flush = now
+
+    def get_message_count(self) -> int:
+        with self._lock:
+            return sum(usage.messages for usage in self._counters.values())
+
+    def close(self) -> None:
+        self._stop_event.set()
+        self.flush()
+        with self._lock:
+            self._is_closed = True
+            self._file.close()
@@ -0,0 +1,50 @@
+import bisect
+import hashlib
+
+
+class ConsistentHashRing:
+    def __init__(self, virtual_nodes: int = 160):
+        # several points per node on the ring keep the shares balanced with few nodes
+        self.virtual_nodes = virtual_nodes
+        self._ring_hashes: list[int] = []
+        self._ring_nodes: list[str] = []
+        self._nodes: set[str] = set()
+
+    @staticmethod
+    def hash_key(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def get_nodes(self) -> set[str]:
+        return set(self._nodes)
+
+    def add_node(self, node: str) -> None:
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.virtual_nodes):
+            point = self.hash_key(f"{node}#{i}")
+            position = bisect.bisect(self._ring_hashes, point)
+            self._ring_hashes.insert(position, point)
+            self._ring_nodes.insert(position, node)
+
+    def remove_node(self, node: str) -> None:
+        if node not in self._nodes:
+            return
+        self._nodes.remove(node)
+        kept = [(point, ring_node) for point, ring_node in zip(self._ring_hashes, self._ring_nodes) if ring_node != node]
+        self._ring_hashes = [point for point, _ in kept]
+        self._ring_nodes = [ring_node for _, ring_node in kept]
+
+    def get_node(self, key: str) -> str | None:
+        if not self._ring_hashes:
+            return None
+        position = bisect.bisect(self._ring_hashes, self.hash_key(key)) % len(self._ring_hashes)
+        return self._ring_nodes[position]
+
+    def assign(self, keys: list[str]) -> dict[str, list[str]]:
+        assignment: dict[str, list[str]] = {node: [] for node in self._nodes}
+        for key in keys:
+            node = self.get_node(key)
+            if node is not None:
+                assignment[node].append(key)
+        return assignment
@@ -4,10 +4,50 @@ from typing import Any
 
 from publisher import Publisher
 from azure_publisher import AzurePublisher
+from connection_ramp import ConnectionRamp, tick_phases
+from profiler import Profiler
 from settings_classes import BrokerSettings, ClientSettings, DataSettings, DataSettingsFactory, TopicSettingsFactory
+from stream_log import StreamLogWriter
+from usage_meter import UsageMeter
 
 
-def read_publishers(settings_file: Path, is_verbose: bool) -> list[Publisher]:
+def read_settings_file(settings_file: Path) -> dict[str, Any]:
+    with open(settings_file, encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+def read_broker_settings(settings_file: Path) -> BrokerSettings:
+    return BrokerSettings.model_validate(read_settings_file(settings_file))
+
+
+def read_topic_urls(json_object: dict[str, Any]) -> list[str]:
+    BrokerSettings.model_validate(json_object)
+    topic_urls: list[str] = []
+    for topic_object in json_object.get("TOPICS"):
+        topic_urls.extend(TopicSettingsFactory.create(topic_object).topic_urls())
+    return topic_urls
+
+
+def read_publishers(
+    settings_file: Path,
+    is_verbose: bool,
+    stream_recorder: StreamLogWriter | None = None,
+    usage_meter: UsageMeter | None = None,
+    profiler: Profiler | None = None,
+) -> list[Publisher]:
+    return read_publishers_from_json(
+        read_settings_file(settings_file), is_verbose, stream_recorder, usage_meter=usage_meter, profiler=profiler
+    )
+
+
+def read_publishers_from_json(
+    json_object: dict[str, Any],
+    is_verbose: bool,
+    stream_recorder: StreamLogWriter | None = None,
+    topic_filter: set[str] | None = None,
+    usage_meter: UsageMeter | None = None,
+    profiler: Profiler | None = None,
+) -> list[Publisher]:
     def load_topic_data(topic_data_object: list[dict[str, Any]]) -> list[DataSettings]:
         topic_data: list[DataSettings] = []
         for data_object in topic_data_object:
@@ -17,8 +57,6 @@ def read_publishers(settings_file: Path, is_verbose: bool) -> list[Publisher]:
 
     publishers: list[Publisher] = []
     default_client_settings = ClientSettings(CLEAN_SESSION=True, RETAIN=False, QOS=2, TIME_INTERVAL=10)
-    with open(settings_file, encoding="utf-8") as json_file:
-        json_object = json.load(json_file)
     broker_settings = BrokerSettings.model_validate(json_object)
     broker_client_settings = ClientSettings.model_validate(json_object).resolve_with_default(
         default=default_client_settings
@@ -36,6 +74,9 @@ def read_publishers(settings_file: Path, is_verbose: bool) -> list[Publisher]:
     else:
         print(f"Using MQTT publisher (broker: {broker_settings.url}:{broker_settings.port})")
 
+    # shared by every publisher, so the connections of all the topics are spaced
+    connection_ramp = ConnectionRamp(broker_settings.connect_rate)
+
     # read each configured topic
     for topic_object in json_object.get("TOPICS"):
         client_settings = ClientSettings.model_validate(topic_object).resolve_with_default(
@@ -43,7 +84,12 @@ def read_publishers(settings_file: Path, is_verbose: bool) -> list[Publisher]:
         )
         topic_settings = TopicSettingsFactory.create(topic_object)
         topic_data_object = topic_object.get("DATA")
-        for topic_url in topic_settings.topic_urls():
+        topic_urls = topic_settings.topic_urls()
+        # computed over every topic_url of the entry, so a worker with only some of them keeps the same phases
+        phases = tick_phases(topic_settings.prefix, len(topic_urls), client_settings.time_interval)
+        for topic_url, phase in zip(topic_urls, phases):
+            if topic_filter is not None and topic_url not in topic_filter:
+                continue
             # each topic_url should have different data_settings instances
             topic_data = load_topic_data(topic_data_object)
             publishers.append(
@@ -54,6 +100,11 @@ def read_publishers(settings_file: Path, is_verbose: bool) -> list[Publisher]:
                     topic_settings.payload_root,
                     client_settings,
                     is_verbose,
+                    stream_recorder=stream_recorder,
+                    usage_meter=usage_meter,
+                    profile=profiler.topic_profile(topic_settings.topic_family()) if profiler is not None else None,
+                    connection_ramp=connection_ramp,
+                    tick_phase=phase if broker_settings.tick_spread else None,
                 )
             )
     return publishers
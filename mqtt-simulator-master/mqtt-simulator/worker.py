@@ -0,0 +1,164 @@
+import os
+import socket
+import threading
+import time
+from typing import Any
+
+from connection_ramp import retry_delay
+from outbound_queue import OutboundStats, sum_outbound_stats
+from profiler import Profiler
+from publisher import Publisher
+from pydantic import ValidationError as PydanticValidationError
+from stream_log import StreamLogWriter
+from usage_meter import UsageMeter
+from utils.cluster_messages import ClusterConnection
+from utils.exceptions.simulator_validation_error import SimulatorValidationError
+from utils.print_validation_error import print_validation_error
+from utils.read_publishers import read_publishers_from_json
+
+METRICS_INTERVAL = 5
+# seconds between attempts to reach the coordinator, backing off with jitter up to the maximum
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+
+
+class Worker(threading.Thread):
+    def __init__(
+        self,
+        address: tuple[str, int],
+        is_verbose: bool,
+        stream_recorder: StreamLogWriter | None = None,
+        usage_meter: UsageMeter | None = None,
+        profiler: Profiler | None = None,
+    ):
+        threading.Thread.__init__(self)
+
+        self.address = address
+        self.is_verbose = is_verbose
+        self.stream_recorder = stream_recorder
+        self.usage_meter = usage_meter
+        self.profiler = profiler
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        # shown by the Simulator in place of a topic
+        self.topic_url = f"worker {self.worker_id} of {address[0]}:{address[1]}"
+
+        self.loop = False
+        self.settings: dict[str, Any] | None = None
+        self.publishers: dict[str, Publisher] = {}
+        self.connection: ClusterConnection | None = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._retired_published_count = 0
+
+    def run(self):
+        self.loop = True
+        threading.Thread(target=self.report_metrics, daemon=True).start()
+        attempt = 0
+        while self.loop:
+            try:
+                connection = ClusterConnection(socket.create_connection(self.address))
+            except OSError as e:
+                delay = retry_delay(attempt, RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY)
+                attempt += 1
+                print(
+                    f"[{time.strftime('%H:%M:%S')}] Coordinator connection failed: {e}, retrying in {delay:.1f}s"
+                )
+                if self._stop_event.wait(delay):
+                    break
+                continue
+            attempt = 0
+            self.connection = connection
+            # stop may have run while connecting, before there was a connection to close
+            if not self.loop:
+                connection.close()
+                break
+            self.serve(connection)
+            if self.loop:
+                print(f"[{time.strftime('%H:%M:%S')}] Coordinator connection lost, reconnecting")
+        self.loop = False
+        self._stop_event.set()
+
+    def serve(self, connection: ClusterConnection):
+        try:
+            connection.send({"type": "hello", "worker_id": self.worker_id})
+            while self.loop and (message := connection.receive()) is not None:
+                if message.get("type") == "settings":
+                    self.settings = message["settings"]
+                elif message.get("type") == "assign":
+                    self.remove_topics(message["remove"])
+                    self.add_topics(message["add"])
+        except (OSError, ValueError) as e:
+            if self.loop:
+                print(f"Coordinator connection error: {e}")
+        finally:
+            # the coordinator moves the topics of a lost worker to the others, and assigns them again on the next hello
+            self.remove_topics(list(self.publishers))
+            connection.close()
+
+    def stop(self):
+        self.loop = False
+        self._stop_event.set()
+        if self.connection is not None:
+            self.connection.close()
+
+    def add_topics(self, topic_urls: list[str]):
+        if not topic_urls or self.settings is None:
+            return
+        try:
+            publishers = read_publishers_from_json(
+                self.settings,
+                self.is_verbose,
+                self.stream_recorder,
+                topic_filter=set(topic_urls),
+                usage_meter=self.usage_meter,
+                profiler=self.profiler,
+            )
+        except (PydanticValidationError, SimulatorValidationError) as e:
+            print_validation_error(e)
+            return
+        with self._lock:
+            for publisher in publishers:
+                self.publishers[publisher.topic_url] = publisher
+        for publisher in publishers:
+            publisher.start()
+        print(f"Worker {self.worker_id}: started {len(publishers)} topics")
+
+    def remove_topics(self, topic_urls: list[str]):
+        for topic_url in topic_urls:
+            with self._lock:
+                publisher = self.publishers.pop(topic_url, None)
+            if publisher is None:
+                continue
+            publisher.stop()
+            self._retired_published_count += publisher.published_count
+        if topic_urls:
+            print(f"Worker {self.worker_id}: stopped {len(topic_urls)} topics")
+
+    def get_published_count(self) -> int:
+        with self._lock:
+            publishers = list(self.publishers.values())
+        return self._retired_published_count + sum(publisher.published_count for publisher in publishers)
+
+    def get_outbound_stats(self) -> OutboundStats:
+        with self._lock:
+            publishers = list(self.publishers.values())
+        return sum_outbound_stats(publisher.outbound for publisher in publishers if publisher.outbound is not None)
+
+    def report_metrics(self):
+        while not self._stop_event.wait(METRICS_INTERVAL):
+            if self.connection is None:
+                continue
+            outbound = self.get_outbound_stats()
+            try:
+                self.connection.send(
+                    {
+                        "type": "metrics",
+                        "topics": len(self.publishers),
+                        "published": self.get_published_count(),
+                        "queued": outbound.queued,
+                        "spool_bytes": outbound.spool_bytes,
+                    }
+                )
+            except OSError:
+                # the connection is down: run reconnects and the next report goes to the new one
+                continue
@@ -1,8 +1,7 @@
 import config from './config/read_config.js';
-import { getAllRegistosEstacoes,getRegistoEstacoesByDateRange,getRegistoEstacoesByIdEstacao } from './service/read_db.js';
-import { RegistoEstacao, RegistoEstacaoDB } from '../src/models/registo_estacoes.js';
-import { convertRegistoEstacaoDBToRegistoEstacao } from './utils/process_data.js';
-import { calcularProducaoTotal } from './utils/calculate_data.js';
+import { getAgregadosEstacao } from './service/read_db.js';
+import { AgregadoJanelaDB } from './models/agregados_janela.js';
+import { calcularProducaoTotalAgregados } from './utils/calculate_data.js';
 import { emailTemplateProducaoTotal } from './utils/template_emails.js';
 import { enviarEmail } from './service/send_email.js';
 
@@ -14,26 +13,18 @@ let estacao = 2;
 console.log("Email configuration loaded:", config);
 
 
-// le dados do sqlite db
-console.log("Reading data from database...");
-const registos : RegistoEstacaoDB[]  = getAllRegistosEstacoes(100); 
+// le os agregados do ultimo dia fechado (ingest.py --aggregate), em vez dos registos todos
+console.log("Reading aggregates from database...");
+const agregados : AgregadoJanelaDB[] = getAgregadosEstacao("1d", estacao, "producao", 1);
 
-console.log("Records read from database:", registos.length);
+console.log("Aggregates read from database:", agregados.length);
+if (agregados.length > 0) {
+  console.log("Janela:", agregados[0].Inicio, "-", agregados[0].Fim, "com", agregados[0].Contagem, "registos");
+}
 
-//Trata os dados lidos para o formato correto
-const registosTratados: RegistoEstacao[] = registos.map(registoDB => {
-  return convertRegistoEstacaoDBToRegistoEstacao(registoDB);
-});
 
-// Filtra os registos para a estacao 3
-const registoEstacao3 : RegistoEstacao[]  = registosTratados.filter(registo => registo.Id_Estacao === estacao);
-console.log("Filtered and processed records count:", registoEstacao3.length);
-//Mostrar os dados tratados
-//console.log("Registos tratados:", registoEstacao3);
-
-
-// Fazer o calculo com os dados lidos
-const producaoTotal = calcularProducaoTotal(registoEstacao3);
+// Fazer o calculo com os agregados lidos
+const producaoTotal = calcularProducaoTotalAgregados(agregados);
 
 console.log(`Producao total calculada da estacao ${estacao}:`, producaoTotal);
 
@@ -0,0 +1,14 @@
+//agregados por janela escritos pelo ingest.py do simulador (--aggregate)
+export interface AgregadoJanelaDB {
+  Janela: string;
+  Id_Estacao: number;
+  Campo: string;
+  Inicio: Date;
+  Fim: Date | null;
+  Contagem: number;
+  Soma: number;
+  Minimo: number;
+  Maximo: number;
+  Media: number;
+  Completo: boolean;
+}
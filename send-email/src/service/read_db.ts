@@ -2,6 +2,7 @@ import Database from "better-sqlite3";
 import path from "path";
 import { DB_PATH } from "../constants/paths";
 import { RegistoEstacao,RegistoEstacaoDB } from "../models/registo_estacoes.js";
+import { AgregadoJanelaDB } from "../models/agregados_janela.js";
 
 //Aqui so vai ter chamadas a base de dados
 
@@ -71,4 +72,31 @@ export function getRegistoEstacoesByDateRange(startDate: Date, endDate: Date, li
     Defeitos: row.Defeitos,
     Timestamp: new Date(row.Timestamp),
   }));
-};      
\ No newline at end of file
+};
+
+
+
+// Agregados ja calculados pelo ingest.py (tabela window_aggregates), sem ler os registos todos
+// So devolve janelas fechadas (complete = 1), as abertas ainda vao mudar
+// janela: "1h", "1d", "15m/1m", ... | campo: "producao", "stock", "paragem", "defeitos"
+export function getAgregadosEstacao(janela: string, idEstacao: number, campo: string, limit: number = 100): AgregadoJanelaDB[] {
+  const stmt = db.prepare(
+    "SELECT * FROM window_aggregates WHERE window = ? AND station = ? AND field = ? AND complete = 1 ORDER BY window_start DESC LIMIT ?"
+  );
+
+  const rows = stmt.all(janela, String(idEstacao), campo, limit);
+
+  return rows.map((row: any) : AgregadoJanelaDB => ({
+    Janela: row.window,
+    Id_Estacao: parseInt(row.station),
+    Campo: row.field,
+    Inicio: new Date(row.window_start),
+    Fim: row.window_end ? new Date(row.window_end) : null,
+    Contagem: row.count,
+    Soma: row.sum,
+    Minimo: row.min,
+    Maximo: row.max,
+    Media: row.mean,
+    Completo: row.complete === 1,
+  }));
+}
@@ -1,6 +1,7 @@
 
 
 import { RegistoEstacao } from "../models/registo_estacoes.js";
+import { AgregadoJanelaDB } from "../models/agregados_janela.js";
 import { roundUp } from "./round_numbers.js";
 
 
@@ -11,3 +12,10 @@ export function calcularProducaoTotal(registos: RegistoEstacao[]): number {
   const producaoTotal = registos.reduce((acc, registo) => acc + registo.Producao, 0);
   return roundUp(producaoTotal, 0);
 }
+
+
+//calcular producao total a partir das somas das janelas ja agregadas
+export function calcularProducaoTotalAgregados(agregados: AgregadoJanelaDB[]): number {
+  const producaoTotal = agregados.reduce((acc, agregado) => acc + agregado.Soma, 0);
+  return roundUp(producaoTotal, 0);
+}